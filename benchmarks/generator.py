@@ -0,0 +1,86 @@
+"""
+Deterministic generator of synthetic contacts and notes books.
+Same size and seed always give the same books.
+"""
+import random
+from datetime import date, timedelta
+
+from nestor.models.contacts_book import Birthday, Contact, ContactsBook
+from nestor.models.notes_book import Note, NotesBook
+
+FIRST_NAMES = [
+    "Olena", "Oleksandr", "Andrii", "Iryna", "Vitalii", "Yehor", "Mariia", "Dmytro", "Natalia", "Serhii",
+    "Anna", "Taras", "Oksana", "Mykola", "Sofiia", "Bohdan", "Kateryna", "Ivan", "Yuliia", "Pavlo",
+    "John", "Jon", "Mary", "James", "Emma", "Michael", "Olivia", "David", "Sophia", "Daniel",
+]
+LAST_NAMES = [
+    "Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Melnyk", "Boyko", "Koval",
+    "Oliinyk", "Lysenko", "Moroz", "Marchenko", "Savchenko", "Rudenko", "Petrenko", "Solianyk",
+    "Smith", "Smyth", "Johnson", "Brown", "Williams", "Miller", "Davis", "Wilson", "Taylor", "Doe",
+]
+STREETS = ["Khreshchatyk", "Shevchenka", "Franka", "Main", "Oak", "Lesi Ukrainky", "Sadova", "Park", "High", "Mira"]
+# city, state, country
+PLACES = [
+    ("Kyiv", "Kyiv", "Ukraine"),
+    ("Lviv", "Lviv", "Ukraine"),
+    ("Kharkiv", "Kharkiv", "Ukraine"),
+    ("Odesa", "Odesa", "Ukraine"),
+    ("Dnipro", "Dnipro", "Ukraine"),
+    ("Warsaw", "Masovia", "Poland"),
+    ("Berlin", "Berlin", "Germany"),
+    ("Austin", "Texas", "USA"),
+    ("Boston", "Massachusetts", "USA"),
+    ("Toronto", "Ontario", "Canada"),
+]
+EMAIL_DOMAINS = ["gmail.com", "ukr.net", "example.com", "outlook.com", "i.ua"]
+PHONE_PREFIXES = ["050", "063", "066", "067", "068", "073", "093", "095", "096", "097"]
+WORDS = [
+    "meeting", "budget", "recipe", "pie", "travel", "plan", "call", "review", "book", "idea",
+    "project", "release", "birthday", "gift", "list", "shopping", "doctor", "car", "repair", "notes",
+]
+TAGS = ["work", "home", "family", "food", "recipe", "travel", "urgent", "ideas", "health", "finance"]
+
+def generate_contacts(size: int, seed: int = 42) -> ContactsBook:
+    """ Returns contacts book with given number of contacts """
+    rnd = random.Random(seed)
+    book = ContactsBook()
+    first_birthday = date(1950, 1, 1)
+
+    while len(book.data) < size:
+        index = len(book.data)
+        first = rnd.choice(FIRST_NAMES)
+        last = rnd.choice(LAST_NAMES)
+        # most combinations repeat in big books, a number keeps names unique like in real address books
+        name = f"{first} {last}" if index < len(FIRST_NAMES) * len(LAST_NAMES) else f"{first} {last} {index}"
+        if name in book.data:
+            name = f"{first} {last} {index}"
+
+        phones = [rnd.choice(PHONE_PREFIXES) + f"{rnd.randrange(10 ** 7):07d}" for _ in range(rnd.choice([0, 1, 1, 1, 2]))]
+        birthday = None
+        if rnd.random() < 0.8:
+            birthday = (first_birthday + timedelta(days=rnd.randrange(365 * 55))).strftime(Birthday.format)
+        email = None
+        if rnd.random() < 0.7:
+            email = f"{first.lower()}.{last.lower()}{index}@{rnd.choice(EMAIL_DOMAINS)}"
+
+        contact = Contact(name, phones, email=email, birthday=birthday)
+        if rnd.random() < 0.6:
+            city, state, country = rnd.choice(PLACES)
+            contact.add_address(f"{rnd.randrange(1, 200)} {rnd.choice(STREETS)}", city, state, f"{rnd.randrange(10000, 99999)}", country)
+        book.add(contact)
+
+    return book
+
+def generate_notes(size: int, seed: int = 42) -> NotesBook:
+    """ Returns notes book with given number of notes """
+    rnd = random.Random(seed)
+    book = NotesBook()
+
+    while len(book.data) < size:
+        index = len(book.data)
+        title = f"{rnd.choice(WORDS)} {index}"
+        content = " ".join(rnd.choice(WORDS) for _ in range(rnd.randrange(3, 25)))
+        tags = rnd.sample(TAGS, rnd.randrange(0, 4))
+        book.add(Note(title, content, tags))
+
+    return book
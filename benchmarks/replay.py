@@ -0,0 +1,91 @@
+"""
+Replays command trace recorded with 'nestor --record-trace FILE' against headless handlers.
+
+Threads share one storage, like 'nestor serve': reads run concurrently, writes are serialized.
+Processes get their own copy of storage each.
+
+Example:
+    python benchmarks/replay.py trace.jsonl --size 100000 --workers 4 --repeat 100
+    python benchmarks/replay.py trace.jsonl --data data --workers 4 --mode process
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from nestor.services.executor import CommandExecutor
+from nestor.services.serializer import Serializer, Storage
+from nestor.services.trace import read_trace
+from nestor.utils.percentile import percentile
+
+from generator import generate_contacts, generate_notes
+
+def load_storage(data: str | None, size: int) -> Storage:
+    """ Returns storage loaded from data file or generated synthetic storage """
+    if data:
+        return Serializer(data).load_data()
+    storage = Storage()
+    storage.contacts_book = generate_contacts(size)
+    storage.notes_book = generate_notes(size)
+    return storage
+
+def replay(executor: CommandExecutor, trace: list[dict], repeat: int) -> dict[str, list[float]]:
+    """ Runs trace given number of times, returns latencies in seconds per command """
+    latencies = defaultdict(list)
+    for _ in range(repeat):
+        for entry in trace:
+            started = time.perf_counter()
+            executor.execute(entry["command"], entry.get("args"), entry.get("inputs"))
+            latencies[entry["command"]].append(time.perf_counter() - started)
+    return latencies
+
+def replay_in_process(data: str | None, size: int, trace: list[dict], repeat: int) -> dict[str, list[float]]:
+    """ Runs replay in worker process with its own storage """
+    return dict(replay(CommandExecutor(load_storage(data, size)), trace, repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay nestor command trace and report latency.")
+    parser.add_argument("trace", help="trace file recorded with 'nestor --record-trace FILE'")
+    parser.add_argument("--data", help="data file name without .pkl extension, synthetic books are generated if omitted")
+    parser.add_argument("--size", type=int, default=10000, help="size of synthetic books")
+    parser.add_argument("--workers", type=int, default=1, help="number of concurrent workers")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread", help="run workers in threads or processes")
+    parser.add_argument("--repeat", type=int, default=1, help="how many times each worker replays the trace")
+    arguments = parser.parse_args()
+
+    trace = read_trace(arguments.trace)
+    if not trace:
+        print("Trace is empty.")
+        sys.exit(1)
+
+    if arguments.mode == "thread":
+        executor = CommandExecutor(load_storage(arguments.data, arguments.size))
+        pool = ThreadPoolExecutor(arguments.workers)
+        started = time.perf_counter()
+        futures = [pool.submit(replay, executor, trace, arguments.repeat) for _ in range(arguments.workers)]
+    else:
+        pool = ProcessPoolExecutor(arguments.workers)
+        # process start and storage loading is not measured, only the replay itself is
+        started = time.perf_counter()
+        futures = [
+            pool.submit(replay_in_process, arguments.data, arguments.size, trace, arguments.repeat)
+            for _ in range(arguments.workers)
+        ]
+
+    latencies = defaultdict(list)
+    for future in futures:
+        for command, values in future.result().items():
+            latencies[command].extend(values)
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{'command':<20} {'count':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for command, values in sorted(latencies.items()):
+        values.sort()
+        print(f"{command:<20} {len(values):>8} " + " ".join(f"{percentile(values, p) * 1000:>10.3f}" for p in (50, 95, 99)))
+    print(f"{total} commands in {elapsed:.2f}s, throughput {total / elapsed:.1f} commands/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmarks of storage, search and rendering on synthetic books.
+
+Example:
+    python benchmarks/run.py --sizes 1000,100000 --output results.json
+    python benchmarks/run.py --sizes 1000,100000 --compare results.json --threshold 0.2
+Comparison exits with code 1 if a scenario got slower than threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable
+
+from nestor.services.indexes import ContactIndexes
+from nestor.services.merge import diff_files
+from nestor.services.query import run_query
+from nestor.services.results import Records, json_objects
+from nestor.services.scan import scan
+from nestor.services.sorted_views import select_page
+from nestor.services.serializer import Serializer, Storage
+from nestor.utils.csv_as_table import csv_as_table
+from nestor.utils.duplicates import find_duplicates
+from nestor.utils.similar_strings import similar_strings
+from nestor.utils.to_csv import to_csv
+
+from generator import generate_contacts, generate_notes
+
+def measure(func: Callable, repeat: int) -> dict:
+    """ Runs function given number of times, returns min and median time in seconds """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+def get_scenarios(storage: Storage, directory: str) -> dict[str, Callable]:
+    """ Returns scenarios for given storage """
+    contacts = storage.contacts_book
+    notes = storage.notes_book
+    names = list(contacts.data.keys())
+    with_address = [name for name, contact in contacts.data.items() if contact.address]
+    serializer = Serializer(os.path.join(directory, "data"))
+    serializer.save_data(storage)
+
+    return {
+        "serializer.save_data": lambda: serializer.save_data(storage),
+        "serializer.load_data": serializer.load_data,
+        "serializer.diff_files": lambda: list(diff_files(serializer.filename, serializer.filename)),
+        "contacts.search.name": lambda: contacts.search("shevchenko"),
+        "contacts.search.email": lambda: contacts.search("@ukr.net"),
+        "contacts.search.miss": lambda: contacts.search("no such contact"),
+        "contacts.get_upcoming_birthdays": lambda: contacts.get_upcoming_birthdays(7),
+        # sets the same country again, so books stay the same for other scenarios
+        "contacts.edit_many": lambda: contacts.edit_many(with_address, lambda contact: contact.edit_address(country=str(contact.address.country))),
+        "contacts.find_duplicates": lambda: find_duplicates(contacts.data.values()),
+        "contacts.scan": lambda: scan(contacts, ["email=", "address~kyiv"]),
+        "contacts.sorted_page": lambda: select_page(contacts, "name", "m", "p", page=10),
+        "contacts.sound_alike": lambda: ContactIndexes.get(contacts).sound_alike("Olena Shevchenk"),
+        "contacts.query": lambda: run_query(["name:~jo", "AND", "birthday:03", "AND", "NOT", "email:*@gmail.com"], contacts),
+        "similar_strings": lambda: similar_strings("Olena Shevchenk", names, 0.5),
+        "notes.search": lambda: notes.search("recipe"),
+        "render.contacts": lambda: csv_as_table(to_csv(list(contacts.data.values()))),
+        "render.notes": lambda: csv_as_table(to_csv(list(notes.data.values()))),
+        "render.contacts_jsonl": lambda: [json.dumps(item) for item in json_objects(Records(list(contacts.data.values())))],
+    }
+
+def run(sizes: list[int], repeat: int, selected: list[str] | None) -> dict:
+    results = {}
+    for size in sizes:
+        started = time.perf_counter()
+        storage = Storage()
+        storage.contacts_book = generate_contacts(size)
+        storage.notes_book = generate_notes(size)
+        print(f"generated {size} contacts and notes in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, func in get_scenarios(storage, directory).items():
+                if selected and not any(name.startswith(prefix) for prefix in selected):
+                    continue
+                result = measure(func, repeat)
+                results[f"{size}/{name}"] = result
+                print(f"{size:>8} {name:<35} {result['median'] * 1000:>12.2f} ms", file=sys.stderr)
+
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """ Returns descriptions of scenarios which median time grew more than threshold """
+    regressions = []
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] else 0
+        status = "REGRESSION" if change > threshold else "ok"
+        print(f"{key:<45} {base['median'] * 1000:>10.2f} -> {result['median'] * 1000:>10.2f} ms {change:>+8.1%} {status}")
+        if change > threshold:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of nestor on synthetic books.")
+    parser.add_argument("--sizes", default="1000,100000", help="comma separated book sizes, e.g. 1000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each scenario, median is compared")
+    parser.add_argument("--scenario", action="append", help="run only scenarios starting with given name, can be repeated")
+    parser.add_argument("--output", help="save results to JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare results with JSON file of previous run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against baseline, 0.2 is 20%%")
+    arguments = parser.parse_args()
+
+    sizes = [int(size) for size in arguments.sizes.split(",")]
+    results = run(sizes, arguments.repeat, arguments.scenario)
+
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) slower than {arguments.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
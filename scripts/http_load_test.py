@@ -0,0 +1,69 @@
+"""
+Load test for 'nestor http' server.
+
+Each thread keeps one keep-alive connection and requests given paths in turn.
+Example: python scripts/http_load_test.py --threads 8 --duration 10 /contacts?limit=20 "/contacts?q=John" /birthdays
+"""
+import argparse
+import http.client
+import time
+from threading import Thread
+from urllib.parse import urlsplit
+
+from nestor.utils.percentile import percentile
+
+def worker(url: str, paths: list[str], deadline: float, latencies: list[float], errors: list[str]) -> None:
+    address = urlsplit(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port or 80, timeout=10)
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(f"{path}: HTTP {response.status}")
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(f"{path}: {e}")
+            connection.close()
+            connection = http.client.HTTPConnection(address.hostname, address.port or 80, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for 'nestor http' server.")
+    parser.add_argument("paths", nargs="*", default=["/contacts?limit=20", "/birthdays?days=7", "/notes?limit=20"])
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="server address")
+    parser.add_argument("--threads", type=int, default=4, help="number of concurrent connections")
+    parser.add_argument("--duration", type=float, default=10, help="test duration in seconds")
+    arguments = parser.parse_args()
+
+    latencies = [[] for _ in range(arguments.threads)]
+    errors = []
+    started = time.perf_counter()
+    deadline = started + arguments.duration
+    threads = [
+        Thread(target=worker, args=(arguments.url, arguments.paths, deadline, latencies[i], errors))
+        for i in range(arguments.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    print(f"requests:   {len(all_latencies)}")
+    print(f"errors:     {len(errors)}")
+    print(f"throughput: {len(all_latencies) / elapsed:.1f} req/s")
+    for percent in (50, 95, 99):
+        print(f"p{percent}:        {percentile(all_latencies, percent) * 1000:.2f} ms")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+if __name__ == "__main__":
+    main()
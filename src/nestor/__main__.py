@@ -1,70 +1,202 @@
-import shlex
-from typing import List, Tuple
+import argparse
+import os
+import stat
+import sys
 
-from nestor.handlers.contacts import ContactsHandler
-from nestor.handlers.notes import NotesHandler
+from nestor.handlers.dispatcher import create_handlers, dispatch, get_read_only_commands
 from nestor.services.colorizer import Colorizer
 from nestor.services.serializer import Serializer
-from nestor.services.ui import CommandLineInterface
+from nestor.services.ui import JsonLinesInterface, PlainInterface
+from nestor.utils.metrics import metrics
 
-def parse_input(user_input: str) -> Tuple[str, List[str]]:
-    parts = shlex.split(user_input)
-    cmd = parts[0].strip().lower()
-    args = parts[1:]
-    return cmd, *args
+DATA_FILENAME = "data"
+HISTORY_FILENAME = ".nestor_history"
+SOCKET_FILENAME = ".nestor.sock"
 
-def main():
-    serializer = Serializer('data')
-    cli = CommandLineInterface()
-    # load storage and initialize handlers
+SERVE_COMMAND = "serve"
+CLIENT_COMMAND = "client"
+HTTP_COMMAND = "http"
+DIFF_COMMAND = "diff"
+MERGE_COMMAND = "merge"
+
+TEXT_OUTPUT = "text"
+JSONL_OUTPUT = "jsonl"
+
+def parse_arguments(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="nestor", description="CLI assistant to manage contacts and notes.")
+    parser.add_argument("--startup-profile", action="store_true", help="report import and load time of startup and exit")
+    parser.add_argument("--startup-budget", type=float, metavar="MS", help="with --startup-profile, exit with error if startup takes longer")
+    parser.add_argument("--record-trace", metavar="FILE", help="append commands with their field inputs to FILE, to replay with benchmarks/replay.py")
+    parser.add_argument("--metrics", action="store_true", help="record timing of commands, see 'stats' command")
+    parser.add_argument("--metrics-file", metavar="FILE", help="record timing of commands and append them to FILE as JSON Lines")
+    parser.add_argument("--profile", action="store_true", help="run a single command under profiler and show top functions, e.g. 'nestor --profile contacts'")
+    parser.add_argument("--trace-memory", action="store_true", help="trace memory allocations from start, see 'mem-report' command")
+    parser.add_argument("--reminders-file", metavar="FILE", help="append birthday reminders of interactive mode and 'nestor serve' to FILE instead of showing them")
+    parser.add_argument("--output", choices=(TEXT_OUTPUT, JSONL_OUTPUT), default=TEXT_OUTPUT,
+                        help="output of a single command, 'jsonl' writes a JSON object per record or message for scripts")
+    parser.add_argument("--socket", default=SOCKET_FILENAME, help="unix socket of 'nestor serve' and 'nestor client'")
+    parser.add_argument("command", nargs="?", help="run a single command and exit, e.g. 'nestor export contacts', "
+                        "'nestor serve' to keep data in memory and serve commands, 'nestor client <command>' to send command to it, "
+                        "'nestor http' to serve REST API, 'nestor diff A.pkl B.pkl' and 'nestor merge A.pkl B.pkl' to compare and merge data files")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="command arguments")
+    return parser.parse_args(argv)
+
+def run_batch(serializer: Serializer, command: str, args: list[str], output: str = TEXT_OUTPUT) -> None:
+    """ Runs a single command without starting the interactive prompt """
+    command = command.lower()
+    cli = JsonLinesInterface() if output == JSONL_OUTPUT else PlainInterface()
     storage = serializer.load_data()
-    contacts_handler = ContactsHandler(storage.contacts_book, cli)
-    notes_handler = NotesHandler(storage.notes_book, cli)
+    dispatch(command, args, storage, cli, create_handlers(storage, cli))
+
+    if command not in get_read_only_commands():
+        serializer.save_data(storage, compact=True)
+
+def run_profile(serializer: Serializer, command: str | None, args: list[str]) -> None:
+    """ Runs a single command under profiler, including loading and saving of data """
+    from nestor.utils.profiler import profile_call
+
+    if not command:
+        print(Colorizer.error("Command is required, e.g. 'nestor --profile contacts'. Use 'profile <command>' in interactive mode."))
+        sys.exit(1)
+
+    print(profile_call(run_batch, serializer, command, args))
+
+def parse_server_arguments(command: str, argv: list[str], socket_path: str) -> argparse.Namespace:
+    """ Parses options given after 'serve' or 'http' command """
+    parser = argparse.ArgumentParser(prog=f"nestor {command}")
+    if command == SERVE_COMMAND:
+        parser.add_argument("--socket", default=socket_path, help="unix socket to listen on")
+    else:
+        parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+        parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    return parser.parse_args(argv)
+
+def parse_files_arguments(command: str, argv: list[str]) -> argparse.Namespace:
+    """ Parses data files given after 'diff' or 'merge' command """
+    parser = argparse.ArgumentParser(prog=f"nestor {command}")
+    if command == DIFF_COMMAND:
+        parser.add_argument("first", help="data file, e.g. data.pkl")
+        parser.add_argument("second", help="data file to compare with")
+    else:
+        parser.add_argument("first", help="data file to merge records into, e.g. data.pkl")
+        parser.add_argument("second", help="data file to take records from")
+        parser.add_argument("--prefer", choices=("first", "second"), default="first", help="file whose value is kept when both files have a different value of a field")
+    return parser.parse_args(argv)
+
+def run_diff(first: str, second: str) -> None:
+    """ Prints records which are only in one of data files or differ, exits with code 1 if there are any """
+    from nestor.services.merge import CHANGED, ONLY_FIRST, ONLY_SECOND, diff_files
+
+    differences, total = 0, 0
+    for kind, difference, key, fields in diff_files(first, second):
+        if difference == ONLY_FIRST:
+            print(Colorizer.error(f"- {kind}: {key}"))
+        elif difference == ONLY_SECOND:
+            print(Colorizer.success(f"+ {kind}: {key}"))
+        elif difference == CHANGED:
+            print(Colorizer.warn(f"~ {kind}: {key} ({', '.join(fields)})"))
+        else:
+            # summary after records of a book
+            same_batches, batches = fields
+            print(Colorizer.info(f"{kind.capitalize()}: {differences} differences, {same_batches} of {batches} batches of records are the same."))
+            total += differences
+            differences = 0
+            continue
+        differences += 1
+    if total:
+        sys.exit(1)
+
+def run_merge(first: str, second: str, prefer: str) -> None:
+    """ Merges records of the second data file into the first one and prints merged records """
+    from nestor.services.merge import ONLY_SECOND, merge_files
 
-    cli.output(Colorizer.highlight("Welcome to the assistant bot!"))
-    
-    while True:
-        user_input = ""
+    changes = merge_files(first, second, prefer)
+    for kind, difference, key, conflicts in changes:
+        if difference == ONLY_SECOND:
+            print(Colorizer.success(f"+ {kind}: {key}"))
+        elif conflicts:
+            print(Colorizer.warn(f"! {kind}: {key}, {', '.join(conflicts)} kept from {prefer} file"))
+        else:
+            print(Colorizer.info(f"~ {kind}: {key}"))
+    print(Colorizer.success(f"{len(changes)} records merged into {first}."))
+
+def run_client(socket_path: str, args: list[str]) -> None:
+    """ Sends command to 'nestor serve', answers for command fields are read from piped stdin """
+    from nestor.services.client import DaemonError, execute
+
+    if not args:
+        print(Colorizer.error("Command is required, e.g. 'nestor client contacts'."))
+        sys.exit(1)
+
+    # answers are read only from pipe or file, so inherited open stdin doesn't block the client
+    mode = os.fstat(sys.stdin.fileno()).st_mode
+    inputs = sys.stdin.read().splitlines() if stat.S_ISFIFO(mode) or stat.S_ISREG(mode) else []
+    try:
+        for text in execute(socket_path, args[0], args[1:], inputs):
+            print(text)
+    except DaemonError as e:
+        print(Colorizer.error(e))
+        sys.exit(1)
+
+def run_startup_profile(budget: float | None) -> None:
+    """ Prints startup time breakdown, exits with error if startup is over budget """
+    from nestor.utils.startup_profile import startup_profile
+
+    report, startup_ms = startup_profile(DATA_FILENAME)
+    print(report)
+    if budget is not None and startup_ms > budget:
+        print(Colorizer.error(f"Startup took {startup_ms:.1f} ms, budget is {budget:.1f} ms."))
+        sys.exit(1)
+
+def main():
+    arguments = parse_arguments(sys.argv[1:])
+    serializer = Serializer(DATA_FILENAME)
+
+    if arguments.metrics or arguments.metrics_file:
+        metrics.enable(arguments.metrics_file)
+
+    # output of servers goes to their clients, their colors don't depend on the server terminal
+    if arguments.output == JSONL_OUTPUT:
+        Colorizer.enabled = False
+    elif arguments.command not in (SERVE_COMMAND, HTTP_COMMAND):
+        Colorizer.configure(sys.stdout)
+
+    if arguments.trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    if arguments.profile:
+        run_profile(serializer, arguments.command, arguments.args)
+    elif arguments.startup_profile:
+        run_startup_profile(arguments.startup_budget)
+    elif arguments.command == SERVE_COMMAND:
+        from nestor.services.daemon import run_server
+        options = parse_server_arguments(SERVE_COMMAND, arguments.args, arguments.socket)
+        run_server(serializer, options.socket, arguments.reminders_file)
+    elif arguments.command == HTTP_COMMAND:
+        from nestor.services.http_server import run_http_server
+        options = parse_server_arguments(HTTP_COMMAND, arguments.args, arguments.socket)
+        run_http_server(serializer, options.host, options.port)
+    elif arguments.command == CLIENT_COMMAND:
+        run_client(arguments.socket, arguments.args)
+    elif arguments.command in (DIFF_COMMAND, MERGE_COMMAND):
+        options = parse_files_arguments(arguments.command, arguments.args)
         try:
-            user_input = cli.prompt(
-                "Enter a command: ", 
-                completion=[
-                    "hello", "help", "close", "exit",
-                    *ContactsHandler.get_available_commands(),
-                    *NotesHandler.get_available_commands()
-                ]
-            )
-        # handle Exit on Ctrl+C
-        except KeyboardInterrupt:
-            cli.output(Colorizer.highlight("\nGood bye!"))
-            serializer.save_data(storage)
-            break
-
-        command, *args = parse_input(user_input)
-
-        if command in ["close", "exit"]:
-            cli.output(Colorizer.highlight("Good bye!"))
-            serializer.save_data(storage)
-            break
-        elif command == "hello":
-            cli.output(Colorizer.highlight("How can I help you?"))
-        elif command == "help":
-            if args:
-                if args[0] in ContactsHandler.get_available_commands():
-                    cli.output(contacts_handler.help(args[0]))
-                elif args[0] in NotesHandler.get_available_commands():
-                    cli.output(notes_handler.help(args[0]))
-                else:
-                    cli.output(Colorizer.error("Invalid command."))
+            if arguments.command == DIFF_COMMAND:
+                run_diff(options.first, options.second)
             else:
-                cli.output(contacts_handler.help())
-                cli.output(notes_handler.help())
-        elif command in ContactsHandler.get_available_commands():
-            cli.output(contacts_handler.handle(command, *args))
-        elif command in NotesHandler.get_available_commands():
-            cli.output(notes_handler.handle(command, *args))
-        else:
-            cli.output(Colorizer.error("Invalid command."))
+                run_merge(options.first, options.second, options.prefer)
+        except FileNotFoundError as e:
+            print(Colorizer.error(f"File '{e.filename}' not found."))
+            sys.exit(1)
+    elif arguments.command:
+        run_batch(serializer, arguments.command, arguments.args, arguments.output)
+    else:
+        # imported here, batch commands don't need prompt_toolkit and asyncio
+        from nestor.services.repl import run_repl
+        run_repl(serializer, HISTORY_FILENAME, arguments.record_trace, arguments.reminders_file)
+
+    metrics.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
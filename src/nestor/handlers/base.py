@@ -1,6 +1,7 @@
 from typing import Dict
 
 from nestor.services.colorizer import Colorizer
+from nestor.services.results import Records
 
 
 class CommandsHandler():
@@ -12,7 +13,14 @@ class CommandsHandler():
         """
         return [ ]
 
-    def handle(self, command: str, *args: list[str]) -> str:
+    @staticmethod
+    def get_read_only_commands() -> list[str]:
+        """
+        Returns list of commands that don't change the book
+        """
+        return [ ]
+
+    def handle(self, command: str, *args: list[str]) -> str | Records:
         """ Handles user commands """
         pass
     
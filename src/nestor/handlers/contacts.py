@@ -1,15 +1,15 @@
-import copy
-
 from nestor.handlers.base import CommandsHandler
 from nestor.handlers.command_data_collector import FieldInput, command_data_collector
 from nestor.handlers.constants import CONTACT_NOT_FOUND, PHONE_NOT_FOUND
-from nestor.models.contacts_book import City, ContactsBook, Contact, Birthday, Country, Email, Name, Phone, State, ZipCode
+from nestor.models.contacts_book import Address, City, ContactsBook, Contact, Birthday, Country, Email, Name, Phone, State, ZipCode
 from nestor.services.ui import UserInterface
 from nestor.services.colorizer import Colorizer
+from nestor.services.results import Records
+from nestor.services.scan import scan
+from nestor.services.sorted_views import parse_listing_options, select_page, PAGE_SIZE
 from nestor.utils.input_error import input_error
 from nestor.utils.similar_strings import similar_strings
-from nestor.utils.to_csv import to_csv
-from nestor.utils.csv_as_table import csv_as_table
+from nestor.utils.duplicates import find_duplicates
 from nestor.utils.get_days_range import get_days_range
 
 class ContactsHandler(CommandsHandler):
@@ -42,6 +42,14 @@ class ContactsHandler(CommandsHandler):
     CONTACTS_COMMAND = "contacts"
     BIRTHDAYS_COMMAND = "birthdays"
     SEARCH_CONTACTS_COMMAND = "search-contacts"
+    FILTER_CONTACTS_COMMAND = "filter-contacts"
+    QUERY_CONTACTS_COMMAND = "query-contacts"
+
+    # sound-alike names offered when contact is not found
+    SUGGESTIONS_COUNT = 3
+
+    FIND_DUPLICATES_COMMAND = "find-duplicates"
+    MERGE_CONTACTS_COMMAND = "merge-contacts"
 
     def __init__(self, book: ContactsBook, cli: UserInterface):
         self.book = book
@@ -76,9 +84,32 @@ class ContactsHandler(CommandsHandler):
             ContactsHandler.DELETE_ADDRESS,
 
             ContactsHandler.CONTACTS_COMMAND,
-            ContactsHandler.SEARCH_CONTACTS_COMMAND
+            ContactsHandler.SEARCH_CONTACTS_COMMAND,
+            ContactsHandler.FILTER_CONTACTS_COMMAND,
+            ContactsHandler.QUERY_CONTACTS_COMMAND,
+
+            ContactsHandler.FIND_DUPLICATES_COMMAND,
+            ContactsHandler.MERGE_CONTACTS_COMMAND
+        ]
+
+    @staticmethod
+    def get_read_only_commands() -> list[str]:
+        """
+        Returns list of commands that don't change the book
+        """
+        return [
+            ContactsHandler.PHONE_COMMAND,
+            ContactsHandler.SHOW_BIRTHDAY_COMMAND,
+            ContactsHandler.BIRTHDAYS_COMMAND,
+            ContactsHandler.SHOW_EMAIL_COMMAND,
+            ContactsHandler.CONTACTS_COMMAND,
+            ContactsHandler.SEARCH_CONTACTS_COMMAND,
+            ContactsHandler.FILTER_CONTACTS_COMMAND,
+            ContactsHandler.QUERY_CONTACTS_COMMAND,
+            ContactsHandler.FIND_DUPLICATES_COMMAND
         ]
-    def handle(self, command: str, *args: list[str]) -> str:
+
+    def handle(self, command: str, *args: list[str]) -> str | Records:
         """
         Handles user commands
         command: str - user command
@@ -106,7 +137,7 @@ class ContactsHandler(CommandsHandler):
             case ContactsHandler.BIRTHDAYS_COMMAND:
                 return self.__get_upcoming_birthdays(*args)
             case ContactsHandler.CONTACTS_COMMAND:
-                return self.__get_all_contacts()
+                return self.__get_all_contacts(*args)
             case ContactsHandler.ADD_EMAIL_COMMAND | ContactsHandler.EDIT_EMAIL_COMMAND:
                 return self.__set_contact_email(*args)
             case ContactsHandler.SHOW_EMAIL_COMMAND:
@@ -121,6 +152,14 @@ class ContactsHandler(CommandsHandler):
                 return self.__delete_address(*args)
             case ContactsHandler.SEARCH_CONTACTS_COMMAND:
                 return self.__search_contacts(*args)
+            case ContactsHandler.FILTER_CONTACTS_COMMAND:
+                return self.__filter_contacts(*args)
+            case ContactsHandler.QUERY_CONTACTS_COMMAND:
+                return self.__query_contacts(*args)
+            case ContactsHandler.FIND_DUPLICATES_COMMAND:
+                return self.__find_duplicates(*args)
+            case ContactsHandler.MERGE_CONTACTS_COMMAND:
+                return self.__merge_contacts(*args)
             case _:
                 return Colorizer.error("Invalid command.")
             
@@ -145,8 +184,12 @@ class ContactsHandler(CommandsHandler):
             ContactsHandler.ADD_ADDRESS: "Add an address to a contact.\nExample: add-address \"John Doe\"\nFollow the prompts to enter the street, city, state, zip code, and country for the address.",
             ContactsHandler.EDIT_ADDRESS: "Edit address of a contact.\nExample: edit-address \"John Doe\"\nFollow the prompts to edit the street, city, state, zip code, and country for the address.",
             ContactsHandler.DELETE_ADDRESS: "Delete address of a contact.\nExample: delete-address \"John Doe\"",
-            ContactsHandler.CONTACTS_COMMAND: "Get all contacts.\nExample: contacts",
-            ContactsHandler.SEARCH_CONTACTS_COMMAND: "Search contacts by name, email, or address.\nExample: search-contacts John",
+            ContactsHandler.CONTACTS_COMMAND: f"Get all contacts, optionally sorted by name, birthday or city, from and to given values, by pages of {PAGE_SIZE}.\nText bound --to is a prefix, birthdays are given as DD.MM.YYYY.\nExamples:\n  contacts\n  contacts --sort birthday\n  contacts --sort name --from M --to P --page 2",
+            ContactsHandler.SEARCH_CONTACTS_COMMAND: "Search contacts by name, email, or address.\nWith --phonetic finds names sounding alike, e.g. 'Jon Smyth' finds 'John Smith'.\nExamples:\n  search-contacts John\n  search-contacts --phonetic \"Olexandr\"",
+            ContactsHandler.FILTER_CONTACTS_COMMAND: "Filter contacts by conditions on name, phones, email, birthday and address, all conditions must match.\nOperators: ~ contains, !~ doesn't contain, = equals, != doesn't equal, case is ignored.\nExample: filter-contacts email= address~kyiv",
+            ContactsHandler.QUERY_CONTACTS_COMMAND: "Query contacts with AND, OR, NOT and parentheses, indexes are used when they help.\nConditions: field:value equals, field:~text contains, field:pattern* matches wildcards, field: is empty, case is ignored.\nFields: name, phone, email, address, birthday (MM, DD.MM, DD.MM.YYYY or YYYY).\nAdd --explain to show the plan with estimated and actual rows.\nExample: query-contacts name:~jo AND birthday:03 AND NOT email:*@gmail.com",
+            ContactsHandler.FIND_DUPLICATES_COMMAND: "Find contacts that are probably the same person, by name, phone and email.\nOptional minimal score from 0 to 1, default 0.5.\nExamples:\n  find-duplicates\n  find-duplicates 0.8",
+            ContactsHandler.MERGE_CONTACTS_COMMAND: "Merge the second contact into the first one and delete it.\nPhones are combined, email, birthday and address are taken from the second contact if the first has none.\nExample: merge-contacts \"John Doe\" \"john doe\"",
         }
 
         return self._get_help_message(commands, "Available commands for contacts management:", command)
@@ -182,14 +225,15 @@ class ContactsHandler(CommandsHandler):
             self.book.add(new_contact)
             return Colorizer.success(f"Contact {name} added.")
         else:
-            if phone:
-                existing_contact.add_phone(phone)
-            if email:
-                existing_contact.set_email(email)
-            if date:
-                existing_contact.set_birthday(date)
-            if address:
-                existing_contact.edit_address(*address)
+            with self.book.edit(name):
+                if phone:
+                    existing_contact.add_phone(phone)
+                if email:
+                    existing_contact.set_email(email)
+                if date:
+                    existing_contact.set_birthday(date)
+                if address:
+                    existing_contact.edit_address(*address)
                 
             return Colorizer.success(f"Contact {name} updated.")
     
@@ -205,38 +249,39 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
 
+        address = contact.address or Address()
         fields = [
             FieldInput(prompt="Name", default_value=contact.name, validator=Name.validate),
             FieldInput(prompt="Phone number", default_value=contact.phones[0] if contact.phones else "", validator=Phone.validate),
             FieldInput(prompt="Date of Birth", default_value=str(contact.birthday) if contact.birthday else None, validator=Birthday.validate),
             FieldInput(prompt="Email", default_value=contact.email, validator=Email.validate),
             FieldInput(prompt="Address", children=[
-                FieldInput(prompt="Street", default_value=contact.address.street),
-                FieldInput(prompt="City", default_value=contact.address.city, validator=City.validate),
-                FieldInput(prompt="State", default_value=contact.address.state, validator=State.validate),
-                FieldInput(prompt="Zip code", default_value=contact.address.zip_code, validator=ZipCode.validate),
-                FieldInput(prompt="Country", default_value=contact.address.country, validator=Country.validate),
+                FieldInput(prompt="Street", default_value=address.street),
+                FieldInput(prompt="City", default_value=address.city, validator=City.validate),
+                FieldInput(prompt="State", default_value=address.state, validator=State.validate),
+                FieldInput(prompt="Zip code", default_value=address.zip_code, validator=ZipCode.validate),
+                FieldInput(prompt="Country", default_value=address.country, validator=Country.validate),
             ]),
         ]
          
         new_name, phone, date, email, address = command_data_collector(fields, self.cli)
 
-        if new_name and new_name != str(contact.name) and self.book.find(new_name):
+        if new_name and new_name != name and self.book.find(new_name):
             return Colorizer.warn(f"Contact with name '{new_name}' already exist.")
-        elif new_name and new_name != contact.name:
-            contact = copy.deepcopy(contact)
-            contact.rename(new_name)
-            self.book.delete(name)
-            self.book.add(contact)
+        elif new_name and new_name != name:
+            # record is re-keyed in place, fields below are changed on the same record
+            self.book.rename(name, new_name)
+            name = new_name
 
-        if phone:
-            contact.add_phone(phone)
-        if email:
-            contact.set_email(email)
-        if date:
-            contact.set_birthday(date)
-        if address:
-            contact.edit_address(*address)
+        with self.book.edit(name):
+            if phone:
+                contact.add_phone(phone)
+            if email:
+                contact.set_email(email)
+            if date:
+                contact.set_birthday(date)
+            if address:
+                contact.edit_address(*address)
 
         return Colorizer.success(f"Contact {name} updated.")
 
@@ -265,7 +310,7 @@ class ContactsHandler(CommandsHandler):
         name = args[0]
         contact = self.book.find(name)
         if contact is None:
-            return Colorizer.warn(CONTACT_NOT_FOUND)
+            return self.__not_found(name)
         
         return Colorizer.highlight("; ".join([str(item) for item in contact.phones]))
     
@@ -286,7 +331,8 @@ class ContactsHandler(CommandsHandler):
         if existing_phone:
             return Colorizer.warn(f"Phone {phone} already exist for contact {name}")
         
-        contact.add_phone(phone)
+        with self.book.edit(name):
+            contact.add_phone(phone)
         return Colorizer.success(f"Contact {name} phone added.")
     
     @input_error({IndexError: "New phone is required"})
@@ -301,13 +347,12 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
         
-        phone = contact.find_phone(old_phone)
-        
-        if not phone:
+        if not contact.find_phone(old_phone):
             return Colorizer.warn(PHONE_NOT_FOUND)
 
         new_phone = args[2]
-        phone.value = new_phone
+        with self.book.edit(name):
+            contact.edit_phone(old_phone, new_phone)
 
         return Colorizer.success(f"Contact {name} phone changed.")
     
@@ -326,7 +371,8 @@ class ContactsHandler(CommandsHandler):
         if not contact.find_phone(phone):
             return Colorizer.warn(PHONE_NOT_FOUND)
 
-        contact.remove_phone(phone)
+        with self.book.edit(name):
+            contact.remove_phone(phone)
 
         return Colorizer.success(f"Contact {name} phone removed.")
     
@@ -342,7 +388,8 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
         
-        contact.set_email(email)
+        with self.book.edit(name):
+            contact.set_email(email)
         return Colorizer.success(f"Contact {name} email updated.")
     
     @input_error()
@@ -354,7 +401,7 @@ class ContactsHandler(CommandsHandler):
         name = args[0]
         contact = self.book.find(name)
         if contact is None:
-            return Colorizer.warn(CONTACT_NOT_FOUND)
+            return self.__not_found(name)
         
         return Colorizer.success(str(contact.email))
     
@@ -370,7 +417,8 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
         
-        contact.remove_email()
+        with self.book.edit(name):
+            contact.remove_email()
         return Colorizer.success(f"Contact {name} email removed.")
 
     @input_error({ValueError: "Contact name and birthday are required"})
@@ -385,7 +433,8 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
         
-        contact.set_birthday(birthday)
+        with self.book.edit(name):
+            contact.set_birthday(birthday)
         return Colorizer.success(f"Contact {name} birthday added.")
     
     @input_error()
@@ -398,7 +447,7 @@ class ContactsHandler(CommandsHandler):
         contact = self.book.find(name)
 
         if contact is None:
-            return Colorizer.warn(CONTACT_NOT_FOUND)
+            return self.__not_found(name)
         
         return Colorizer.success(str(contact.birthday))
     
@@ -459,7 +508,8 @@ class ContactsHandler(CommandsHandler):
 
         street, city, state, zip_code, country = command_data_collector(fields, self.cli)
 
-        contact.add_address(street, city, state, zip_code, country)
+        with self.book.edit(name):
+            contact.add_address(street, city, state, zip_code, country)
 
         return Colorizer.success(f"Contact {name} address added.")
     
@@ -476,17 +526,19 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
 
+        address = contact.address or Address()
         fields = [
-            FieldInput(prompt="Street", default_value=contact.address.street),
-            FieldInput(prompt="City", default_value=contact.address.city, validator=City.validate),
-            FieldInput(prompt="State", default_value=contact.address.state, validator=State.validate),
-            FieldInput(prompt="Zip code", default_value=contact.address.zip_code, validator=ZipCode.validate),
-            FieldInput(prompt="Country", default_value=contact.address.country, validator=Country.validate),
+            FieldInput(prompt="Street", default_value=address.street),
+            FieldInput(prompt="City", default_value=address.city, validator=City.validate),
+            FieldInput(prompt="State", default_value=address.state, validator=State.validate),
+            FieldInput(prompt="Zip code", default_value=address.zip_code, validator=ZipCode.validate),
+            FieldInput(prompt="Country", default_value=address.country, validator=Country.validate),
         ]
 
         address = command_data_collector(fields, self.cli)
 
-        contact.edit_address(*address)
+        with self.book.edit(name):
+            contact.edit_address(*address)
 
         return Colorizer.success(f"Contact {name} address updated.")
     
@@ -503,17 +555,26 @@ class ContactsHandler(CommandsHandler):
         if contact is None:
             return Colorizer.warn(CONTACT_NOT_FOUND)
         
-        contact.remove_address()
+        with self.book.edit(name):
+            contact.remove_address()
 
         return Colorizer.success(f"Contact {name} address removed.")
     
     
     @input_error({IndexError: "Search string is required"})
-    def __search_contacts(self, *args) -> str:
+    def __search_contacts(self, *args) -> str | Records:
         """
         Searches contacts by name, email and address. Performs fuzzy search if no results fount, to have suggestions.
         args: list[str] - command arguments
         """
+        if args[0] == "--phonetic":
+            from nestor.services.indexes import ContactIndexes
+
+            names = ContactIndexes.get(self.book).sound_alike(args[1])
+            if not names:
+                return Colorizer.warn(CONTACT_NOT_FOUND)
+            return Records([self.book.data[name] for name in names])
+
         search_str = args[0]
         contacts = self.book.search(search_str)
         
@@ -523,14 +584,115 @@ class ContactsHandler(CommandsHandler):
                 return Colorizer.warn(CONTACT_NOT_FOUND)
             return Colorizer.warn(f"{CONTACT_NOT_FOUND} Did you mean: {similar_names[0]}?")
         
-        return csv_as_table(to_csv(contacts))
+        return Records(contacts)
         
-    def __get_all_contacts(self) -> str:
+    def __not_found(self, name: str) -> str:
         """
-        Returns all contacts
+        Returns warning that contact is not found, with names sounding alike to try
+        name: str - name of contact
         """
-        if not self.book.data:
+        from nestor.services.indexes import ContactIndexes
+
+        names = ContactIndexes.get(self.book).sound_alike(name)[:ContactsHandler.SUGGESTIONS_COUNT]
+        if not names:
             return Colorizer.warn(CONTACT_NOT_FOUND)
-        
-        return csv_as_table(to_csv(list(self.book.data.values())))
-    
+        return Colorizer.warn(f"{CONTACT_NOT_FOUND} Did you mean: {', '.join(names)}?")
+
+    @input_error()
+    def __get_all_contacts(self, *args) -> str | Records:
+        """
+        Returns all contacts or a page of sorted listing
+        args: list[str] - optional --sort, --from, --to and --page
+        """
+        try:
+            options = parse_listing_options(list(args))
+            contacts, total = select_page(self.book, **options)
+        except ValueError as e:
+            return Colorizer.error(str(e))
+
+        if not contacts:
+            return Colorizer.warn(CONTACT_NOT_FOUND)
+        if options.get("page"):
+            return Records(contacts, after=[Colorizer.info(f"Page {options['page']} of {-(-total // PAGE_SIZE)}, {total} contacts")])
+        return Records(contacts)
+
+    @input_error({IndexError: "At least one condition is required"})
+    def __filter_contacts(self, *args) -> str | Records:
+        """
+        Returns contacts matching all conditions, e.g. 'email=' and 'address~kyiv'
+        args: list[str] - conditions
+        """
+        if not args:
+            raise IndexError("At least one condition is required")
+
+        try:
+            contacts = scan(self.book, list(args))
+        except ValueError as e:
+            return Colorizer.error(str(e))
+
+        if not contacts:
+            return Colorizer.warn(CONTACT_NOT_FOUND)
+        return Records(contacts)
+
+    @input_error({IndexError: "Query is required"})
+    def __query_contacts(self, *args) -> str | Records:
+        """
+        Returns contacts matching query, e.g. 'name:~jo AND NOT email:*@gmail.com'
+        args: list[str] - optional --explain and query
+        """
+        from nestor.services.query import explain, run_query
+
+        args = list(args)
+        show_plan = "--explain" in args
+        if show_plan:
+            args.remove("--explain")
+        if not args:
+            raise IndexError("Query is required")
+
+        try:
+            contacts, plan = run_query(args, self.book)
+        except ValueError as e:
+            return Colorizer.error(str(e))
+
+        if not contacts and not show_plan:
+            return Colorizer.warn(CONTACT_NOT_FOUND)
+        return Records(
+            contacts,
+            before=[Colorizer.info("\n".join(explain(plan)))] if show_plan else [],
+            after=[] if contacts else [Colorizer.warn(CONTACT_NOT_FOUND)]
+        )
+
+    @input_error({ValueError: "Score should be a number from 0 to 1"})
+    def __find_duplicates(self, *args) -> str | Records:
+        """
+        Returns table of probable duplicates
+        args: list[str] - optional minimal score
+        """
+        threshold = float(args[0]) if args else 0.5
+        if not 0 <= threshold <= 1:
+            raise ValueError("Score should be a number from 0 to 1")
+
+        duplicates = find_duplicates(self.book.data.values(), threshold)
+        if not duplicates:
+            return Colorizer.success("No duplicates found.")
+
+        return Records([
+            {"contact": name, "duplicate": other, "score": round(score, 2), "reasons": reasons}
+            for name, other, score, reasons in duplicates
+        ])
+
+    @input_error({ValueError: "Names of two contacts are required"})
+    def __merge_contacts(self, *args) -> str:
+        """
+        Merges second contact into the first one
+        args: list[str] - names of contacts
+        """
+        name, other_name = args
+
+        if name == other_name:
+            return Colorizer.warn("Can't merge contact with itself.")
+        if self.book.find(name) is None or self.book.find(other_name) is None:
+            return Colorizer.warn(CONTACT_NOT_FOUND)
+
+        self.book.merge(name, other_name)
+        return Colorizer.success(f"Contact {other_name} merged into {name}.")
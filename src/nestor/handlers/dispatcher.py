@@ -0,0 +1,108 @@
+import shlex
+from contextlib import nullcontext
+from functools import cache
+from typing import Iterable, List, Tuple
+
+from nestor.handlers.base import CommandsHandler
+from nestor.handlers.contacts import ContactsHandler
+from nestor.handlers.notes import NotesHandler
+from nestor.handlers.session import SessionHandler
+from nestor.services.colorizer import Colorizer
+from nestor.services.operation_log import OperationLog
+from nestor.services.serializer import Storage
+from nestor.services.ui import UserInterface
+from nestor.utils.metrics import metrics
+from nestor.utils.to_csv import to_csv
+
+EXPORT_COMMAND = "export"
+
+def create_handlers(storage: Storage, cli: UserInterface, log: OperationLog = None) -> list[CommandsHandler]:
+    """
+    Returns handlers of all commands working with given storage
+    log: OperationLog - log of the session for 'undo' and 'redo'
+    """
+    handlers = [
+        ContactsHandler(storage.contacts_book, cli),
+        NotesHandler(storage.notes_book, cli)
+    ]
+    handlers.append(SessionHandler(storage, cli, lambda command, args: dispatch(command, args, storage, cli, handlers), log))
+    return handlers
+
+def get_commands() -> list[str]:
+    """ Returns list of all commands for completion """
+    return [
+        "hello", "help", "close", "exit", EXPORT_COMMAND,
+        *ContactsHandler.get_available_commands(),
+        *NotesHandler.get_available_commands(),
+        *SessionHandler.get_available_commands()
+    ]
+
+def get_read_only_commands() -> list[str]:
+    """ Returns list of commands that never change storage """
+    return [
+        "hello", "help", EXPORT_COMMAND,
+        *ContactsHandler.get_read_only_commands(),
+        *NotesHandler.get_read_only_commands(),
+        *SessionHandler.get_read_only_commands()
+    ]
+
+@cache
+def read_only_commands() -> frozenset[str]:
+    return frozenset(get_read_only_commands())
+
+def parse_input(user_input: str) -> Tuple[str, List[str]]:
+    parts = shlex.split(user_input)
+    cmd = parts[0].strip().lower()
+    args = parts[1:]
+    return cmd, *args
+
+def export(storage: Storage, *args) -> str:
+    """
+    Returns contacts or notes in CSV format
+    args: list[str] - 'contacts' (default) or 'notes'
+    """
+    kind = args[0] if args else "contacts"
+    if kind == "contacts":
+        records = list(storage.contacts_book.data.values())
+    elif kind == "notes":
+        records = list(storage.notes_book.data.values())
+    else:
+        return Colorizer.error("Use 'export contacts' or 'export notes'.")
+
+    return to_csv(records) if records else ""
+
+def output(cli: UserInterface, result: str | Iterable[str]) -> None:
+    """ Outputs result of a command, lines of long results are streamed """
+    if result is None or isinstance(result, str):
+        cli.output(result)
+    else:
+        cli.output_lines(result)
+
+def dispatch(command: str, args: list[str], storage: Storage, cli: UserInterface, handlers: list[CommandsHandler], log: OperationLog = None) -> None:
+    """
+    Runs a single command and outputs the result
+    log: OperationLog - log to record changes made by the command to, so it can be undone
+    """
+    with metrics.command(command), log.command(command) if log else nullcontext():
+        if command == "hello":
+            cli.output(Colorizer.highlight("How can I help you?"))
+        elif command == "help":
+            if args:
+                handler = next((handler for handler in handlers if args[0] in handler.get_available_commands()), None)
+                cli.output(handler.help(args[0]) if handler else Colorizer.error("Invalid command."))
+            else:
+                for handler in handlers:
+                    cli.output(handler.help())
+        elif command == EXPORT_COMMAND:
+            cli.output(export(storage, *args))
+        else:
+            handler = next((handler for handler in handlers if command in handler.get_available_commands()), None)
+            if handler is None:
+                cli.output(Colorizer.error("Invalid command."))
+                return
+            # phases are timed here rather than in models, so loops over records don't pay for disabled metrics
+            with metrics.phase("lookup" if command in read_only_commands() else "mutation"):
+                result = handler.handle(command, *args)
+            # streamed results are rendered while they are output
+            with metrics.phase("output"):
+                output(cli, result)
@@ -1,11 +1,14 @@
+from itertools import chain
+
 from nestor.handlers.base import CommandsHandler
 from nestor.handlers.command_data_collector import FieldInput, command_data_collector
-from nestor.models.notes_book import Content, NotesBook, Note, Title
+from nestor.models.notes_book import Content, LargeContent, NotesBook, Note, Title
 from nestor.services.ui import UserInterface
 from nestor.services.colorizer import Colorizer
+from nestor.services.results import Records
+from nestor.services.scan import scan
+from nestor.services.sorted_views import parse_listing_options, select_page, PAGE_SIZE
 from nestor.utils.input_error import input_error
-from nestor.utils.csv_as_table import csv_as_table
-from nestor.utils.to_csv import to_csv
 
 class NotesHandler(CommandsHandler):
     """
@@ -20,6 +23,16 @@ class NotesHandler(CommandsHandler):
     ADD_NOTE_TAGS = "add-note-tags"
     DELETE_NOTE_TAGS = "delete-note-tags"
     SEARCH_NOTES = "search-notes"
+    FILTER_NOTES = "filter-notes"
+    SHOW_NOTE = "show-note"
+    IMPORT_NOTE = "import-note"
+    NOTE_HISTORY = "note-history"
+    NOTE_RESTORE = "note-restore"
+
+    # symbols read from imported file at once, large content is stored by chunks of this size
+    IMPORT_CHUNK_SIZE = 64 * 1024
+    # symbols of content shown for each version by note-history
+    HISTORY_PREVIEW_LENGTH = 60
 
     def __init__(self, book: NotesBook, cli: UserInterface):
         self.book = book
@@ -37,11 +50,29 @@ class NotesHandler(CommandsHandler):
             NotesHandler.EDIT_NOTE,
             NotesHandler.DELETE_NOTE,
             NotesHandler.SEARCH_NOTES,
+            NotesHandler.FILTER_NOTES,
+            NotesHandler.SHOW_NOTE,
+            NotesHandler.IMPORT_NOTE,
+            NotesHandler.NOTE_HISTORY,
+            NotesHandler.NOTE_RESTORE,
             NotesHandler.ADD_NOTE_TAGS,
             NotesHandler.DELETE_NOTE_TAGS
         ]
 
-    def handle(self, command: str, *args: list[str]) -> str:
+    @staticmethod
+    def get_read_only_commands() -> list[str]:
+        """
+        Returns list of commands that don't change the book
+        """
+        return [
+            NotesHandler.NOTES_COMMAND,
+            NotesHandler.SEARCH_NOTES,
+            NotesHandler.FILTER_NOTES,
+            NotesHandler.SHOW_NOTE,
+            NotesHandler.NOTE_HISTORY
+        ]
+
+    def handle(self, command: str, *args: list[str]) -> str | Records:
         """
         Handles user commands
         command: str - user command
@@ -55,9 +86,19 @@ class NotesHandler(CommandsHandler):
             case NotesHandler.DELETE_NOTE:
                 return self.__delete_note(*args)
             case NotesHandler.NOTES_COMMAND:
-                return self.__get_all_notes()
+                return self.__get_all_notes(*args)
             case NotesHandler.SEARCH_NOTES:
                 return self.__search_notes(*args)
+            case NotesHandler.FILTER_NOTES:
+                return self.__filter_notes(*args)
+            case NotesHandler.SHOW_NOTE:
+                return self.__show_note(*args)
+            case NotesHandler.IMPORT_NOTE:
+                return self.__import_note(*args)
+            case NotesHandler.NOTE_HISTORY:
+                return self.__note_history(*args)
+            case NotesHandler.NOTE_RESTORE:
+                return self.__note_restore(*args)
             case NotesHandler.ADD_NOTE_TAGS:
                 return self.__add_note_tags(*args)
             case NotesHandler.DELETE_NOTE_TAGS:
@@ -67,11 +108,16 @@ class NotesHandler(CommandsHandler):
     
     def help(self, command=None):
         commands = {
-            self.NOTES_COMMAND: "Display all notes.\nExample: notes",
+            self.NOTES_COMMAND: f"Display all notes, optionally sorted by title, from and to given titles, by pages of {PAGE_SIZE}.\nTitle --to is a prefix.\nExamples:\n  notes\n  notes --sort title --from A --to C --page 2",
             self.ADD_NOTE: "Adds a new note.\nExample: add-note\nFollow the prompts to enter the title, content, and tags (optional) for the note.",
             self.EDIT_NOTE: "Edit ann existing note.\nExample: edit-note \"Recipe of a pie\"\nFollow the prompts to enter the new title, content, and tags (optional) for the note.",
             self.DELETE_NOTE: "Delete an existing note.\nExample: delete-note \"Recipe of a pie\"",
             self.SEARCH_NOTES: "Search for notes by title, content, or tags.\nExample: search-notes \"pie\"",
+            self.FILTER_NOTES: "Filter notes by conditions on title, content and tags, all conditions must match.\nOperators: ~ contains, !~ doesn't contain, = equals, != doesn't equal, case is ignored.\nContent of large notes is read chunk by chunk, so it is matched in full like in search-notes.\nExample: filter-notes tags= content~pie",
+            self.SHOW_NOTE: "Show the note with its full content, long content is shown page by page.\nExample: show-note \"Meeting minutes\"",
+            self.IMPORT_NOTE: "Create a note from a text file or replace content of the note with it.\nContent longer than 200 symbols is kept in chunks next to the data file, lists show its preview.\nExample: import-note \"Meeting minutes\" minutes.txt",
+            self.NOTE_HISTORY: "Show previous versions of the note, newest first, last 50 versions are kept.\nExample: note-history \"Recipe of a pie\"",
+            self.NOTE_RESTORE: "Restore content and tags of the note from a version shown by note-history, title is kept.\nExample: note-restore \"Recipe of a pie\" 3",
             self.ADD_NOTE_TAGS: "Add tags to an existing note.\nExample: add-note-tags \"Recipe of a pie\" \"food; recipe\"",
             self.DELETE_NOTE_TAGS: "Delete tags from an existing note.\nExample: delete-note-tags \"Recipe of a pie\"",
         }
@@ -114,25 +160,27 @@ class NotesHandler(CommandsHandler):
         if record is None:
             message = Colorizer.warn(f"Could not find Note \"{title}\".")
         else:
+            # large content is replaced with import-note, preview is not offered for editing
+            large = isinstance(record.content, LargeContent)
             fields = [
                 FieldInput(prompt="Title", default_value=record.title, validator=Title.validate, is_required=True),
-                FieldInput(prompt="Content", default_value=record.content, validator=Content.validate, is_required=True),
+                *([] if large else [FieldInput(prompt="Content", default_value=record.content, validator=Content.validate, is_required=True)]),
                 FieldInput(prompt="Tags (separated by semicolon)", default_value="; ".join(record.tags) if record.tags else ""),
             ]
-            new_title, content, tags_str = command_data_collector(fields, self.cli)
+            values = command_data_collector(fields, self.cli)
+            new_title, content, tags_str = (values[0], None, values[1]) if large else values
             tags = self.__tags_from_str(tags_str)
 
             if new_title and new_title != record.title.value and self.book.find(new_title):
                 return Colorizer.warn(f"Note with title '{new_title}' already exist.")
             elif new_title and new_title != record.title.value:
-                record.edit_title(new_title)
-                self.book.delete(title)
-                self.book.add(record)
+                self.book.rename(title, new_title)
 
-            if content:
-                record.edit_content(content)
-            if tags:
-                record.edit_tags(tags)
+            with self.book.edit(record.title.value):
+                if content:
+                    record.edit_content(content)
+                if tags:
+                    record.edit_tags(tags)
 
             message = Colorizer.success(f"Content for Note \"{title}\" was changed.")
 
@@ -154,7 +202,7 @@ class NotesHandler(CommandsHandler):
 
 
     @input_error({IndexError: "Search string is required"})
-    def __search_notes(self, *args) -> str:
+    def __search_notes(self, *args) -> str | Records:
         """
         Searches notes by title, content and tags
         """
@@ -164,7 +212,143 @@ class NotesHandler(CommandsHandler):
         if not notes:
             return Colorizer.warn("No notes found")
 
-        return csv_as_table(to_csv(notes))
+        return Records(notes)
+
+
+    @input_error({IndexError: "At least one condition is required"})
+    def __filter_notes(self, *args) -> str | Records:
+        """
+        Filters notes by conditions on title, content and tags
+        """
+        if not args:
+            raise IndexError("At least one condition is required")
+
+        try:
+            notes = scan(self.book, list(args))
+        except ValueError as e:
+            return Colorizer.error(str(e))
+
+        if not notes:
+            return Colorizer.warn("No notes found")
+
+        return Records(notes)
+
+
+    @input_error({IndexError: "Note title is required"})
+    def __show_note(self, *args) -> str:
+        """
+        Shows note with full content, lines are streamed page by page
+        """
+        title = args[0]
+        note = self.book.find(title)
+
+        if note is None:
+            return Colorizer.warn(f"Could not find Note \"{title}\".")
+
+        self.cli.output(Colorizer.highlight(f"{note.title}") + (f" [{'; '.join(note.tags)}]" if note.tags else ""))
+        lines = self.book.read_lines(note)
+        try:
+            if not self.cli.output_lines(lines):
+                return ""
+        except FileNotFoundError:
+            return Colorizer.error(f"Content of Note \"{title}\" is missing, chunks file was not found.")
+        finally:
+            lines.close()
+
+        return Colorizer.info(f"End of Note \"{title}\".")
+
+
+    @input_error({ValueError: "Note title and file name are required"})
+    def __import_note(self, *args) -> str:
+        """
+        Creates note from text file or replaces its content, large content is written to chunk store without loading it whole
+        """
+        title, filename = args
+        Title.validate(title)
+        if self.book.store is None:
+            return Colorizer.error("Large notes are kept next to the data file, they are not available without it.")
+
+        large_content = None
+        try:
+            with open(filename, encoding="utf-8") as f:
+                head = f.read(Content.MAX_CONTENT_LENGTH + 1)
+                if len(head) > Content.MAX_CONTENT_LENGTH:
+                    chunks = iter(lambda: f.read(NotesHandler.IMPORT_CHUNK_SIZE), "")
+                    large_content = LargeContent.write(self.book.store, chain([head + next(chunks, "")], chunks))
+        except (OSError, UnicodeDecodeError) as e:
+            return Colorizer.error(f"Could not read file '{filename}': {e}")
+
+        def set_content(note: Note) -> None:
+            if large_content:
+                note.set_large_content(large_content)
+            else:
+                note.edit_content(head)
+
+        note = self.book.find(title)
+        if note is None:
+            note = Note(title)
+            set_content(note)
+            self.book.add(note)
+            return Colorizer.success(f"Note \"{title}\" imported from '{filename}'.")
+
+        with self.book.edit(title):
+            set_content(note)
+        return Colorizer.success(f"Content of Note \"{title}\" replaced from '{filename}'.")
+
+
+    @input_error({IndexError: "Note title is required"})
+    def __note_history(self, *args) -> str | Records:
+        """
+        Shows previous versions of note, contents are rebuilt from deltas
+        """
+        title = args[0]
+        note = self.book.find(title)
+        history = self.book.get_history(title)
+
+        if not history or not history.revisions:
+            return Colorizer.warn(f"Note \"{title}\" has no previous versions.")
+
+        current_content = note.content if note else None
+        revisions = []
+        for index in reversed(range(len(history.revisions))):
+            revision = history.revisions[index]
+            content = str(history.content_at(index, current_content) or "")
+            preview = content if len(content) <= NotesHandler.HISTORY_PREVIEW_LENGTH else content[:NotesHandler.HISTORY_PREVIEW_LENGTH] + "..."
+            revisions.append({
+                "version": revision.number,
+                "saved at": f"{revision.saved_at:%Y-%m-%d %H:%M:%S}",
+                "title": revision.title,
+                "tags": revision.tags,
+                "content": " ".join(preview.split())
+            })
+        return Records(revisions)
+
+
+    @input_error({ValueError: "Note title and version number are required"})
+    def __note_restore(self, *args) -> str:
+        """
+        Restores content and tags of note from its previous version
+        """
+        title, number = args
+        note = self.book.find(title)
+        history = self.book.get_history(title)
+        index = history.find(int(number)) if history else None
+
+        if note is None:
+            return Colorizer.warn(f"Could not find Note \"{title}\".")
+        if index is None:
+            return Colorizer.warn(f"Note \"{title}\" has no version {number}, see note-history.")
+
+        revision = history.revisions[index]
+        content = history.content_at(index, note.content)
+        with self.book.edit(title):
+            if isinstance(content, LargeContent):
+                note.set_large_content(content)
+            else:
+                note.edit_content(content.value if content else None)
+            note.edit_tags(list(revision.tags))
+
+        return Colorizer.success(f"Note \"{title}\" restored to version {number}.")
 
 
     @input_error({ValueError: "Note title and tags are required"})
@@ -180,7 +364,8 @@ class NotesHandler(CommandsHandler):
         if note is None:
             message = Colorizer.warn(f"Could not find Note \"{title}\".")
         else:
-            note.add_tags(tags)
+            with self.book.edit(title):
+                note.add_tags(tags)
             message = Colorizer.success(f"Tags added for Note \"{title}\".")
 
         return message
@@ -197,18 +382,30 @@ class NotesHandler(CommandsHandler):
         if note is None:
             message = Colorizer.warn(f"Could not find Note \"{title}\".")
         else:
-            note.delete_tags()
+            with self.book.edit(title):
+                note.delete_tags()
             message = Colorizer.success(f"Tags deleted for Note \"{title}\".")
 
         return message
 
 
     @input_error()
-    def __get_all_notes(self) -> str:
-        if not self.book.data:
-            return Colorizer.warn("Notes not found")
+    def __get_all_notes(self, *args) -> str | Records:
+        """
+        Returns all notes or a page of sorted listing
+        args: list[str] - optional --sort, --from, --to and --page
+        """
+        try:
+            options = parse_listing_options(list(args))
+            notes, total = select_page(self.book, **options)
+        except ValueError as e:
+            return Colorizer.error(str(e))
 
-        return csv_as_table(to_csv(list(self.book.data.values())))
+        if not notes:
+            return Colorizer.warn("Notes not found")
+        if options.get("page"):
+            return Records(notes, after=[Colorizer.info(f"Page {options['page']} of {-(-total // PAGE_SIZE)}, {total} notes")])
+        return Records(notes)
     
     def __tags_from_str(self, tags_str: str | None) -> list[str]:
         """
@@ -0,0 +1,272 @@
+from collections import defaultdict
+from typing import Callable
+
+from nestor.handlers.base import CommandsHandler
+from nestor.services.colorizer import Colorizer
+from nestor.services.operation_log import OperationLog
+from nestor.services.serializer import Storage
+from nestor.services.ui import UserInterface
+from nestor.utils.csv_as_table import csv_as_table
+from nestor.utils.input_error import input_error
+from nestor.utils.memory_report import memory_by_owner, memory_of_structures, tracemalloc_top
+from nestor.utils.metrics import metrics
+from nestor.utils.percentile import percentile
+from nestor.utils.profiler import profile_call
+
+# upper bounds of latency histogram buckets in seconds
+HISTOGRAM_BUCKETS = [0.001, 0.01, 0.1, 1.0, float("inf")]
+HISTOGRAM_WIDTH = 40
+
+class SessionHandler(CommandsHandler):
+    """
+    Session handler class, commands that work with the session rather than with a book
+    storage: Storage - storage of the session
+    execute: Callable - runs another command, used by 'profile'
+    log: OperationLog - changes made by commands of the session, used by 'undo' and 'redo'
+    """
+
+    STATS_COMMAND = "stats"
+    PROFILE_COMMAND = "profile"
+    MEM_REPORT_COMMAND = "mem-report"
+    UNDO_COMMAND = "undo"
+    REDO_COMMAND = "redo"
+    BEGIN_COMMAND = "begin"
+    COMMIT_COMMAND = "commit"
+    ROLLBACK_COMMAND = "rollback"
+
+    def __init__(self, storage: Storage, cli: UserInterface, execute: Callable[[str, list[str]], None] = None, log: OperationLog = None):
+        self.storage = storage
+        self.cli = cli
+        self.execute = execute
+        self.log = log
+
+    @staticmethod
+    def get_available_commands() -> list[str]:
+        """
+        Returns list of available commands
+        """
+        return [
+            SessionHandler.STATS_COMMAND,
+            SessionHandler.PROFILE_COMMAND,
+            SessionHandler.MEM_REPORT_COMMAND,
+            SessionHandler.UNDO_COMMAND,
+            SessionHandler.REDO_COMMAND,
+            SessionHandler.BEGIN_COMMAND,
+            SessionHandler.COMMIT_COMMAND,
+            SessionHandler.ROLLBACK_COMMAND
+        ]
+
+    @staticmethod
+    def get_read_only_commands() -> list[str]:
+        """
+        Returns list of commands that don't change the book
+        """
+        # 'profile' is not read-only, as profiled command may change the book
+        return [
+            SessionHandler.STATS_COMMAND,
+            SessionHandler.MEM_REPORT_COMMAND
+        ]
+
+    def handle(self, command: str, *args: list[str]) -> str:
+        """
+        Handles user commands
+        command: str - user command
+        args: list[str] - command arguments
+        """
+        match command:
+            case SessionHandler.STATS_COMMAND:
+                return self.__get_stats(*args)
+            case SessionHandler.PROFILE_COMMAND:
+                return self.__profile(*args)
+            case SessionHandler.MEM_REPORT_COMMAND:
+                return self.__get_memory_report()
+            case SessionHandler.UNDO_COMMAND:
+                return self.__undo()
+            case SessionHandler.REDO_COMMAND:
+                return self.__redo()
+            case SessionHandler.BEGIN_COMMAND:
+                return self.__begin()
+            case SessionHandler.COMMIT_COMMAND:
+                return self.__commit()
+            case SessionHandler.ROLLBACK_COMMAND:
+                return self.__rollback()
+            case _:
+                return Colorizer.error("Invalid command.")
+
+    def help(self, command=None):
+        """
+        Returns help information for all available commands.
+        """
+        commands = {
+            SessionHandler.STATS_COMMAND: "Show timing of recent commands and their phases, requires 'nestor --metrics'.\nExamples:\n  stats\n  stats reset",
+            SessionHandler.PROFILE_COMMAND: "Run a command under profiler and show functions with the highest cumulative time.\nExample: profile search-contacts John",
+            SessionHandler.MEM_REPORT_COMMAND: "Show memory used by each model class and by book structures.\nStart nestor with --trace-memory to also see top allocation sites.\nExample: mem-report",
+            SessionHandler.UNDO_COMMAND: "Revert changes made by the last command of the session.\nExample: undo",
+            SessionHandler.REDO_COMMAND: "Make changes of the last undone command again.\nExample: redo",
+            SessionHandler.BEGIN_COMMAND: "Start a transaction, changes of next commands are saved only after 'commit'.\nExample: begin",
+            SessionHandler.COMMIT_COMMAND: "Finish the transaction, its changes can be undone with a single 'undo'.\nExample: commit",
+            SessionHandler.ROLLBACK_COMMAND: "Revert all changes made since 'begin'.\nExample: rollback",
+        }
+
+        return self._get_help_message(commands, "Available commands for the session:", command)
+
+    @input_error()
+    def __get_stats(self, *args) -> str:
+        """
+        Returns table of command timings and latency histogram
+        args: list[str] - 'reset' to clear recorded metrics
+        """
+        if not metrics.enabled:
+            return Colorizer.warn("Metrics are disabled. Start nestor with --metrics or --metrics-file FILE.")
+
+        if args and args[0] == "reset":
+            metrics.records.clear()
+            return Colorizer.success("Metrics cleared.")
+
+        records = defaultdict(list)
+        for record in list(metrics.records):
+            records[record["command"]].append(record)
+
+        if not records:
+            return Colorizer.warn("No commands recorded yet.")
+
+        phase_names = sorted({phase for items in records.values() for item in items for phase in item["phases"]})
+        rows = [";".join(["command", "count", "p50 ms", "p95 ms", "max ms", "cpu ms", "net blocks", *[f"{phase} ms" for phase in phase_names]])]
+        histogram = [0] * len(HISTOGRAM_BUCKETS)
+
+        for command, items in sorted(records.items()):
+            walls = sorted(item["wall"] for item in items)
+            for wall in walls:
+                histogram[next(i for i, bound in enumerate(HISTOGRAM_BUCKETS) if wall < bound)] += 1
+            phases = [sum(item["phases"].get(phase, 0.0) for item in items) / len(items) * 1000 for phase in phase_names]
+            rows.append(";".join([
+                command,
+                str(len(items)),
+                f"{percentile(walls, 50) * 1000:.2f}",
+                f"{percentile(walls, 95) * 1000:.2f}",
+                f"{walls[-1] * 1000:.2f}",
+                f"{sum(item['cpu'] for item in items) / len(items) * 1000:.2f}",
+                str(sum(item["net_blocks"] for item in items) // len(items)),
+                *[f"{phase:.2f}" for phase in phases],
+            ]))
+
+        return csv_as_table("\n".join(rows)) + "\n" + self.__histogram(histogram)
+
+    @input_error({IndexError: "Command to profile is required"})
+    def __profile(self, *args) -> str:
+        """
+        Runs command under profiler, command output is shown before the report
+        args: list[str] - command and its arguments
+        """
+        command, *command_args = args
+        if command == SessionHandler.PROFILE_COMMAND:
+            return Colorizer.error("Profile can't profile itself.")
+
+        try:
+            report = profile_call(self.execute, command.lower(), command_args)
+        # only one profiler can be active, e.g. when whole run is profiled with --profile
+        except ValueError as e:
+            return Colorizer.error(f"Can't start profiler: {e}")
+
+        return Colorizer.info(f"Profile of '{command}':\n") + report
+
+    @input_error()
+    def __get_memory_report(self) -> str:
+        """
+        Returns memory used by model classes, book structures and top allocation sites
+        """
+        rows = ["owner;instances;size kb"]
+        sizes = memory_by_owner(self.storage)
+        for owner, (instances, size) in sorted(sizes.items(), key=lambda item: item[1][1], reverse=True):
+            rows.append(f"{owner};{instances};{size / 1024:.1f}")
+        total = sum(size for _, size in sizes.values())
+        report = [Colorizer.info(f"Memory by model class, {total / 1024 / 1024:.1f} MB in total, estimated from a sample of large books:"), csv_as_table("\n".join(rows))]
+
+        rows = ["structure;size kb"]
+        for book in (self.storage.contacts_book, self.storage.notes_book):
+            for name, size in memory_of_structures(book).items():
+                rows.append(f"{name};{size / 1024:.1f}")
+        report += [Colorizer.info("Memory of book structures without records:"), csv_as_table("\n".join(rows))]
+
+        allocations = tracemalloc_top()
+        if allocations:
+            report += [Colorizer.info("Top allocation sites since start, estimated from a sample:"), *allocations]
+        else:
+            report.append(Colorizer.warn("Start nestor with --trace-memory to see top allocation sites."))
+
+        return "\n".join(report)
+
+    @input_error()
+    def __undo(self) -> str:
+        """
+        Reverts the last command that changed the books
+        """
+        if self.log is None:
+            return Colorizer.warn("Undo is available in interactive mode and in 'nestor serve'.")
+        if self.storage.in_transaction():
+            return Colorizer.warn("Commit or roll back the transaction first.")
+
+        command = self.log.undo()
+        if command is None:
+            return Colorizer.warn("Nothing to undo.")
+        return Colorizer.success(f"Command '{command}' undone.")
+
+    @input_error()
+    def __redo(self) -> str:
+        """
+        Makes the last undone command again
+        """
+        if self.log is None:
+            return Colorizer.warn("Redo is available in interactive mode and in 'nestor serve'.")
+        if self.storage.in_transaction():
+            return Colorizer.warn("Commit or roll back the transaction first.")
+
+        command = self.log.redo()
+        if command is None:
+            return Colorizer.warn("Nothing to redo.")
+        return Colorizer.success(f"Command '{command}' redone.")
+
+    @input_error()
+    def __begin(self) -> str:
+        """
+        Starts transaction in all books
+        """
+        # a single command of batch mode has nothing to group
+        if self.log is None:
+            return Colorizer.warn("Transactions are available in interactive mode and in 'nestor serve'.")
+        if self.storage.in_transaction():
+            return Colorizer.warn("Transaction is already started.")
+
+        self.storage.begin()
+        return Colorizer.success("Transaction started.")
+
+    @input_error()
+    def __commit(self) -> str:
+        """
+        Commits transaction, its changes become a single log entry
+        """
+        if not self.storage.in_transaction():
+            return Colorizer.warn("No transaction to commit.")
+
+        self.storage.commit()
+        return Colorizer.success("Transaction committed.")
+
+    @input_error()
+    def __rollback(self) -> str:
+        """
+        Reverts changes of transaction
+        """
+        if not self.storage.in_transaction():
+            return Colorizer.warn("No transaction to roll back.")
+
+        self.storage.rollback()
+        return Colorizer.success("Transaction rolled back.")
+
+    def __histogram(self, counts: list[int]) -> str:
+        """ Returns latency histogram of all commands """
+        labels = ["< 1 ms", "< 10 ms", "< 100 ms", "< 1 s", ">= 1 s"]
+        top = max(counts) or 1
+        lines = [Colorizer.info("Latency of all commands:")]
+        for label, count in zip(labels, counts):
+            lines.append(f"{label:>9} | {'#' * round(count / top * HISTOGRAM_WIDTH):<{HISTOGRAM_WIDTH}} {count}")
+        return "\n".join(lines)
@@ -0,0 +1,234 @@
+from collections import UserDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Iterable
+
+from nestor.models.operation import Operation
+from nestor.utils.paused_gc import paused_gc
+
+class Book(UserDict):
+    """
+    Base class of books, records are stored by their key.
+    Every change of the book is applied as an operation. Listeners get lists of operations with their inverses,
+    e.g. to keep secondary structures in sync or to log changes for undo.
+    Changes of a transaction are sent to listeners as they are applied, so derived structures see them before commit,
+    Rollback sends inverse operations of reverted changes, the same objects which were sent as their inverses,
+    so logs of changes, e.g. for undo, recognize and drop the reverted changes.
+    Records are changed copy-on-write, attributes are replaced rather than mutated,
+    so a shallow copy of record attributes is enough to restore it.
+    """
+    KIND = None
+
+    # fields of records for full scans, see scan_row()
+    SCAN_FIELDS: tuple[str, ...] = ()
+    # fields of SCAN_FIELDS which may be too large for scan_row(), see scan_chunks()
+    CHUNKED_SCAN_FIELDS: tuple[str, ...] = ()
+    # fields of sorted listings, see sort_value()
+    SORT_FIELDS: tuple[str, ...] = ()
+
+    def __init__(self, *args, **kwargs):
+        self.__init_session()
+        super().__init__(*args, **kwargs)
+
+    def __init_session(self):
+        self.listeners: list[Callable[[list[tuple[Operation, Operation]]], None]] = []
+        # changes of the open transaction, None if there is no transaction
+        self.pending: list[tuple[Operation, Operation]] | None = None
+        # lengths of pending changes at start of each nested transaction, rollback reverts changes after the last one
+        self.savepoints: list[int] = []
+        # structures derived from records, e.g. scan chunks, they keep themselves in sync through listeners
+        self.caches: dict[str, object] = {}
+        self.caches_lock = Lock()
+
+    def __getstate__(self):
+        # listeners, transaction and caches belong to the session, they are not saved with the book
+        state = self.__dict__.copy()
+        for name in ("listeners", "pending", "savepoints", "caches", "caches_lock"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_session()
+
+    @staticmethod
+    def key_of(record) -> str:
+        """Return key of the record."""
+        raise NotImplementedError
+
+    @staticmethod
+    def set_key(record, key: str) -> None:
+        """Change key of the record, e.g. its name."""
+        raise NotImplementedError
+
+    @staticmethod
+    def scan_row(record) -> tuple[str, ...]:
+        """Return values of SCAN_FIELDS of the record as strings."""
+        raise NotImplementedError
+
+    def scan_chunks(self, record, field: str) -> Iterable[str] | None:
+        """Return text of the field by chunks if scan_row() has only a part of it, e.g. preview of large content, None otherwise."""
+        return None
+
+    @staticmethod
+    def sort_value(record, field: str):
+        """Return value of the field to sort records by, None if the record has no value."""
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_sort_value(field: str, text: str):
+        """Return value of the field given by user, e.g. a bound of sorted listing."""
+        return text.casefold()
+
+    def cache(self, name: str, factory: Callable[["Book"], object]):
+        """Return structure derived from records by its name, factory makes it from the book on first use."""
+        # read-only commands of a server run concurrently
+        with self.caches_lock:
+            value = self.caches.get(name)
+            if value is None:
+                value = self.caches[name] = factory(self)
+            return value
+
+    def __apply(self, operation: Operation) -> Operation:
+        """Apply operation to the book and return the inverse operation."""
+        key, value = operation.key, operation.value
+        match operation.action:
+            case Operation.ADD:
+                previous = self.data.get(key)
+                self.data[key] = value
+                return Operation(self.KIND, Operation.ADD, key, previous) if previous is not None else Operation(self.KIND, Operation.DELETE, key)
+            case Operation.DELETE:
+                return Operation(self.KIND, Operation.ADD, key, self.data.pop(key))
+            case Operation.RENAME:
+                record = self.data[key]
+                # record validates the new key before the book is changed
+                self.set_key(record, value)
+                del self.data[key]
+                self.data[value] = record
+                return Operation(self.KIND, Operation.RENAME, value, key)
+            case Operation.EDIT:
+                attributes = vars(self.data[key])
+                inverse = Operation(self.KIND, Operation.EDIT, key, attributes.copy())
+                attributes.clear()
+                attributes.update(value)
+                return inverse
+            case _:
+                raise ValueError(f"Unknown operation '{operation.action}'")
+
+    def apply(self, operation: Operation) -> Operation:
+        """Apply operation to the book, notify listeners and return the inverse operation."""
+        inverse = self.__apply(operation)
+        self.notify(operation, inverse)
+        return inverse
+
+    def notify(self, operation: Operation, inverse: Operation) -> None:
+        """Send applied operation and its inverse to listeners, it's kept for rollback in a transaction."""
+        self.notify_all([(operation, inverse)])
+
+    def notify_all(self, changes: list[tuple[Operation, Operation]]) -> None:
+        """Send applied operations with their inverses to listeners in one list, e.g. changes of a bulk edit."""
+        if not changes:
+            return
+        if self.pending is not None:
+            self.pending.extend(changes)
+        for listener in self.listeners:
+            listener(changes)
+
+    def begin(self) -> None:
+        """Start transaction, a nested transaction is a savepoint of the outer one."""
+        if self.pending is None:
+            self.pending = []
+        self.savepoints.append(len(self.pending))
+
+    def commit(self) -> None:
+        """Finish transaction, changes of a nested one become part of the outer one."""
+        if not self.savepoints:
+            raise RuntimeError("No transaction to commit")
+        self.savepoints.pop()
+        if not self.savepoints:
+            self.pending = None
+
+    def rollback(self) -> None:
+        """Revert changes of the transaction since its start, changes of outer transactions are kept."""
+        if not self.savepoints:
+            raise RuntimeError("No transaction to roll back")
+        savepoint = self.savepoints.pop()
+        changes = self.pending[savepoint:]
+        del self.pending[savepoint:]
+        if not self.savepoints:
+            self.pending = None
+        reverted = [(inverse, self.__apply(inverse)) for _, inverse in reversed(changes)]
+        if reverted:
+            for listener in self.listeners:
+                listener(reverted)
+
+    def in_transaction(self) -> bool:
+        return bool(self.savepoints)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run block in transaction, e.g. for bulk changes.
+        Any error rolls back changes of the block, changes of an outer transaction are kept.
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def add(self, record) -> None:
+        """Add record to the book, replacing record with the same key."""
+        self.apply(Operation(self.KIND, Operation.ADD, self.key_of(record), record))
+
+    def delete(self, key: str) -> None:
+        """Delete record from the book by key."""
+        self.apply(Operation(self.KIND, Operation.DELETE, key))
+
+    def rename(self, key: str, new_key: str) -> None:
+        """Change key of the record in place, without copying the record."""
+        self.apply(Operation(self.KIND, Operation.RENAME, key, new_key))
+
+    @contextmanager
+    def edit(self, key: str):
+        """
+        Yield record to change its attributes, the change is sent to listeners as an operation.
+        Changes made before an error are sent too, so they can be undone.
+        """
+        record = self.data[key]
+        before = vars(record).copy()
+        try:
+            yield record
+        finally:
+            after = vars(record).copy()
+            if after != before:
+                self.notify(Operation(self.KIND, Operation.EDIT, key, after), Operation(self.KIND, Operation.EDIT, key, before))
+
+    def edit_many(self, keys: Iterable[str], change: Callable) -> int:
+        """
+        Apply change to records with given keys in one transaction, any error rolls back all of them.
+        Returns number of changed records.
+        """
+        changes = []
+        # bulk change allocates a lot, cyclic garbage collector would repeatedly walk the whole book
+        with paused_gc(), self.transaction():
+            try:
+                for key in keys:
+                    record = self.data[key]
+                    attributes = vars(record)
+                    before = attributes.copy()
+                    try:
+                        change(record)
+                    finally:
+                        if attributes != before:
+                            changes.append((Operation(self.KIND, Operation.EDIT, key, attributes.copy()), Operation(self.KIND, Operation.EDIT, key, before)))
+            finally:
+                # listeners get changes in one list, before an error rolls them back
+                self.notify_all(changes)
+        return len(changes)
+
+    def find(self, key: str):
+        """Find record by key, return None if not found."""
+        return self.data.get(key)
@@ -1,9 +1,11 @@
+import copy
 import re
-from collections import UserDict
 from datetime import datetime, timedelta, date
 
+from nestor.models.book import Book
 from nestor.models.constants import EMPTY_FIELD_VALUE
 from nestor.models.exceptions import AddressValueError, NameValueError, PhoneValueError, BirthdayValueError, EmailValueError
+from nestor.utils.value_pool import ValuePool
 
 class Field:
     """Base class for fields."""
@@ -184,27 +186,55 @@ class Country(Field):
         
         self._value = value
         
+# cities, states and countries repeat across addresses, their fields are shared
+CITIES = ValuePool(City)
+STATES = ValuePool(State)
+COUNTRIES = ValuePool(Country)
+
 class Address:
+    """
+    Class representing address of a contact.
+    City, state and country fields are shared between addresses through value pools.
+    """
+    POOLED_FIELDS = (("city", CITIES), ("state", STATES), ("country", COUNTRIES))
+
     def __init__(self, street: str = None, city: str = None, state: str = None, zip_code: str = None, country: str = None):
         self.street = Street(street) if street else None
-        self.city = City(city) if city else None
-        self.state = State(state) if state else None
+        self.city = CITIES.get(city) if city else None
+        self.state = STATES.get(state) if state else None
         self.zip_code = ZipCode(zip_code) if zip_code else None
-        self.country = Country(country) if country else None
+        self.country = COUNTRIES.get(country) if country else None
 
     def edit(self, street: str = None, city: str = None, state: str = None, zip_code: str = None, country: str = None):
         self.street = Street(street) if street else self.street
-        self.city = City(city) if city else self.city
-        self.state = State(state) if state else self.state
+        self.city = CITIES.get(city) if city else self.city
+        self.state = STATES.get(state) if state else self.state
         self.zip_code = ZipCode(zip_code) if zip_code else self.zip_code
-        self.country = Country(country) if country else self.country
+        self.country = COUNTRIES.get(country) if country else self.country
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # loaded fields join the pools, so new addresses share them; fields of data saved before pools become shared
+        for name, pool in Address.POOLED_FIELDS:
+            field = state.get(name)
+            if field is not None:
+                setattr(self, name, pool.share(field.value, field))
+
+    def __copy__(self):
+        # fields are shared, they are replaced rather than changed
+        address = Address.__new__(Address)
+        address.__dict__.update(self.__dict__)
+        return address
 
     def __str__(self):
         fields: list[Field] = [self.street, self.city, self.state, self.zip_code, self.country]
         return ', '.join([str(f) for f in fields if f is not None])
     
 class Contact:
-    """Contact class for storing contact information."""
+    """
+    Contact class for storing contact information.
+    Mutators replace fields and lists instead of changing them in place, see Book.
+    """
     def __init__(self, name, phones=None, email=None, birthday=None):
         self.name = Name(name)
         self.phones = [Phone(p) for p in phones] if phones else []
@@ -221,13 +251,11 @@ class Contact:
 
     def add_phone(self, phone: str) -> None:
         """Add phone to record if it's valid, otherwise handle ValueError."""
-        self.phones.append(Phone(phone))
+        self.phones = [*self.phones, Phone(phone)]
 
     def edit_phone(self, old_phone: str, new_phone: str) -> None:
         """Edit phone in record if it exists."""
-        for phone in self.phones:
-            if phone.value == old_phone:
-                phone.value = new_phone
+        self.phones = [Phone(new_phone) if p.value == old_phone else p for p in self.phones]
 
     def remove_phone(self, phone: str) -> None:
         """Remove phone from record if it exists."""
@@ -261,40 +289,97 @@ class Contact:
         if not self.address:
             self.address = Address(street, city, state, zip_code, country)
         else:
-            self.address.edit(street, city, state, zip_code, country)
+            address = copy.copy(self.address)
+            address.edit(street, city, state, zip_code, country)
+            self.address = address
 
     def remove_address(self):
         """Remove address from record."""
         self.address = None
+
+    def merge(self, other: "Contact") -> None:
+        """Add phones of other contact, take its email, birthday and address where this contact has none."""
+        phones = {phone.value for phone in self.phones}
+        self.phones = [*self.phones, *(phone for phone in other.phones if phone.value not in phones)]
+        self.email = self.email or other.email
+        self.birthday = self.birthday or other.birthday
+        self.address = self.address or other.address
     
 
-class ContactsBook(UserDict):
+class ContactsBook(Book):
     """Class representing a contacts book."""
-    def add(self, record: Contact) -> None:
-        """Add record to address book."""
-        self.data[record.name.value] = record
-    
-    def delete(self, name: str) -> None:
-        """Delete record from address book by name."""
-        del self.data[name]
-        
-    def find(self, name: str) -> Contact | None:
-        """Find record in address book by name, return None if not found."""
-        if name in self.data:
-            return self.data[name]
-        return None
-    
+    KIND = "contacts"
+    SCAN_FIELDS = ("name", "phones", "email", "birthday", "address")
+    SORT_FIELDS = ("name", "birthday", "city")
+
+    @staticmethod
+    def key_of(record: Contact) -> str:
+        return record.name.value
+
+    @staticmethod
+    def set_key(record: Contact, key: str) -> None:
+        record.rename(key)
+
+    @staticmethod
+    def scan_row(record: Contact) -> tuple[str, ...]:
+        return (
+            record.name.value,
+            "; ".join(phone.value for phone in record.phones),
+            record.email.value if record.email else "",
+            str(record.birthday) if record.birthday else "",
+            str(record.address) if record.address else "",
+        )
+
+    @staticmethod
+    def sort_value(record: Contact, field: str):
+        match field:
+            case "name":
+                return record.name.value.casefold()
+            case "birthday":
+                return record.birthday.value if record.birthday else None
+            case "city":
+                return record.address.city.value.casefold() if record.address and record.address.city else None
+        raise ValueError(f"Unknown sort field '{field}'")
+
+    @staticmethod
+    def parse_sort_value(field: str, text: str):
+        if field == "birthday":
+            return Birthday(text).value
+        return text.casefold()
+
+    def merge(self, key: str, other_key: str) -> None:
+        """Merge contact with other_key into contact with key and delete it, in one transaction."""
+        with self.transaction():
+            with self.edit(key) as contact:
+                contact.merge(self.data[other_key])
+            self.delete(other_key)
+
     def search(self, search_str: str) -> list[Contact]:
         """Search records in address book by name, email and address."""
-
-        result = []
-        for record in self.data.values():
-            if search_str.lower() in str(record.name).lower() or \
-                (record.email and search_str.lower() in record.email.value.lower()) or \
-                    (record.address and search_str.lower() in str(record.address).lower()):
-                result.append(record)
-        return result
+        search_str = search_str.lower()
+        return [record for record in self.data.values() if self.matches_search(record, search_str)]
+
+    def matches_search(self, record: Contact, search_str: str) -> bool:
+        """Return True if name, email or address contains lowercase search string, records matching a string match its prefixes too."""
+        return search_str in str(record.name).lower() or \
+            bool(record.email and search_str in record.email.value.lower()) or \
+            bool(record.address and search_str in str(record.address).lower())
     
+    @staticmethod
+    def birthday_in_year(birthdate: date, year: int) -> date:
+        """Return birthday date in given year, 29 February is celebrated on 1 March in non-leap years."""
+        try:
+            return birthdate.replace(year=year)
+        except ValueError:
+            return date(year, 3, 1)
+
+    @staticmethod
+    def congratulation_date(birthday: date) -> date:
+        """Return date to congratulate on given birthday, birthdays on weekend are congratulated on Monday."""
+        if birthday.weekday() >= 5:
+            return birthday + timedelta(days=(7 - birthday.weekday()))
+        return birthday
+
     def get_upcoming_birthdays(self, days: int, start_days: int = 0) -> dict:
         """Return dict of contacts with upcoming birthdays within the given number of days starting from start_days."""
         today = datetime.today().date()
@@ -309,20 +394,16 @@ class ContactsBook(UserDict):
             birthdate: datetime = record.birthday.value
             name: str = record.name.value
             # Calculate this year's birthday
-            birthdate_this_year = birthdate.replace(year=today.year)
+            birthdate_this_year = ContactsBook.birthday_in_year(birthdate, today.year)
             # If this year's birthday in past, calculate next year's birthday
             if birthdate_this_year < today:
-                birthdate_this_year = birthdate.replace(year=today.year + 1)
+                birthdate_this_year = ContactsBook.birthday_in_year(birthdate, today.year + 1)
 
             # Calculate days to birthday
             days_to_birthday = (birthdate_this_year - today).days
 
             if start_days <= days_to_birthday <= start_days + days:
-                congratulation_date = birthdate_this_year
-                # If congratulation date is weekend, calculate next week's date
-                if birthdate_this_year.weekday() >= 5:
-                    congratulation_date += timedelta(days=(7 - congratulation_date.weekday()))
                 # Add user to upcoming birthdays dict
-                upcoming_birthdays[name] = congratulation_date
+                upcoming_birthdays[name] = ContactsBook.congratulation_date(birthdate_this_year)
 
         return upcoming_birthdays
@@ -1,6 +1,14 @@
-from collections import UserDict
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+from weakref import WeakKeyDictionary
+
+from nestor.models.book import Book
 from nestor.models.contacts_book import Field
 from nestor.models.exceptions import TitleValueError, ContentValueError
+from nestor.models.operation import Operation
+from nestor.utils.text_delta import apply_delta, make_delta
+from nestor.utils.value_pool import ValuePool
 
 
 class Title(Field):
@@ -47,37 +55,94 @@ class Content(Field):
         self._value = value
 
 
+class LargeContent(Field):
+    """
+    Class representing content of a large note.
+    Text is kept in chunk store of the data file, record has references to chunks and a short preview as value.
+    """
+
+    PREVIEW_LENGTH = 100
+
+    def __init__(self, refs: list[tuple[int, int]], length: int, preview: str):
+        self.refs = refs
+        self.length = length
+        self._value = preview
+
+    def __str__(self):
+        return f"{self._value}... ({self.length} symbols, see show-note)"
+
+    @property
+    def value(self):
+        return self._value
+
+    @staticmethod
+    def write(store, chunks: Iterable[str]) -> "LargeContent":
+        """Append text chunks to the store one by one, return content referencing them."""
+        refs, length, preview = [], 0, ""
+        for chunk in chunks:
+            if not preview:
+                # newlines would break rows of tables
+                preview = " ".join(chunk[:LargeContent.PREVIEW_LENGTH].split())
+            refs.append(store.append(chunk))
+            length += len(chunk)
+        return LargeContent(refs, length, preview)
+
+
+# tags repeat across notes, their strings are shared
+TAGS = ValuePool(str)
+
+
 class Note:
-    """Class representing a record for NotesBook."""
+    """
+    Class representing a record for NotesBook.
+    Mutators replace fields and lists instead of changing them in place, see Book.
+    """
 
     def __init__(self, title, content=None, tags=None):
         """Initialize a new Note."""
         self.title = Title(title)
-        self.tags = tags if tags else []  # Initialize tags
+        self.tags = [TAGS.get(tag) for tag in tags] if tags else []  # Initialize tags
         self.content = Content(content) if content else None  # Initialize note content
 
     def edit_content(self, content: str):
         """Edit the content of the note."""
         self.content = Content(content) if content else None
 
+    def set_large_content(self, content: LargeContent):
+        """Replace the content with a large content kept in chunk store."""
+        self.content = content
+
     def edit_title(self, title: str):
         """Edit the title of the note."""
         self.title = Title(title) if title else None
 
     def add_tags(self, tags: list[str]):
         """Add a new tag to the note if it does not already exist."""
-        for tag in tags:
-            if tag not in self.tags:
-                self.tags.append(tag)
+        self.tags = [*self.tags, *(TAGS.get(tag) for tag in dict.fromkeys(tags) if tag not in self.tags)]
 
     def edit_tags(self, tags: list[str]):
         """Edit a tags for the note if it exists."""
-        self.tags = tags if tags else []
+        self.tags = [TAGS.get(tag) for tag in tags] if tags else []
 
     def delete_tags(self):
         """Delete a tag from the note if it exists."""
         self.tags = []
 
+    @staticmethod
+    def from_attributes(attributes: dict) -> "Note":
+        """Return note with given attributes, e.g. of a previous version."""
+        note = Note.__new__(Note)
+        note.__dict__.update(attributes)
+        return note
+
+    def same_version(self, other: "Note") -> bool:
+        """Return True if notes have the same title, tags and content."""
+        if self.title.value != other.title.value or self.tags != other.tags:
+            return False
+        if isinstance(self.content, LargeContent) or isinstance(other.content, LargeContent):
+            return self.content is other.content
+        return (self.content.value if self.content else None) == (other.content.value if other.content else None)
+
     def __str__(self):
         """Return a string representation of the note."""
 
@@ -86,31 +151,281 @@ class Note:
         return f"Title: {self.title}, Tags: {tags_str}, \nContent: {content_str}"
 
 
-class NotesBook(UserDict):
+class Revision:
+    """
+    Class representing a previous version of a note.
+    Content of keyframes is kept whole, otherwise delta is kept against content of the next version,
+    delta is None if content is the same.
+    """
+
+    # revisions are pickled as tuples, so history adds little to the data file
+    __slots__ = ("number", "timestamp", "title", "tags", "keyframe", "content", "delta")
+
+    def __init__(self, number: int, title: str, tags: list[str], keyframe: bool, content=None, delta=None):
+        self.number = number
+        self.timestamp = int(time.time())
+        self.title = title
+        self.tags = tags
+        self.keyframe = keyframe
+        self.content = content
+        self.delta = delta
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in Revision.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(Revision.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def saved_at(self) -> datetime:
+        """Return when the version was replaced."""
+        return datetime.fromtimestamp(self.timestamp)
+
+
+class NoteHistory:
+    """
+    Class representing previous versions of a note, oldest first.
+    Text content is kept as deltas with full keyframes between them, so any version is rebuilt from a few deltas.
+    Large content is kept by reference, its chunks are never changed.
+    """
+
+    # revisions kept per note, older revisions are dropped
+    MAX_REVISIONS = 50
+    # every n-th revision keeps full content
+    KEYFRAME_INTERVAL = 10
+
+    __slots__ = ("revisions", "next_number")
+
+    def __init__(self):
+        self.revisions: list[Revision] = []
+        self.next_number = 1
+
+    def __getstate__(self):
+        return self.revisions, self.next_number
+
+    def __setstate__(self, state):
+        self.revisions, self.next_number = state
+
+    def add(self, title: str, tags: list[str], content: Content | LargeContent | None, next_content: Content | LargeContent | None):
+        """Add version replaced by the next one, next content is content of the note or of the next revision."""
+        number = self.next_number
+        self.next_number += 1
+
+        # deltas are made between text contents only
+        if not (isinstance(content, Content) and isinstance(next_content, Content)) or number % NoteHistory.KEYFRAME_INTERVAL == 0:
+            revision = Revision(number, title, tags, True, content=content)
+        elif content.value == next_content.value:
+            revision = Revision(number, title, tags, False)
+        else:
+            revision = Revision(number, title, tags, False, delta=make_delta(next_content.value, content.value))
+
+        self.revisions.append(revision)
+        # the oldest revision is not a base of others
+        if len(self.revisions) > NoteHistory.MAX_REVISIONS:
+            del self.revisions[0]
+
+    def find(self, number: int) -> int | None:
+        """Return index of the revision by its number."""
+        return next((index for index, revision in enumerate(self.revisions) if revision.number == number), None)
+
+    def content_at(self, index: int, current_content: Content | LargeContent | None) -> Content | LargeContent | None:
+        """Return content of the revision, it's rebuilt from the nearest next keyframe or the current content."""
+        base = index
+        while base < len(self.revisions) and not self.revisions[base].keyframe:
+            base += 1
+        content = self.revisions[base].content if base < len(self.revisions) else current_content
+        if base == index:
+            return content
+
+        text = content.value
+        for revision in reversed(self.revisions[index:base]):
+            if revision.delta is not None:
+                text = apply_delta(text, revision.delta)
+        return Content(text) if text else None
+
+
+class NotesBook(Book):
     """Class representing a NotesBook."""
+    KIND = "notes"
+    SCAN_FIELDS = ("title", "content", "tags")
+    # content of large notes is scanned chunk by chunk, scan rows have its preview
+    CHUNKED_SCAN_FIELDS = ("content",)
+    SORT_FIELDS = ("title",)
+
+    def __init__(self, *args, **kwargs):
+        # chunk store of large notes, it's attached by serializer when data is loaded
+        self.store = None
+        # number of the chunk file of the data file, compaction of chunks writes the next one
+        self.chunks_generation = 0
+        # previous versions of notes by title, kept apart from notes, so lists don't walk them
+        self.history: dict[str, NoteHistory] = {}
+        # histories of notes before changes of the open transaction by id of inverse operation, rollback restores them
+        self.history_savepoints: dict[int, tuple[Operation, dict[str, NoteHistory | None]]] = {}
+        # histories of deleted notes by the operation adding the note back, e.g. undo of the delete,
+        # a history is dropped with its operation once the delete can't be undone or rolled back
+        self.deleted_history: WeakKeyDictionary[Operation, NoteHistory | None] = WeakKeyDictionary()
+        super().__init__(*args, **kwargs)
+        self.listeners.append(self.__record_history)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("store", None)
+        state.pop("history_savepoints", None)
+        state.pop("deleted_history", None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.store = None
+        self.history_savepoints = {}
+        self.deleted_history = WeakKeyDictionary()
+        # books saved before revisions were kept or chunks were compacted
+        self.__dict__.setdefault("history", {})
+        self.__dict__.setdefault("chunks_generation", 0)
+        self.listeners.append(self.__record_history)
+
+    def commit(self) -> None:
+        super().commit()
+        if not self.in_transaction():
+            self.history_savepoints.clear()
+
+    def __add_revision(self, key: str, note: Note) -> None:
+        """Add current version of the note to history under the key, next version is the one in the book."""
+        current = self.data.get(key)
+        self.history.setdefault(key, NoteHistory()).add(note.title.value, note.tags, note.content, current.content if current else None)
+
+    def __copy_history(self, key: str) -> NoteHistory | None:
+        history = self.history.get(key)
+        if history is None:
+            return None
+        copy = NoteHistory()
+        copy.revisions, copy.next_number = list(history.revisions), history.next_number
+        return copy
+
+    def __record_history(self, changes: list[tuple[Operation, Operation]]) -> None:
+        for operation, inverse in changes:
+            # a rolled back change takes back versions it added
+            savepoint = self.history_savepoints.pop(id(operation), None)
+            if savepoint is not None:
+                for key, history in savepoint[1].items():
+                    if history is None:
+                        self.history.pop(key, None)
+                    else:
+                        self.history[key] = history
+                continue
+            if self.in_transaction():
+                self.history_savepoints[id(inverse)] = (inverse, {key: self.__copy_history(key) for key in operation.keys()})
+
+            match operation.action:
+                case Operation.EDIT:
+                    previous = Note.from_attributes(inverse.value)
+                    # fields set again to the same values don't make a version
+                    if not previous.same_version(self.data[operation.key]):
+                        self.__add_revision(operation.key, previous)
+                case Operation.RENAME:
+                    history = self.history.pop(operation.key, None)
+                    if history:
+                        self.history[operation.value] = history
+                    else:
+                        self.history.pop(operation.value, None)
+                    previous = Note.from_attributes(vars(self.data[operation.value]))
+                    previous.title = Title(operation.key)
+                    self.__add_revision(operation.value, previous)
+                case Operation.DELETE:
+                    # history comes back if the note is added back by the inverse operation
+                    self.deleted_history[inverse] = self.history.pop(operation.key, None)
+                case Operation.ADD if inverse.action == Operation.ADD:
+                    # replaced note, e.g. by import-note, the replacing one goes on from its history
+                    self.__add_revision(operation.key, inverse.value)
+                case Operation.ADD:
+                    # a new note with the title of a deleted one doesn't get its versions
+                    history = self.deleted_history.pop(operation, None)
+                    if history is None:
+                        self.history.pop(operation.key, None)
+                    else:
+                        self.history[operation.key] = history
+
+    def get_history(self, title: str) -> NoteHistory | None:
+        """Return previous versions of the note."""
+        return self.history.get(title)
+
+    def large_contents(self) -> list[LargeContent]:
+        """
+        Return large contents of notes and of their previous versions, a content shared by both is returned once.
+        Deleted notes which can be added back by undo or rollback are included with their versions.
+        """
+        deleted = list(self.deleted_history.items())
+        contents = [note.content for note in self.data.values()] + [operation.value.content for operation, _ in deleted]
+        histories = list(self.history.values()) + [history for _, history in deleted if history is not None]
+        contents += [revision.content for history in histories for revision in history.revisions]
+        return list({id(content): content for content in contents if isinstance(content, LargeContent)}.values())
 
-    def add(self, note: Note):
-        """Add a Note to the NotesBook."""
-        self.data[note.title.value] = note
+    @staticmethod
+    def key_of(record: Note) -> str:
+        return record.title.value
 
-    def find(self, title: str) -> Note | None:
-        """Find a Note by its title."""
-        return self.data.get(title, None)
+    @staticmethod
+    def set_key(record: Note, key: str) -> None:
+        record.edit_title(key)
 
-    def delete(self, title: str):
-        """Delete a Note from the NotesBook by its title."""
-        del self.data[title]
+    @staticmethod
+    def scan_row(record: Note) -> tuple[str, ...]:
+        return (
+            record.title.value,
+            record.content.value if record.content else "",
+            "; ".join(record.tags),
+        )
+
+    def scan_chunks(self, record: Note, field: str) -> Iterator[str] | None:
+        if field == "content" and isinstance(record.content, LargeContent) and self.store is not None:
+            return self.store.read(record.content.refs)
+        return None
+
+    @staticmethod
+    def sort_value(record: Note, field: str):
+        if field == "title":
+            return record.title.value.casefold()
+        raise ValueError(f"Unknown sort field '{field}'")
 
     def search(self, search_str: str) -> list[Note]:
-        """Search records by title and content."""
-
-        result = []
-        for record in self.data.values():
-            if (search_str.lower() in str(record.title).lower() or
-                (search_str.lower() in str(record.content).lower()) or
-                (search_str.lower() in str(record.tags).lower())):
-                result.append(record)
-        return result
+        """Search records by title and content, content of large notes is read chunk by chunk."""
+        search_str = search_str.lower()
+        return [record for record in self.data.values() if self.matches_search(record, search_str)]
+
+    def matches_search(self, record: Note, search_str: str) -> bool:
+        """Return True if title, content or tags contain lowercase search string, records matching a string match its prefixes too."""
+        return (search_str in str(record.title).lower() or
+                search_str in str(record.content).lower() or
+                search_str in str(record.tags).lower() or
+                (isinstance(record.content, LargeContent) and self.__large_content_contains(record.content, search_str)))
+
+    def __large_content_contains(self, content: LargeContent, text: str) -> bool:
+        if self.store is None or not text:
+            return False
+        tail = ""
+        for chunk in self.store.read(content.refs):
+            window = tail + chunk.lower()
+            if text in window:
+                return True
+            # text may start at the end of a chunk and continue in the next one
+            tail = window[len(window) - len(text) + 1:]
+        return False
+
+    def read_lines(self, note: Note) -> Iterator[str]:
+        """Yield lines of the note content, large content is read chunk by chunk."""
+        if note.content is None:
+            return
+        if not isinstance(note.content, LargeContent):
+            yield from note.content.value.split("\n")
+            return
+
+        rest = ""
+        for chunk in self.store.read(note.content.refs):
+            lines = (rest + chunk).split("\n")
+            rest = lines.pop()
+            yield from lines
+        yield rest
 
 
     def __str__(self):
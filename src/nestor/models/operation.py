@@ -0,0 +1,34 @@
+from typing import Iterator
+
+class Operation:
+    """
+    Change of a single book record. Operations are plain data, so they can be applied, inverted,
+    logged for undo, saved or sent to another copy of the book.
+    book: str - kind of the book, 'contacts' or 'notes'
+    action: str - 'add', 'delete', 'rename' or 'edit'
+    key: str - key of the record, its name or title
+    value - record for 'add', new key for 'rename', record attributes for 'edit'
+    """
+
+    ADD = "add"
+    DELETE = "delete"
+    RENAME = "rename"
+    EDIT = "edit"
+
+    def __init__(self, book: str, action: str, key: str, value=None):
+        self.book = book
+        self.action = action
+        self.key = key
+        self.value = value
+
+    def keys(self) -> list[str]:
+        """ Returns keys of records changed by the operation, the old and the new key for 'rename' """
+        return [self.key, self.value] if self.action == Operation.RENAME else [self.key]
+
+    def __repr__(self):
+        return f"Operation({self.book!r}, {self.action!r}, {self.key!r})"
+
+def changed_keys(changes: list[tuple[Operation, Operation]]) -> Iterator[str]:
+    """ Yields keys of records changed by operations sent to book listeners, in order """
+    for operation, _ in changes:
+        yield from operation.keys()
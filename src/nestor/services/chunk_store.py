@@ -0,0 +1,40 @@
+import os
+from typing import Iterable, Iterator
+
+class ChunkStore:
+    """
+    Append-only file of text chunks, contents of large notes are kept there rather than in the data file.
+    Chunks are referenced by (offset, size) in bytes. They are never changed, so undo can bring old content back.
+    Chunks nobody refers to any more are dropped by copying the rest to a new file at the end of a session, see Serializer.save_data().
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def append(self, text: str) -> tuple[int, int]:
+        """ Appends chunk to the file, returns its reference """
+        data = text.encode("utf-8")
+        with open(self.filename, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        return offset, len(data)
+
+    def read(self, refs: list[tuple[int, int]]) -> Iterator[str]:
+        """ Yields chunks one by one, so content is never loaded as a whole """
+        with open(self.filename, "rb") as f:
+            for offset, size in refs:
+                f.seek(offset)
+                yield f.read(size).decode("utf-8")
+
+    def copy_to(self, refs: Iterable[tuple[int, int]], filename: str) -> dict[tuple[int, int], tuple[int, int]]:
+        """ Writes chunks to a new file in given order, returns their references in it by references in this file """
+        moved = {}
+        with open(self.filename, "rb") as source, open(filename, "wb") as target:
+            for offset, size in refs:
+                if (offset, size) in moved:
+                    continue
+                source.seek(offset)
+                moved[offset, size] = target.tell(), size
+                target.write(source.read(size))
+            target.flush()
+            os.fsync(target.fileno())
+        return moved
@@ -0,0 +1,30 @@
+import json
+import socket
+
+class DaemonError(Exception):
+    pass
+
+def call(socket_path: str, method: str, params: dict = None) -> object:
+    """ Sends JSON-RPC request to the server and returns the result """
+    request = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params or {}}
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            line = sock.makefile("rb").readline()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise DaemonError(f"Server is not running on {socket_path}, start it with 'nestor serve'") from e
+
+    if not line:
+        raise DaemonError("Server closed connection")
+
+    response = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"]["message"])
+    return response["result"]
+
+def execute(socket_path: str, command: str, args: list[str], inputs: list[str] = None) -> list[str]:
+    """ Runs command on the server and returns its output """
+    result = call(socket_path, "execute", {"command": command, "args": args, "inputs": inputs or []})
+    return result["output"]
@@ -1,6 +1,7 @@
+import os
+from functools import cache
 from typing import Callable
 from enum import Enum
-from colorama import Fore, Style
 
 class ColorizeType(Enum):
 	INFO = "info"
@@ -9,23 +10,54 @@ class ColorizeType(Enum):
 	SUCCESS = "success"
 	HIGHLIGHT = "highlight"
 
-def colorize(type: ColorizeType) -> Callable:
-	colors = {
+@cache
+def get_colors() -> dict[str, str]:
+	""" Returns color codes, colorama is imported on first use to keep startup fast """
+	from colorama import Fore, Style
+
+	return {
 		f"{ColorizeType.INFO.value}": Fore.BLUE,
 		f"{ColorizeType.WARNING.value}": Fore.YELLOW,
 		f"{ColorizeType.ERROR.value}": Fore.RED,
 		f"{ColorizeType.SUCCESS.value}": Fore.GREEN,
 		f"{ColorizeType.HIGHLIGHT.value}": Fore.MAGENTA,
+		"reset": Style.RESET_ALL,
 	}
-	def colorized(text: str):
-		return f"{colors[type.value]}{text}{Style.RESET_ALL}"
+
+class Message(str):
+	"""
+	Text of a status message, it's colored when colors are enabled
+	kind: str - ColorizeType value, e.g. 'error'
+	text: str - text without colors, for structured output
+	"""
+	def __new__(cls, text: str, kind: str = ColorizeType.INFO.value, colored: str = None):
+		message = super().__new__(cls, colored if colored is not None else text)
+		message.kind = kind
+		message.text = text
+		return message
+
+def colorize(type: ColorizeType) -> Callable:
+	def colorized(text: str) -> Message:
+		text = f"{text}"
+		if not Colorizer.enabled:
+			return Message(text, type.value)
+		colors = get_colors()
+		return Message(text, type.value, f"{colors[type.value]}{text}{colors['reset']}")
 
 	return colorized
 
 class Colorizer:
 	"""
-	Colorize text output with colorama
+	Colorize text output with colorama, text is left as is when colors are disabled
 	"""
+	# see https://no-color.org
+	enabled = not os.environ.get("NO_COLOR")
+
+	@staticmethod
+	def configure(stream) -> None:
+		""" Disables colors if output stream is not a terminal, e.g. redirected to a file, or NO_COLOR is set to a non-empty value """
+		Colorizer.enabled = not os.environ.get("NO_COLOR") and stream.isatty()
+
 	info = colorize(ColorizeType.INFO)
 	warn = colorize(ColorizeType.WARNING)
 	error = colorize(ColorizeType.ERROR)
@@ -0,0 +1,20 @@
+from prompt_toolkit.completion import Completer, WordCompleter, PathCompleter
+
+class ContextualCompleter(Completer):
+    def __init__(self, commands: list[str]):
+        # Define command completers
+        self.command_completer = WordCompleter(commands, ignore_case=True)
+        # Define path completer for file system paths
+        self.path_completer = PathCompleter()
+
+    def get_completions(self, document, complete_event):
+        text_before_cursor = document.text_before_cursor
+        words = text_before_cursor.split()
+
+        if len(words) == 1 and text_before_cursor.strip() == text_before_cursor:
+            # Provide command completions for the first word
+            return self.command_completer.get_completions(document, complete_event)
+        else:
+
+            # Provide path completions for subsequent words
+            return self.path_completer.get_completions(document, complete_event)
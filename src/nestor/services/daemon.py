@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import signal
+from datetime import date
+
+from nestor.services.client import DaemonError, call
+from nestor.services.colorizer import Colorizer
+from nestor.services.executor import CommandExecutor
+from nestor.services.reminders import Reminders, RemindersFile
+from nestor.services.scheduler import Scheduler
+from nestor.services.serializer import Serializer
+
+# seconds between saves of changed storage
+SAVE_INTERVAL = 30
+# seconds between checks whether the day changed and birthdays should be announced
+REMINDERS_INTERVAL = 60
+# bytes, longer request lines are refused and their connection is closed
+MAX_REQUEST_SIZE = 1 << 20
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+def error_response(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+def result_response(request_id, result) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+def is_strings(value) -> bool:
+    """ Returns True if optional parameter is a list of strings """
+    return value is None or isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+async def handle_request(line: bytes, executor: CommandExecutor) -> dict:
+    """
+    Handles one JSON-RPC request.
+    Methods:
+        ping() -> "pong"
+        execute(command: str, args: list[str], inputs: list[str]) -> {"output": list[str]}
+    """
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError:
+        return error_response(None, PARSE_ERROR, "Parse error")
+
+    if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+        return error_response(None, INVALID_REQUEST, "Invalid request")
+
+    request_id = request.get("id")
+    params = request.get("params") or {}
+    if not isinstance(params, dict):
+        return error_response(request_id, INVALID_PARAMS, "Params must be an object")
+
+    match request["method"]:
+        case "ping":
+            return result_response(request_id, "pong")
+        case "execute":
+            command = params.get("command")
+            if not isinstance(command, str) or not command:
+                return error_response(request_id, INVALID_PARAMS, "Command is required")
+            args, inputs = params.get("args"), params.get("inputs")
+            if not is_strings(args) or not is_strings(inputs):
+                return error_response(request_id, INVALID_PARAMS, "Args and inputs must be lists of strings")
+            # commands run in executor threads, reads run concurrently and writes wait for each other
+            try:
+                output = await asyncio.to_thread(executor.execute, command, args, inputs)
+            except Exception as e:
+                return error_response(request_id, INTERNAL_ERROR, f"Internal error: {e}")
+            return result_response(request_id, {"output": output})
+        case _:
+            return error_response(request_id, METHOD_NOT_FOUND, "Method not found")
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, executor: CommandExecutor) -> None:
+    """ Serves newline delimited JSON-RPC requests until client disconnects """
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            # the rest of too long line is still in the stream, next requests can't be found in it
+            except ValueError:
+                response = error_response(None, INVALID_REQUEST, f"Request is larger than {MAX_REQUEST_SIZE} bytes")
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+                break
+            if not line:
+                break
+            response = await handle_request(line, executor)
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(serializer: Serializer, socket_path: str, reminders_filename: str = None) -> None:
+    """
+    Keeps storage in memory and serves commands on unix socket until SIGINT or SIGTERM
+    reminders_filename: str - file to append birthday reminders to instead of printing them
+    """
+    if os.path.exists(socket_path):
+        try:
+            call(socket_path, "ping")
+            print(Colorizer.error(f"Server is already running on {socket_path}."))
+            return
+        # socket left by a server that didn't stop cleanly
+        except DaemonError:
+            os.unlink(socket_path)
+
+    storage = await asyncio.to_thread(serializer.load_data)
+    executor = CommandExecutor(storage)
+    serializer.warm_up_indexes(storage, executor.lock.read)
+
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_connection(reader, writer, executor),
+        path=socket_path,
+        limit=MAX_REQUEST_SIZE
+    )
+    os.chmod(socket_path, 0o600)
+
+    reminders = Reminders(storage.contacts_book)
+    reminders_file = RemindersFile(reminders_filename) if reminders_filename else None
+
+    def remind():
+        today = date.today()
+        # listeners of the book update the heap under write lock
+        with executor.lock.read():
+            messages = reminders.check(today)
+        if reminders_file:
+            reminders_file.write(today, messages)
+        else:
+            for message in messages:
+                print(Colorizer.info(message))
+
+    scheduler = Scheduler(on_error=lambda e: print(Colorizer.error(f"Background job failed: {e}")))
+    scheduler.every(SAVE_INTERVAL, lambda: executor.save(serializer))
+    scheduler.every(REMINDERS_INTERVAL, remind, immediately=True)
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    async with server:
+        scheduler.start()
+        print(Colorizer.highlight(f"Serving on {socket_path}, press Ctrl+C to stop."))
+        await stopped.wait()
+        await scheduler.stop()
+
+    await asyncio.to_thread(executor.close, serializer)
+    os.unlink(socket_path)
+    print(Colorizer.highlight("Server stopped."))
+
+def run_server(serializer: Serializer, socket_path: str, reminders_filename: str = None) -> None:
+    """ Runs the server """
+    asyncio.run(serve(serializer, socket_path, reminders_filename))
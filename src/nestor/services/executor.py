@@ -0,0 +1,64 @@
+from nestor.handlers.dispatcher import create_handlers, dispatch, get_read_only_commands
+from nestor.services.operation_log import OperationLog
+from nestor.services.serializer import Serializer, Storage
+from nestor.services.ui import ScriptedInterface
+from nestor.utils.rw_lock import ReadWriteLock
+
+class CommandExecutor:
+    """
+    Runs commands against shared storage from many threads.
+    Read-only commands run concurrently, commands that change storage are serialized.
+    Changes of all clients share one operation log and transaction, 'undo' reverts the last change of any client.
+    """
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self.lock = ReadWriteLock()
+        self.read_only_commands = set(get_read_only_commands())
+        self.dirty = False
+        self.log = OperationLog(storage)
+
+    def is_read_only(self, command: str) -> bool:
+        """ Returns True if command doesn't change storage """
+        return command in self.read_only_commands
+
+    def execute(self, command: str, args: list[str] = None, inputs: list[str] = None) -> list[str]:
+        """
+        Runs command and returns its output
+        inputs: list[str] - answers for fields of interactive commands
+        """
+        command = command.lower()
+        # handlers are cheap, each call gets its own to collect output separately
+        cli = ScriptedInterface(inputs)
+        handlers = create_handlers(self.storage, cli, self.log)
+
+        if self.is_read_only(command):
+            with self.lock.read():
+                dispatch(command, args or [], self.storage, cli, handlers)
+        else:
+            with self.lock.write():
+                dispatch(command, args or [], self.storage, cli, handlers, self.log)
+                self.dirty = True
+
+        return cli.outputs
+
+    def save(self, serializer: Serializer, compact: bool = False) -> None:
+        """
+        Saves storage if it was changed, writes wait until it's saved
+        compact: bool - drop unused chunks of large notes, see Serializer.save_data()
+        """
+        # compaction moves references of large notes, read-only commands can't read them meanwhile
+        with self.lock.write() if compact else self.lock.read():
+            # changes of open transaction are saved after commit
+            if not self.dirty or self.storage.in_transaction():
+                return
+            serializer.save_data(self.storage, compact)
+            self.dirty = False
+
+    def close(self, serializer: Serializer) -> None:
+        """ Rolls back transaction that was not committed and saves storage with its indexes, called when server stops """
+        with self.lock.write():
+            if self.storage.in_transaction():
+                self.storage.rollback()
+        self.save(serializer, compact=True)
+        with self.lock.read():
+            serializer.save_indexes(self.storage)
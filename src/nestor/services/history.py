@@ -0,0 +1,33 @@
+from typing import Iterable
+
+from prompt_toolkit.history import FileHistory
+
+class BoundedFileHistory(FileHistory):
+    """
+    Append-only file history that keeps the last max_size entries.
+
+    New entries are appended to the file. When the file holds more than max_size entries,
+    it is rewritten with the newest ones on next load, so its size stays bounded.
+    Like any prompt_toolkit history, it's loaded lazily in background on first prompt.
+    """
+    def __init__(self, filename: str, max_size: int = 1000):
+        super().__init__(filename)
+        self.max_size = max_size
+
+    def load_history_strings(self) -> Iterable[str]:
+        # newest entries come first
+        strings = list(super().load_history_strings())
+
+        if len(strings) > self.max_size:
+            strings = strings[:self.max_size]
+            self.__compact(strings)
+
+        return strings
+
+    def __compact(self, strings: list[str]) -> None:
+        """ Rewrites history file with given entries, in the format of FileHistory """
+        with open(self.filename, "wb") as f:
+            for string in reversed(strings):
+                f.write(b"\n")
+                for line in string.split("\n"):
+                    f.write(f"+{line}\n".encode("utf-8"))
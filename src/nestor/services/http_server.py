@@ -0,0 +1,204 @@
+import json
+import signal
+from itertools import islice
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Iterable
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from nestor.services.colorizer import Colorizer
+from nestor.services.executor import CommandExecutor
+from nestor.services.serializer import Serializer
+from nestor.utils.to_dict import to_dict
+
+# seconds between saves of changed storage
+SAVE_INTERVAL = 30
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# bytes, larger request bodies are refused without reading them
+MAX_BODY_SIZE = 1 << 20
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+def get_int(query: dict, name: str, default: int, min_value: int = 0, max_value: int = None) -> int:
+    """ Returns integer query parameter """
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError as e:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"'{name}' must be an integer") from e
+    if value < min_value:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"'{name}' must be at least {min_value}")
+    return min(value, max_value) if max_value else value
+
+def paginate(records: Iterable, total: int, query: dict) -> dict:
+    """
+    Returns page of records selected by 'offset' and 'limit' query parameters
+    records: Iterable - records in order, only the page of them is taken, e.g. values of the book without copying them
+    """
+    offset = get_int(query, "offset", 0)
+    limit = get_int(query, "limit", DEFAULT_LIMIT, 1, MAX_LIMIT)
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "items": [to_dict(record) for record in islice(records, offset, offset + limit)]
+    }
+
+def get_strings(body: dict, name: str) -> list[str] | None:
+    """ Returns optional list of strings from request body """
+    value = body.get(name)
+    if value is not None and (not isinstance(value, list) or not all(isinstance(item, str) for item in value)):
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"'{name}' must be a list of strings")
+    return value
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    REST API for contacts and notes.
+
+    GET  /contacts?q=&offset=&limit=  all contacts or search results
+    GET  /contacts/<name>             single contact
+    GET  /birthdays?days=7&start=0    upcoming birthdays
+    GET  /notes?q=&offset=&limit=     all notes or search results
+    POST /commands                    run command, body {"command": str, "args": [str], "inputs": [str]}
+    """
+    # keep-alive needs HTTP/1.1, every response has Content-Length
+    protocol_version = "HTTP/1.1"
+    # headers and body are sent in one packet, otherwise Nagle's algorithm delays keep-alive responses
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    executor: CommandExecutor = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+
+        try:
+            # response is sent after the lock is released, slow clients don't hold up writers
+            with self.executor.lock.read():
+                resource = self.get_resource(parts, query)
+        except HttpError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Internal error: {e}"})
+        else:
+            self.send_json(HTTPStatus.OK, resource)
+
+    def do_POST(self):
+        try:
+            if urlsplit(self.path).path.rstrip("/") != "/commands":
+                raise HttpError(HTTPStatus.NOT_FOUND, "Not found")
+            body = self.read_json()
+            command = body.get("command") if isinstance(body, dict) else None
+            if not isinstance(command, str) or not command:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Command is required")
+            args, inputs = get_strings(body, "args"), get_strings(body, "inputs")
+            # executor takes read or write lock depending on command
+            output = self.executor.execute(command, args, inputs)
+        except HttpError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Internal error: {e}"})
+        else:
+            self.send_json(HTTPStatus.OK, {"output": output})
+
+    def get_resource(self, parts: list[str], query: dict) -> dict | list:
+        """ Returns JSON for GET request, must be called with read lock """
+        storage = self.executor.storage
+
+        match parts:
+            case ["contacts"]:
+                search_str = query.get("q", [None])[0]
+                book = storage.contacts_book
+                if search_str:
+                    results = book.search(search_str)
+                    return paginate(results, len(results), query)
+                return paginate(book.data.values(), len(book.data), query)
+            case ["contacts", name]:
+                contact = storage.contacts_book.find(name)
+                if contact is None:
+                    raise HttpError(HTTPStatus.NOT_FOUND, "Contact not found.")
+                return to_dict(contact)
+            case ["birthdays"]:
+                days = get_int(query, "days", 7)
+                start_days = get_int(query, "start", 0)
+                birthdays = storage.contacts_book.get_upcoming_birthdays(days, start_days)
+                return [{"name": name, "date": date.isoformat()} for name, date in birthdays.items()]
+            case ["notes"]:
+                search_str = query.get("q", [None])[0]
+                book = storage.notes_book
+                if search_str:
+                    results = book.search(search_str)
+                    return paginate(results, len(results), query)
+                return paginate(book.data.values(), len(book.data), query)
+            case _:
+                raise HttpError(HTTPStatus.NOT_FOUND, "Not found")
+
+    def read_json(self) -> object:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length") from e
+        if length < 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            # body is left unread, the connection can't be kept alive
+            self.close_connection = True
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body is larger than {MAX_BODY_SIZE} bytes")
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except json.JSONDecodeError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid JSON") from e
+
+    def send_json(self, status: HTTPStatus, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # request log would flood the terminal under load
+        pass
+
+def stop_server(signum, frame):
+    raise KeyboardInterrupt()
+
+def run_http_server(serializer: Serializer, host: str, port: int) -> None:
+    """ Serves REST API until Ctrl+C or SIGTERM, each connection is handled in its own thread """
+    signal.signal(signal.SIGTERM, stop_server)
+    # command output is put into JSON strings, escape codes of colors don't belong there
+    Colorizer.enabled = False
+
+    executor = CommandExecutor(serializer.load_data())
+    serializer.warm_up_indexes(executor.storage, executor.lock.read)
+    handler = type("Handler", (ApiRequestHandler,), {"executor": executor})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    stopped = Event()
+
+    def save_periodically():
+        while not stopped.wait(SAVE_INTERVAL):
+            executor.save(serializer)
+
+    saver = Thread(target=save_periodically, daemon=True)
+    saver.start()
+
+    print(Colorizer.highlight(f"Serving on http://{host}:{port}, press Ctrl+C to stop."))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        saver.join()
+        server.server_close()
+        executor.close(serializer)
+        print(Colorizer.highlight("Server stopped."))
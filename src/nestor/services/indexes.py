@@ -0,0 +1,296 @@
+import pickle
+import re
+from bisect import bisect_left, insort
+from difflib import SequenceMatcher
+from threading import Lock, Thread
+from typing import Callable, ContextManager, Iterable
+
+from nestor.models.contacts_book import Contact, ContactsBook
+from nestor.models.operation import Operation, changed_keys
+from nestor.utils.paused_gc import paused_gc
+from nestor.utils.phonetic import double_metaphone, soundex
+
+WORD_REGEXP = re.compile(r"\w+")
+
+class FieldIndex:
+    """
+    Index of record keys by values of a field, e.g. contact names by phone.
+    Values are kept sorted too, so values with a prefix are found by binary search.
+    """
+    def __init__(self, name: str, values_of: Callable[[object], list[str]]):
+        self.name = name
+        self.values_of = values_of
+        self.postings: dict[str, set[str]] = {}
+        self.sorted_values: list[str] = []
+        # indexed values of each record, to remove them when the record changes
+        self.record_values: dict[str, tuple[str, ...]] = {}
+        self.size = 0
+
+    def build(self, records: dict) -> None:
+        self.postings = {}
+        self.record_values = {}
+        self.add(records.items())
+        self.finish()
+
+    def add(self, records: Iterable[tuple[str, object]]) -> None:
+        """ Adds (key, record) pairs which are not indexed yet, e.g. a batch of records, finish() makes the index usable """
+        for key, record in records:
+            values = self.record_values[key] = tuple(dict.fromkeys(self.values_of(record)))
+            for value in values:
+                self.postings.setdefault(value, set()).add(key)
+
+    def finish(self) -> None:
+        """ Sorts values of added records """
+        self.sorted_values = sorted(self.postings)
+        self.size = sum(len(values) for values in self.record_values.values())
+
+    def update(self, key: str, record) -> None:
+        """ Makes entries of the record key match the record, None if it was deleted """
+        old = self.record_values.pop(key, ())
+        new = tuple(dict.fromkeys(self.values_of(record))) if record is not None else ()
+        if old == new:
+            if new:
+                self.record_values[key] = new
+            return
+
+        for value in old:
+            keys = self.postings[value]
+            keys.discard(key)
+            if not keys:
+                del self.postings[value]
+                del self.sorted_values[bisect_left(self.sorted_values, value)]
+        for value in new:
+            keys = self.postings.get(value)
+            if keys is None:
+                keys = self.postings[value] = set()
+                insort(self.sorted_values, value)
+            keys.add(key)
+        if new:
+            self.record_values[key] = new
+        self.size += len(new) - len(old)
+
+    def __range(self, prefix: str) -> tuple[int, int]:
+        return bisect_left(self.sorted_values, prefix), bisect_left(self.sorted_values, prefix + "\U0010ffff")
+
+    def lookup(self, value: str) -> set[str]:
+        """ Returns keys of records with the value """
+        return self.postings.get(value, set())
+
+    def lookup_prefix(self, prefix: str) -> set[str]:
+        """ Returns keys of records with a value starting with the prefix """
+        start, end = self.__range(prefix)
+        result = set()
+        for value in self.sorted_values[start:end]:
+            result |= self.postings[value]
+        return result
+
+    def estimate(self, value: str) -> int:
+        return len(self.postings.get(value, ()))
+
+    def estimate_prefix(self, prefix: str) -> int:
+        """ Returns estimated number of records with a value starting with the prefix, from average size of postings """
+        start, end = self.__range(prefix)
+        if not self.sorted_values:
+            return 0
+        return round((end - start) * self.size / len(self.sorted_values))
+
+def contact_names(contact: Contact) -> list[str]:
+    return [contact.name.value.casefold()]
+
+def contact_phones(contact: Contact) -> list[str]:
+    return [phone.value for phone in contact.phones]
+
+def contact_emails(contact: Contact) -> list[str]:
+    return [contact.email.value.casefold()] if contact.email else []
+
+def contact_address_parts(contact: Contact) -> list[str]:
+    """ Returns street, city, state, zip code and country which are set """
+    if not contact.address:
+        return []
+    parts = (contact.address.street, contact.address.city, contact.address.state, contact.address.zip_code, contact.address.country)
+    return [str(part).casefold() for part in parts if part and str(part)]
+
+def contact_birthdays(contact: Contact) -> list[str]:
+    """ Returns birthday bucket 'MM-DD', so a month is a prefix of its buckets """
+    return [contact.birthday.value.strftime("%m-%d")] if contact.birthday else []
+
+def word_sounds(word: str) -> set[str]:
+    """ Returns Soundex and Double Metaphone codes of the word, e.g. 'S:S530' and 'M:SM0' for 'Smith' """
+    codes = {f"M:{code}" for code in double_metaphone(word) if code}
+    if codes:
+        codes.add(f"S:{soundex(word)}")
+    return codes
+
+def contact_name_sounds(contact: Contact) -> list[str]:
+    """ Returns phonetic codes of each word of the name """
+    return [code for word in WORD_REGEXP.findall(contact.name.value.casefold()) for code in word_sounds(word)]
+
+# values of indexed fields, 'sound' is for names sounding alike
+INDEXED_FIELDS = {
+    "name": contact_names,
+    "phone": contact_phones,
+    "email": contact_emails,
+    "address": contact_address_parts,
+    "birthday": contact_birthdays,
+    "sound": contact_name_sounds,
+}
+
+# version of saved indexes, files of other versions are ignored
+INDEXES_FORMAT = 1
+# records indexed at once while indexes warm up, commands wait for a batch at most
+WARM_UP_BATCH_SIZE = 10_000
+
+indexes_lock = Lock()
+
+def saved_fields(filename: str, version: str) -> list[str]:
+    """ Returns fields of indexes saved for data file of the version, see data_file_version() """
+    try:
+        with open(filename, "rb") as f:
+            indexes_format, saved_version, fields = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return []
+    return fields if (indexes_format, saved_version) == (INDEXES_FORMAT, version) else []
+
+def save_indexes(indexes: dict[str, FieldIndex], filename: str, version: str) -> None:
+    """ Saves indexes built for data file of the version, the file is kept if it has them for the same data """
+    if set(indexes) <= set(saved_fields(filename, version)):
+        return
+    with open(filename, "wb") as f:
+        pickle.dump((INDEXES_FORMAT, version, list(indexes)), f)
+        pickle.dump(indexes, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_indexes(filename: str, version: str) -> dict[str, FieldIndex]:
+    """ Returns indexes saved for data file of the version, no indexes if the file is missing, broken or saved for other data """
+    # loading allocates a lot, cyclic garbage collector would repeatedly walk indexes loaded so far
+    try:
+        with paused_gc(), open(filename, "rb") as f:
+            indexes_format, saved_version, _ = pickle.load(f)
+            if (indexes_format, saved_version) != (INDEXES_FORMAT, version):
+                return {}
+            return pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+
+class ContactIndexes:
+    """
+    Indexes of contacts book used by query planner and suggestions, each index is built on first use of its field.
+    Interactive sessions and servers warm indexes up in background instead, see start_warm_up().
+    Built indexes are kept in sync with the book through its listeners.
+    """
+    def __init__(self, book: ContactsBook):
+        self.book = book
+        self.indexes: dict[str, FieldIndex] = {}
+        # keys of records changed since warm-up started, None if indexes don't warm up
+        self.changed: set[str] | None = None
+        book.listeners.append(self.__update)
+
+    @staticmethod
+    def get(book: ContactsBook) -> "ContactIndexes":
+        """ Returns indexes of the book, they are built on first use """
+        return book.cache("indexes", ContactIndexes)
+
+    def __update(self, changes: list[tuple[Operation, Operation]]) -> None:
+        with indexes_lock:
+            for key in changed_keys(changes):
+                record = self.book.data.get(key)
+                for index in self.indexes.values():
+                    index.update(key, record)
+                if self.changed is not None:
+                    self.changed.add(key)
+
+    def get_index(self, field: str, build: bool = False) -> FieldIndex | None:
+        """
+        Returns index of the field, None if the field is not indexed.
+        While indexes warm up, None is returned for an index which is not ready, so queries scan records instead;
+        build=True builds it at once, e.g. for suggestions which have no scan.
+        """
+        if field not in INDEXED_FIELDS:
+            return None
+        with indexes_lock:
+            index = self.indexes.get(field)
+            if index is None and (self.changed is None or build):
+                index = FieldIndex(field, INDEXED_FIELDS[field])
+                index.build(self.book.data)
+                self.indexes[field] = index
+            return index
+
+    def save(self, filename: str, version: str) -> None:
+        """ Saves built indexes, so the next session loads them instead of building """
+        with indexes_lock:
+            save_indexes(self.indexes, filename, version)
+
+    def start_warm_up(self, lock: Callable[[], ContextManager], load: Callable[[], dict[str, FieldIndex]]) -> Thread:
+        """
+        Starts building all indexes in background thread right after the book is loaded, so the prompt doesn't wait for them.
+        Indexes returned by load are taken instead of building, e.g. indexes saved with the data file.
+        lock: function returning lock of storage held by commands, records are read in batches holding it
+        """
+        with indexes_lock:
+            self.changed = set()
+        thread = Thread(target=self.__warm_up, args=(lock, load), daemon=True)
+        thread.start()
+        return thread
+
+    def __locked(self, lock: Callable[[], ContextManager], function: Callable):
+        """ Returns result of function called holding lock of storage """
+        with lock():
+            return function()
+
+    def __add_batch(self, index: FieldIndex, keys: list[str]) -> None:
+        # cyclic garbage collector would repeatedly walk the whole book
+        with paused_gc():
+            data = self.book.data
+            index.add((key, data[key]) for key in keys if key in data)
+
+    def __install(self, index: FieldIndex) -> None:
+        """ Makes index usable after records it has missed are updated, unless it was built on demand meanwhile """
+        with indexes_lock:
+            if index.name in self.indexes:
+                return
+            for key in self.changed:
+                index.update(key, self.book.data.get(key))
+            self.indexes[index.name] = index
+
+    def __warm_up(self, lock: Callable[[], ContextManager], load: Callable[[], dict[str, FieldIndex]]) -> None:
+        try:
+            loaded = load()
+            keys = None
+            for field, values_of in INDEXED_FIELDS.items():
+                index = loaded.get(field)
+                if index is None:
+                    index = FieldIndex(field, values_of)
+                    # records added or renamed later are in changed keys
+                    keys = keys if keys is not None else self.__locked(lock, lambda: list(self.book.data))
+                    for start in range(0, len(keys), WARM_UP_BATCH_SIZE):
+                        self.__locked(lock, lambda: self.__add_batch(index, keys[start:start + WARM_UP_BATCH_SIZE]))
+                    index.finish()
+                self.__locked(lock, lambda: self.__install(index))
+        finally:
+            # indexes which are not ready are built on first use again
+            with indexes_lock:
+                self.changed = None
+
+    def sound_alike(self, text: str) -> list[str]:
+        """
+        Returns names of contacts with a word sounding like each word of the text, e.g. 'John Smith' for 'Jon Smyth'.
+        Words sound alike if they share a Double Metaphone or Soundex code, names sharing more codes and spelled closer come first.
+        """
+        index = self.get_index("sound", build=True)
+        scores: dict[str, int] | None = None
+        for word in WORD_REGEXP.findall(text.casefold()):
+            codes = word_sounds(word)
+            if not codes:
+                continue
+            # keys of names with a word sharing at least one code, counting shared codes
+            matched: dict[str, int] = {}
+            for code in codes:
+                for key in index.lookup(code):
+                    matched[key] = matched.get(key, 0) + 1
+            scores = matched if scores is None else {key: scores[key] + count for key, count in matched.items() if key in scores}
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        text = text.casefold()
+        return sorted(scores, key=lambda key: (-scores[key], -SequenceMatcher(None, text, key.casefold()).ratio(), key))
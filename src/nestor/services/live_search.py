@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import shlex
+from threading import Event, Lock
+from typing import Callable
+
+from nestor.handlers.contacts import ContactsHandler
+from nestor.handlers.notes import NotesHandler
+from nestor.models.book import Book
+from nestor.services.serializer import Storage
+from nestor.utils.cancellation import CommandCancelledError, cancel_event, raise_if_cancelled
+
+# seconds without typing before matches are searched, so fast typing doesn't start a search per key
+LIVE_SEARCH_DELAY = 0.15
+# records checked between cancellation checks
+LIVE_SEARCH_BATCH_SIZE = 10_000
+# matches shown under the prompt
+LIVE_RESULTS_COUNT = 5
+# seconds between checks whether a search waiting for storage was cancelled
+LOCK_CHECK_INTERVAL = 0.05
+
+def parse_live_query(text: str) -> tuple[str, str] | None:
+    """ Returns search command and its search string being typed, None if the text is not a search """
+    command, _, rest = text.lstrip().partition(" ")
+    command = command.lower()
+    if command not in (ContactsHandler.SEARCH_CONTACTS_COMMAND, NotesHandler.SEARCH_NOTES):
+        return None
+    # search string may be typed in quotes which are not closed yet
+    for ending in ("", "\"", "'"):
+        try:
+            args = shlex.split(rest + ending)
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    if not args or args[0] == "--phonetic":
+        return None
+    return command, args[0]
+
+class LiveSearch:
+    """
+    Matches of search-contacts and search-notes shown under the prompt while the search string is typed.
+    Records matching a string match its prefixes too, so matches are looked for only among matches of the longest prefix searched before,
+    each key narrows them instead of searching the whole book.
+    Searches run in a worker thread after a pause in typing, the next key cancels them.
+    on_change: function called when matches change, e.g. to redraw the prompt
+    """
+    def __init__(self, storage: Storage, storage_lock: Lock):
+        self.storage = storage
+        self.storage_lock = storage_lock
+        self.on_change: Callable[[], None] = lambda: None
+        # keys of records matching searched strings, by command and lowercase search string,
+        # a cancelled search keeps keys it didn't check yet too
+        self.matches: dict[tuple[str, str], list[str]] = {}
+        self.text = ""
+        self.task: asyncio.Task | None = None
+        self.event: Event | None = None
+
+    def reset(self) -> None:
+        """ Cancels search and forgets matches, records may be changed by the command run after the prompt """
+        self.__cancel()
+        # a search which is still stopping keeps its own matches
+        self.matches = {}
+        self.text = ""
+
+    def update(self, text: str) -> None:
+        """ Starts search for the typed command line, called on each change of it in event loop of the prompt """
+        self.__cancel()
+        query = parse_live_query(text)
+        if query is None:
+            if self.text:
+                self.text = ""
+                self.on_change()
+            return
+        self.event = Event()
+        self.task = asyncio.get_running_loop().create_task(self.__search(*query, self.event))
+
+    def __cancel(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.event.set()
+            self.task = None
+
+    def __book(self, command: str) -> Book:
+        return self.storage.contacts_book if command == ContactsHandler.SEARCH_CONTACTS_COMMAND else self.storage.notes_book
+
+    async def __search(self, command: str, search_str: str, event: Event) -> None:
+        await asyncio.sleep(LIVE_SEARCH_DELAY)
+        matches = self.matches
+
+        def execute():
+            cancel_event.set(event)
+            # storage may be held by background jobs, e.g. warm-up of indexes, the next key stops waiting
+            while not self.storage_lock.acquire(timeout=LOCK_CHECK_INTERVAL):
+                raise_if_cancelled()
+            try:
+                return self.__find(command, search_str.lower(), matches)
+            finally:
+                self.storage_lock.release()
+
+        try:
+            text = await asyncio.to_thread(execute)
+        except CommandCancelledError:
+            return
+        if not event.is_set():
+            self.text = text
+            self.on_change()
+
+    def __find(self, command: str, search_str: str, matches: dict[tuple[str, str], list[str]]) -> str:
+        """ Returns text of matches of the search string, narrowing matches of its longest prefix searched before """
+        book = self.__book(command)
+        prefixes = [prefix for kind, prefix in matches if kind == command and search_str.startswith(prefix)]
+        candidates = matches[command, max(prefixes, key=len)] if prefixes else list(book.data)
+        # matches of other strings are not narrowed any more, e.g. after the string was edited
+        for query in [query for query in matches if query[0] != command or query[1] not in prefixes]:
+            del matches[query]
+
+        data = book.data
+        keys, top = [], []
+        for start in range(0, len(candidates), LIVE_SEARCH_BATCH_SIZE):
+            try:
+                raise_if_cancelled()
+            except CommandCancelledError:
+                # candidates are checked again anyway, so the next key resumes the search instead of starting over
+                matches[command, search_str] = keys + candidates[start:]
+                raise
+            batch = [key for key in candidates[start:start + LIVE_SEARCH_BATCH_SIZE]
+                     if (record := data.get(key)) is not None and book.matches_search(record, search_str)]
+            keys += batch
+            # keys starting with the search string come first
+            top = heapq.nsmallest(LIVE_RESULTS_COUNT, top + batch, key=lambda key: (not key.lower().startswith(search_str), key.lower()))
+        matches[command, search_str] = keys
+
+        if not keys:
+            return "No matches"
+        more = f" and {len(keys) - len(top)} more" if len(keys) > len(top) else ""
+        return f"{len(keys)} {'match' if len(keys) == 1 else 'matches'}: {', '.join(top)}{more}"
@@ -0,0 +1,222 @@
+import copy
+import hashlib
+import json
+import os
+from typing import Iterator
+
+from nestor.models.notes_book import LargeContent
+from nestor.services.chunk_store import ChunkStore
+from nestor.services.serializer import DataFile, DataFileWriter, RecordsBatch, Storage, ends_batch
+from nestor.utils.to_dict import to_dict
+
+# kinds of differences between records of two files
+SAME_BATCH = "same batch"
+SAME = "same"
+ONLY_FIRST = "only first"
+ONLY_SECOND = "only second"
+CHANGED = "changed"
+
+FIRST = "first"
+SECOND = "second"
+
+def canonical(record, store: ChunkStore | None) -> dict:
+    """
+    Returns values of record attributes which don't depend on the file, content of a note is its hash.
+    Large content is read chunk by chunk, so a note is the same as a large note with the same text.
+    """
+    values = to_dict(record)
+    content = getattr(record, "content", None)
+    if content is not None:
+        digest = hashlib.blake2b(digest_size=16)
+        chunks = store.read(content.refs) if isinstance(content, LargeContent) else [content.value]
+        for chunk in chunks:
+            digest.update(chunk.encode("utf-8"))
+        values["content"] = digest.hexdigest()
+    return values
+
+def record_hash(record, store: ChunkStore | None) -> bytes:
+    text = json.dumps(canonical(record, store), sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+class BatchCursor:
+    """ Position in records of a book which are read batch by batch, only the current batch is kept in memory """
+    def __init__(self, batches: Iterator[RecordsBatch]):
+        self.batches = batches
+        self.batch = next(batches, None)
+        self.records: list | None = None
+        self.position = 0
+
+    def at_batch_start(self) -> bool:
+        return self.batch is not None and self.records is None
+
+    def next_batch(self) -> None:
+        self.batch = next(self.batches, None)
+        self.records = None
+
+    def current(self) -> tuple[str, object] | None:
+        if self.batch is None:
+            return None
+        if self.records is None:
+            self.records = self.batch.read()
+            self.position = 0
+        return self.records[self.position]
+
+    def advance(self) -> None:
+        self.position += 1
+        if self.position == len(self.records):
+            self.next_batch()
+
+def compare(first: DataFile, second: DataFile, kind: str) -> Iterator[tuple]:
+    """
+    Yields differences of records of the book in two files, walking both in order of keys:
+    (SAME_BATCH, batch) for a batch saved the same in both files, it's skipped unread,
+    (SAME, key, record), (ONLY_FIRST, key, record), (ONLY_SECOND, key, record), (CHANGED, key, first record, second record).
+    Batch boundaries depend on keys only, so batches are the same again after the changed ones and work is O(changes).
+    """
+    first_store, second_store = first.store(), second.store()
+    first_cursor, second_cursor = BatchCursor(first.batches(kind)), BatchCursor(second.batches(kind))
+    while True:
+        if first_cursor.at_batch_start() and second_cursor.at_batch_start() and first_cursor.batch.same(second_cursor.batch):
+            yield SAME_BATCH, first_cursor.batch
+            first_cursor.next_batch()
+            second_cursor.next_batch()
+            continue
+
+        first_item, second_item = first_cursor.current(), second_cursor.current()
+        if first_item is None and second_item is None:
+            return
+        if second_item is None or (first_item is not None and first_item[0] < second_item[0]):
+            yield ONLY_FIRST, *first_item
+            first_cursor.advance()
+        elif first_item is None or second_item[0] < first_item[0]:
+            yield ONLY_SECOND, *second_item
+            second_cursor.advance()
+        else:
+            key, first_record = first_item
+            second_record = second_item[1]
+            if record_hash(first_record, first_store) == record_hash(second_record, second_store):
+                yield SAME, key, first_record
+            else:
+                yield CHANGED, key, first_record, second_record
+            first_cursor.advance()
+            second_cursor.advance()
+
+def changed_fields(first_record, second_record, first_store: ChunkStore, second_store: ChunkStore) -> list[str]:
+    first_values, second_values = canonical(first_record, first_store), canonical(second_record, second_store)
+    return [name for name in dict.fromkeys([*first_values, *second_values]) if first_values.get(name) != second_values.get(name)]
+
+def diff_files(first_filename: str, second_filename: str) -> Iterator[tuple[str, str, str, list[str]]]:
+    """
+    Yields differences of books of two data files as (kind, difference, key, changed fields),
+    and (kind, SAME_BATCH, None, [count of same batches, count of batches]) after records of each book.
+    """
+    first, second = DataFile(first_filename), DataFile(second_filename)
+    first_store, second_store = first.store(), second.store()
+    for kind in (book.KIND for book in Storage().get_books()):
+        same_batches = 0
+        for difference, *values in compare(first, second, kind):
+            if difference == SAME_BATCH:
+                same_batches += 1
+            elif difference == ONLY_FIRST or difference == ONLY_SECOND:
+                yield kind, difference, values[0], []
+            elif difference == CHANGED:
+                yield kind, CHANGED, values[0], changed_fields(values[1], values[2], first_store, second_store)
+        yield kind, SAME_BATCH, None, [same_batches, sum(1 for _ in first.batches(kind))]
+
+def is_empty(value) -> bool:
+    return value is None or value == []
+
+def merge_records(first_record, second_record, first_store: ChunkStore, second_store: ChunkStore, prefer: str) -> tuple[object, list[str]]:
+    """
+    Returns record merging attributes of both records and names of conflicting attributes, the first record if nothing was taken from the second one.
+    Lists are joined, e.g. phones or tags, other attributes are taken from the record which has them.
+    If both records have different values, value of the preferred record is taken.
+    """
+    first_values, second_values = canonical(first_record, first_store), canonical(second_record, second_store)
+    changes = {}
+    conflicts = []
+    for name, second_value in vars(second_record).items():
+        first_value = getattr(first_record, name, None)
+        if first_values.get(name) == second_values.get(name) or is_empty(second_value):
+            continue
+        if is_empty(first_value):
+            changes[name] = second_value
+        elif isinstance(first_value, list) and isinstance(second_value, list):
+            values = {json.dumps(to_dict(item), sort_keys=True) for item in first_value}
+            added = [item for item in second_value if json.dumps(to_dict(item), sort_keys=True) not in values]
+            if added:
+                changes[name] = [*first_value, *added]
+        else:
+            conflicts.append(name)
+            if prefer == SECOND:
+                changes[name] = second_value
+
+    if not changes:
+        return first_record, conflicts
+    # records are changed copy-on-write, see Book
+    merged = copy.copy(first_record)
+    merged.__dict__.update(changes)
+    return merged, conflicts
+
+def copy_content(record, source: ChunkStore, target: ChunkStore):
+    """ Returns the record with its large content copied to the target store, references of the source file mean nothing there """
+    if not isinstance(getattr(record, "content", None), LargeContent):
+        return record
+    record = copy.copy(record)
+    record.content = LargeContent.write(target, source.read(record.content.refs))
+    return record
+
+def merge_files(first_filename: str, second_filename: str, prefer: str = FIRST) -> list[tuple[str, str, str, list[str]]]:
+    """
+    Merges records of the second data file into the first one, returns (kind, difference, key, conflicts) of records added or merged.
+    Records are streamed from both files into a new file which replaces the first one, so memory is bounded by a batch of each file;
+    batches which are the same in both files are copied unread.
+    Records are never deleted, history of notes is kept from the first file.
+    """
+    first, second = DataFile(first_filename), DataFile(second_filename)
+    first_store, second_store = first.store(), second.store()
+    temporary_filename = f"{first_filename}.merge"
+    changes = []
+    try:
+        with open(temporary_filename, "wb") as f:
+            writer = DataFileWriter(f)
+            for kind in (book.KIND for book in Storage().get_books()):
+                writer.write_state(kind, first.book_state(kind))
+                added = set()
+                # records of changed regions are written in batches again
+                pending = []
+                for difference, *values in compare(first, second, kind):
+                    if difference == SAME_BATCH:
+                        writer.write_records(kind, pending)
+                        pending = []
+                        batch = values[0]
+                        writer.write_batch(kind, batch.read(raw=True), batch.first_key, batch.last_key, batch.count, batch.chunks)
+                        continue
+                    key = values[0]
+                    if difference == SAME or difference == ONLY_FIRST:
+                        record = values[1]
+                    elif difference == ONLY_SECOND:
+                        added.add(key)
+                        record = copy_content(values[1], second_store, first_store)
+                        changes.append((kind, ONLY_SECOND, key, []))
+                    else:
+                        first_record, second_record = values[1:]
+                        record, conflicts = merge_records(first_record, second_record, first_store, second_store, prefer)
+                        if getattr(record, "content", None) is getattr(second_record, "content", None):
+                            record = copy_content(record, second_store, first_store)
+                        if record is not first_record or conflicts:
+                            changes.append((kind, CHANGED, key, conflicts))
+                    pending.append((key, record))
+                    # a complete batch is written right away, batches are never the same in legacy files or with large notes
+                    if ends_batch(key, len(pending)):
+                        writer.write_records(kind, pending)
+                        pending = []
+                writer.write_records(kind, pending)
+                writer.write_order(kind, first.order(kind))
+                writer.write_order(kind, (key for key in second.order(kind) if key in added))
+            writer.close()
+        os.replace(temporary_filename, first_filename)
+    finally:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+    return changes
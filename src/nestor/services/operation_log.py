@@ -0,0 +1,97 @@
+from collections import deque
+from contextlib import contextmanager
+
+from nestor.models.operation import Operation
+from nestor.services.serializer import Storage
+
+# commands kept for undo and redo, older commands are dropped
+MAX_ENTRIES = 100
+
+class LogEntry:
+    """
+    Operations made by one command
+    command: str - command name
+    operations: list[tuple[Operation, Operation]] - applied operations with their inverses, in order
+    """
+    def __init__(self, command: str, operations: list[tuple[Operation, Operation]] = None):
+        self.command = command
+        self.operations = operations or []
+
+class OperationLog:
+    """
+    Log of operations made by commands to the books of storage, used to undo and redo commands.
+    Memory is bounded by the number of kept commands, entries hold references to records rather than copies.
+    """
+    def __init__(self, storage: Storage, max_entries: int = MAX_ENTRIES):
+        self.storage = storage
+        self.undo_entries: deque[LogEntry] = deque(maxlen=max_entries)
+        self.redo_entries: deque[LogEntry] = deque(maxlen=max_entries)
+        self.entry: LogEntry | None = None
+        self.running = False
+        self.reverting = False
+        for book in storage.get_books():
+            book.listeners.append(self.__record)
+
+    def __record(self, changes: list[tuple[Operation, Operation]]) -> None:
+        if self.entry is None or self.reverting:
+            return
+        operations = self.entry.operations
+        book = changes[0][0].book
+        last = next((change for change in reversed(operations) if change[0].book == book), None)
+        # rollback sends inverses of reverted operations starting from the last one, both are dropped
+        if last is not None and last[1] is changes[0][0]:
+            reverted = {id(operation) for operation, _ in changes}
+            self.entry.operations = [change for change in operations if id(change[1]) not in reverted]
+        else:
+            operations.extend(changes)
+
+    @contextmanager
+    def command(self, command: str):
+        """
+        Groups operations made in the block into one log entry, nested blocks join the outer entry.
+        Commands of a transaction join its entry, it's named after the command which committed it.
+        """
+        if self.running:
+            yield
+            return
+
+        self.running = True
+        if self.entry is None:
+            self.entry = LogEntry(command)
+        try:
+            yield
+        finally:
+            self.running = False
+            if not self.storage.in_transaction():
+                entry, self.entry = self.entry, None
+                entry.command = command
+                if entry.operations:
+                    self.undo_entries.append(entry)
+                    self.redo_entries.clear()
+
+    def __revert(self, entry: LogEntry) -> LogEntry:
+        """ Applies inverse operations of the entry in reverse order, returns entry that reverts them back """
+        reverted = LogEntry(entry.command)
+        self.reverting = True
+        try:
+            for _, inverse in reversed(entry.operations):
+                reverted.operations.append((inverse, self.storage.get_book(inverse.book).apply(inverse)))
+        finally:
+            self.reverting = False
+        return reverted
+
+    def undo(self) -> str | None:
+        """ Reverts the last command, returns its name or None if there is nothing to undo """
+        if not self.undo_entries:
+            return None
+        entry = self.undo_entries.pop()
+        self.redo_entries.append(self.__revert(entry))
+        return entry.command
+
+    def redo(self) -> str | None:
+        """ Makes the last undone command again, returns its name or None if there is nothing to redo """
+        if not self.redo_entries:
+            return None
+        entry = self.redo_entries.pop()
+        self.undo_entries.append(self.__revert(entry))
+        return entry.command
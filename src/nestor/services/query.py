@@ -0,0 +1,380 @@
+import re
+from datetime import date
+from fnmatch import fnmatchcase
+
+from nestor.models.contacts_book import Contact, ContactsBook
+from nestor.services.indexes import ContactIndexes, FieldIndex
+from nestor.utils.cancellation import raise_if_cancelled
+
+FIELDS = ("name", "phone", "email", "birthday", "address")
+KEYWORDS = ("AND", "OR", "NOT")
+
+TERM_REGEXP = re.compile(r"^(\w+):(.*)$", re.DOTALL)
+BIRTHDAY_FORMATS = {
+    "month": re.compile(r"^(\d{2})$"),
+    "day": re.compile(r"^(\d{2})\.(\d{2})$"),
+    "date": re.compile(r"^(\d{2})\.(\d{2})\.(\d{4})$"),
+    "year": re.compile(r"^(\d{4})$"),
+}
+
+# share of records a condition without index is expected to keep, for estimates of plan
+DEFAULT_SELECTIVITY = 0.3
+# records checked between checks of cancellation
+FILTER_BATCH_SIZE = 10000
+
+class Term:
+    """
+    Condition on a field of contact, values are compared ignoring case:
+    'name:john doe' equals, 'name:~jo' contains, 'phone:067*' matches wildcards, 'email:' is empty.
+    Address equals if one of its parts does, e.g. 'address:kyiv'.
+    Birthday is given as MM, DD.MM, DD.MM.YYYY or YYYY, e.g. 'birthday:03' is any day of March.
+    """
+    def __init__(self, field: str, text: str):
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field '{field}', use one of: {', '.join(FIELDS)}")
+        self.field = field
+        self.text = text
+        if text.startswith("~"):
+            self.operator, self.value = "contains", text[1:].casefold()
+        elif "*" in text or "?" in text or "[" in text:
+            self.operator, self.value = "matches", text.casefold()
+        else:
+            self.operator, self.value = "equals", text.casefold()
+
+        self.birthday_format = None
+        if field == "birthday" and self.operator == "equals" and self.value:
+            self.birthday_format = next((name for name, regexp in BIRTHDAY_FORMATS.items() if regexp.match(self.value)), None)
+            if self.birthday_format is None:
+                raise ValueError(f"Invalid birthday '{text}', use MM, DD.MM, DD.MM.YYYY or YYYY")
+            self.birthday_parts = parts = [int(part) for part in BIRTHDAY_FORMATS[self.birthday_format].match(self.value).groups()]
+            # a date that can't exist would match nothing, days of month are checked in a leap year to allow 29.02
+            try:
+                match self.birthday_format:
+                    case "month":
+                        date(2000, parts[0], 1)
+                    case "day":
+                        date(2000, parts[1], parts[0])
+                    case "date":
+                        date(parts[2], parts[1], parts[0])
+            except ValueError:
+                raise ValueError(f"Invalid birthday '{text}', no such month or day") from None
+
+    def __str__(self):
+        return f"{self.field}:{self.text}"
+
+    def values(self, contact: Contact) -> list[str]:
+        match self.field:
+            case "name":
+                return [contact.name.value.casefold()]
+            case "phone":
+                return [phone.value for phone in contact.phones]
+            case "email":
+                return [contact.email.value.casefold()] if contact.email else []
+            case "birthday":
+                return [str(contact.birthday)] if contact.birthday else []
+            case "address":
+                if not contact.address:
+                    return []
+                if self.operator == "contains":
+                    return [str(contact.address).casefold()]
+                parts = (contact.address.street, contact.address.city, contact.address.state, contact.address.zip_code, contact.address.country)
+                return [str(part).casefold() for part in parts if part]
+
+    def matches(self, contact: Contact) -> bool:
+        if self.birthday_format:
+            return contact.birthday is not None and self.__birthday_matches(contact.birthday.value)
+        values = self.values(contact)
+        if not self.value:
+            return not values
+        if self.operator == "contains":
+            return any(self.value in value for value in values)
+        if self.operator == "matches":
+            return any(fnmatchcase(value, self.value) for value in values)
+        return self.value in values
+
+    def __birthday_matches(self, birthday) -> bool:
+        parts = self.birthday_parts
+        match self.birthday_format:
+            case "month":
+                return birthday.month == parts[0]
+            case "day":
+                return (birthday.day, birthday.month) == (parts[0], parts[1])
+            case "date":
+                return (birthday.day, birthday.month, birthday.year) == (parts[0], parts[1], parts[2])
+            case _:
+                return birthday.year == parts[0]
+
+    def access(self, indexes: ContactIndexes) -> "PlanNode | None":
+        """ Returns index lookup giving records of the condition, None if no index helps """
+        lookup = self.__lookup()
+        if lookup is None:
+            return None
+        # index is built on first use, conditions it can't answer must not build it
+        index = indexes.get_index(self.field)
+        if index is None:
+            return None
+        value, prefix, check = lookup
+        node = IndexLookup(index, value, prefix)
+        return Filter(node, [self]) if check else node
+
+    def __lookup(self) -> tuple[str, bool, bool] | None:
+        """
+        Returns value to look up in index of the field, whether it's a prefix
+        and whether found records must be checked by the condition, None if no index helps
+        """
+        if not self.value:
+            return None
+        if self.birthday_format:
+            parts = self.birthday_parts
+            match self.birthday_format:
+                case "month":
+                    return f"{parts[0]:02}-", True, False
+                case "day":
+                    return f"{parts[1]:02}-{parts[0]:02}", False, False
+                case "date":
+                    # buckets don't keep years
+                    return f"{parts[1]:02}-{parts[0]:02}", False, True
+            return None
+        if self.field == "birthday":
+            return None
+        if self.operator == "equals":
+            return self.value, False, False
+        # 'phone:067*' is a range of sorted values
+        if self.operator == "matches" and self.value.endswith("*") and not any(char in self.value[:-1] for char in "*?["):
+            return self.value[:-1], True, False
+        return None
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __str__(self):
+        return f"NOT {self.child}"
+
+    def matches(self, contact: Contact) -> bool:
+        return not self.child.matches(contact)
+
+    def access(self, indexes: ContactIndexes) -> None:
+        return None
+
+class And:
+    def __init__(self, children: list):
+        self.children = children
+
+    def __str__(self):
+        return " AND ".join(f"({child})" if isinstance(child, Or) else str(child) for child in self.children)
+
+    def matches(self, contact: Contact) -> bool:
+        return all(child.matches(contact) for child in self.children)
+
+    def access(self, indexes: ContactIndexes) -> "PlanNode | None":
+        """ Returns the cheapest index lookup of the conditions with the rest checked on its records """
+        paths = [(child.access(indexes), child) for child in self.children]
+        paths = [(path, child) for path, child in paths if path is not None]
+        if not paths:
+            return None
+        path, driver = min(paths, key=lambda item: item[0].estimate)
+        residual = [child for child in self.children if child is not driver]
+        return Filter(path, residual) if residual else path
+
+class Or:
+    def __init__(self, children: list):
+        self.children = children
+
+    def __str__(self):
+        return " OR ".join(str(child) for child in self.children)
+
+    def matches(self, contact: Contact) -> bool:
+        return any(child.matches(contact) for child in self.children)
+
+    def access(self, indexes: ContactIndexes) -> "PlanNode | None":
+        """ Returns union of lookups if each condition has one, a single scan is cheaper otherwise """
+        paths = [child.access(indexes) for child in self.children]
+        if any(path is None for path in paths):
+            return None
+        return Union(paths)
+
+def tokenize(args: list[str]) -> list[str]:
+    """ Splits parentheses from arguments, e.g. ['(name:jo', 'OR', 'name:an)'] """
+    tokens = []
+    for arg in args:
+        while arg.startswith("("):
+            tokens.append("(")
+            arg = arg[1:]
+        closing = len(arg) - len(arg.rstrip(")"))
+        if arg[:len(arg) - closing]:
+            tokens.append(arg[:len(arg) - closing])
+        tokens += [")"] * closing
+    return tokens
+
+class Parser:
+    """
+    Parses query like 'name:~jo AND birthday:03 AND NOT email:*@gmail.com'.
+    NOT binds tighter than AND, AND tighter than OR, conditions without operator between them are joined by AND.
+    """
+    def __init__(self, args: list[str]):
+        self.tokens = tokenize(args)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Query is empty, e.g. name:~jo AND birthday:03")
+        node = self.__parse_or()
+        if self.__peek() is not None:
+            raise ValueError(f"Unexpected '{self.__peek()}'")
+        return node
+
+    def __peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def __keyword(self) -> str | None:
+        token = self.__peek()
+        return token.upper() if token and token.upper() in KEYWORDS else None
+
+    def __parse_or(self):
+        children = [self.__parse_and()]
+        while self.__keyword() == "OR":
+            self.position += 1
+            children.append(self.__parse_and())
+        return Or(children) if len(children) > 1 else children[0]
+
+    def __parse_and(self):
+        children = []
+        while True:
+            child = self.__parse_not()
+            children += child.children if isinstance(child, And) else [child]
+            if self.__keyword() == "AND":
+                self.position += 1
+            elif self.__peek() is None or self.__peek() == ")" or self.__keyword() == "OR":
+                break
+        return And(children) if len(children) > 1 else children[0]
+
+    def __parse_not(self):
+        token = self.__peek()
+        if token is None:
+            raise ValueError("Query ends unexpectedly")
+        self.position += 1
+        if token.upper() == "NOT":
+            return Not(self.__parse_not())
+        if token == "(":
+            node = self.__parse_or()
+            if self.__peek() != ")":
+                raise ValueError("Missing ')'")
+            self.position += 1
+            return node
+
+        match = TERM_REGEXP.match(token)
+        if match is None:
+            raise ValueError(f"Invalid condition '{token}', use field:value, field:~text or field:pattern*")
+        return Term(*match.groups())
+
+class PlanNode:
+    """ Step of query plan, gives keys of contacts """
+    estimate = 0
+    actual = None
+
+    def run(self, book: ContactsBook) -> set[str] | list[str]:
+        raise NotImplementedError
+
+    def records(self, book: ContactsBook) -> list[tuple[str, Contact]]:
+        return [(key, book.data[key]) for key in self.run(book)]
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def children(self) -> list["PlanNode"]:
+        return []
+
+class IndexLookup(PlanNode):
+    def __init__(self, index: FieldIndex, value: str, prefix: bool = False):
+        self.index = index
+        self.value = value
+        self.prefix = prefix
+        self.estimate = index.estimate_prefix(value) if prefix else index.estimate(value)
+
+    def run(self, book: ContactsBook) -> set[str]:
+        keys = self.index.lookup_prefix(self.value) if self.prefix else self.index.lookup(self.value)
+        self.actual = len(keys)
+        return keys
+
+    def describe(self) -> str:
+        return f"Index {self.index.name} {'prefix' if self.prefix else 'lookup'} '{self.value}'"
+
+class Union(PlanNode):
+    def __init__(self, paths: list[PlanNode]):
+        self.paths = paths
+        self.estimate = sum(path.estimate for path in paths)
+
+    def run(self, book: ContactsBook) -> set[str]:
+        keys = set()
+        for path in self.paths:
+            keys |= set(path.run(book))
+        self.actual = len(keys)
+        return keys
+
+    def describe(self) -> str:
+        return "Union"
+
+    def children(self) -> list[PlanNode]:
+        return self.paths
+
+class FullScan(PlanNode):
+    def __init__(self, book: ContactsBook):
+        self.estimate = len(book.data)
+
+    def run(self, book: ContactsBook) -> list[str]:
+        keys = list(book.data.keys())
+        self.actual = len(keys)
+        return keys
+
+    def records(self, book: ContactsBook) -> list[tuple[str, Contact]]:
+        records = list(book.data.items())
+        self.actual = len(records)
+        return records
+
+    def describe(self) -> str:
+        return "Full scan"
+
+class Filter(PlanNode):
+    """ Checks conditions without index on records given by source """
+    def __init__(self, source: PlanNode, conditions: list):
+        self.source = source
+        self.conditions = conditions
+        self.predicate = conditions[0] if len(conditions) == 1 else And(conditions)
+        self.estimate = round(source.estimate * DEFAULT_SELECTIVITY ** len(conditions))
+
+    def run(self, book: ContactsBook) -> list[str]:
+        records, matches = self.source.records(book), self.predicate.matches
+        keys = []
+        # scans of huge books are cancellable
+        for start in range(0, len(records), FILTER_BATCH_SIZE):
+            raise_if_cancelled()
+            keys += [key for key, contact in records[start:start + FILTER_BATCH_SIZE] if matches(contact)]
+        self.actual = len(keys)
+        return keys
+
+    def describe(self) -> str:
+        return f"Filter {self.predicate}"
+
+    def children(self) -> list[PlanNode]:
+        return [self.source]
+
+def plan_query(query, book: ContactsBook) -> PlanNode:
+    """ Returns the cheapest plan of parsed query, a full scan checks the query if no index helps """
+    indexes = ContactIndexes.get(book)
+    path = query.access(indexes)
+    return path if path is not None else Filter(FullScan(book), [query])
+
+def run_query(args: list[str], book: ContactsBook) -> tuple[list[Contact], PlanNode]:
+    """ Returns contacts matching query sorted by name, and executed plan with actual row counts """
+    plan = plan_query(Parser(args).parse(), book)
+    keys = plan.run(book)
+    return sorted((book.data[key] for key in keys), key=lambda contact: contact.name.value.casefold()), plan
+
+def explain(plan: PlanNode, depth: int = 0) -> list[str]:
+    """ Returns lines describing plan steps with estimated and actual numbers of rows """
+    actual = plan.actual if plan.actual is not None else "-"
+    lines = [f"{'  ' * depth}{plan.describe()} (estimated {plan.estimate}, actual {actual})"]
+    for child in plan.children():
+        lines += explain(child, depth + 1)
+    return lines
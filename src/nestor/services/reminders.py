@@ -0,0 +1,103 @@
+import heapq
+from datetime import date, timedelta
+
+from nestor.models.contacts_book import ContactsBook
+from nestor.models.operation import Operation
+
+def next_congratulation_date(birthdate: date, today: date) -> date:
+    """ Returns the first congratulation date on the birthday from today, e.g. Monday for a birthday on last Saturday """
+    # a birthday on the last weekend of December is congratulated in January
+    for year in (today.year - 1, today.year, today.year + 1):
+        congratulation_date = ContactsBook.congratulation_date(ContactsBook.birthday_in_year(birthdate, year))
+        if congratulation_date >= today:
+            return congratulation_date
+
+class Reminders:
+    """
+    Next congratulation date of each contact with birthday in a min-heap, nearest first.
+    Today's and tomorrow's birthdays are taken from the top of the heap, so daily checks don't rescan the book.
+    The heap follows changes of the book through its listeners, outdated entries are skipped when they reach the top.
+    """
+    def __init__(self, book: ContactsBook):
+        self.book = book
+        self.heap: list[tuple[date, str]] = []
+        self.dates: dict[str, date] = {}
+        self.today: date | None = None
+
+    def __schedule(self, name: str) -> None:
+        """ Makes entry of the contact match the book """
+        record = self.book.data.get(name)
+        if record is None or record.birthday is None:
+            self.dates.pop(name, None)
+            return
+
+        congratulation_date = next_congratulation_date(record.birthday.value, self.today)
+        if self.dates.get(name) != congratulation_date:
+            self.dates[name] = congratulation_date
+            heapq.heappush(self.heap, (congratulation_date, name))
+
+    def __build(self) -> None:
+        self.dates = {
+            name: next_congratulation_date(record.birthday.value, self.today)
+            for name, record in self.book.data.items() if record.birthday is not None
+        }
+        self.heap = [(congratulation_date, name) for name, congratulation_date in self.dates.items()]
+        heapq.heapify(self.heap)
+
+    def __update(self, changes: list[tuple[Operation, Operation]]) -> None:
+        for operation, _ in changes:
+            self.__schedule(operation.key)
+            if operation.action == Operation.RENAME:
+                self.__schedule(operation.value)
+        # drop outdated entries when they outnumber scheduled ones
+        if len(self.heap) > 2 * len(self.dates) + 1000:
+            self.heap = [(congratulation_date, name) for name, congratulation_date in self.dates.items()]
+            heapq.heapify(self.heap)
+
+    def check(self, today: date) -> list[str]:
+        """
+        Returns reminders about today's and tomorrow's birthdays once a day, empty list if the day was checked.
+        The heap is built on the first check, must be called while the book doesn't change.
+        """
+        if today == self.today:
+            return []
+
+        if self.today is None:
+            self.today = today
+            self.__build()
+            self.book.listeners.append(self.__update)
+        self.today = today
+
+        tomorrow = today + timedelta(days=1)
+        due = {today: [], tomorrow: []}
+        kept = []
+        while self.heap and self.heap[0][0] <= tomorrow:
+            congratulation_date, name = heapq.heappop(self.heap)
+            if self.dates.get(name) != congratulation_date:
+                continue
+            if congratulation_date < today:
+                # the day passed while nothing was checked
+                del self.dates[name]
+                self.__schedule(name)
+                continue
+            due[congratulation_date].append(name)
+            kept.append((congratulation_date, name))
+        # contacts stay in the heap until their day is over
+        for entry in kept:
+            heapq.heappush(self.heap, entry)
+
+        reminders = []
+        if due[today]:
+            reminders.append(f"Congratulate today: {', '.join(sorted(due[today]))}")
+        if due[tomorrow]:
+            reminders.append(f"Congratulate tomorrow: {', '.join(sorted(due[tomorrow]))}")
+        return reminders
+
+class RemindersFile:
+    """ Appends reminders to a text file, one line per reminder prefixed with date """
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def write(self, today: date, reminders: list[str]) -> None:
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.writelines(f"{today.isoformat()} {reminder}\n" for reminder in reminders)
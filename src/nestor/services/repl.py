@@ -0,0 +1,190 @@
+import asyncio
+import gc
+import signal
+import time
+from datetime import date
+from threading import Event, Lock
+
+from prompt_toolkit.patch_stdout import patch_stdout
+
+from nestor.handlers.base import CommandsHandler
+from nestor.handlers.dispatcher import create_handlers, dispatch, get_commands, parse_input
+from nestor.services.colorizer import Colorizer
+from nestor.services.live_search import LiveSearch
+from nestor.services.operation_log import OperationLog
+from nestor.services.reminders import Reminders, RemindersFile
+from nestor.services.scheduler import Scheduler
+from nestor.services.serializer import Serializer, Storage
+from nestor.services.trace import RecordingInterface, TraceRecorder
+from nestor.services.ui import CommandLineInterface, UserInterface
+from nestor.utils.cancellation import CommandCancelledError, cancel_event
+from nestor.utils.paused_gc import paused_gc
+
+# seconds between background saves of changed storage
+AUTOSAVE_INTERVAL = 60
+# seconds before the first and between next progress messages of a long-running command
+PROGRESS_DELAY = 2
+PROGRESS_INTERVAL = 5
+# seconds between checks whether the day changed and birthdays should be announced
+REMINDERS_INTERVAL = 60
+
+async def run_command(command: str, args: list[str], storage: Storage, storage_lock: Lock, cli: UserInterface, handlers: list[CommandsHandler], log: OperationLog = None) -> None:
+    """
+    Runs command in executor, so background jobs keep running.
+    Shows progress of long-running commands, Ctrl+C cancels the command and returns to the prompt
+    once the command has stopped, so the next command doesn't wait for storage held by a cancelled one.
+    """
+    event = Event()
+
+    def execute():
+        cancel_event.set(event)
+        with storage_lock:
+            dispatch(command, args, storage, cli, handlers, log)
+
+    async def show_progress():
+        started = time.monotonic()
+        await asyncio.sleep(PROGRESS_DELAY)
+        while True:
+            if event.is_set():
+                cli.output(Colorizer.warn(f"Command '{command}' is still stopping, it stops at the next cancellation check..."))
+            # don't interrupt a command waiting for field input
+            elif not getattr(cli, "prompting", False):
+                cli.output(Colorizer.info(f"Running '{command}' for {time.monotonic() - started:.0f}s, press Ctrl+C to cancel..."))
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    def cancel():
+        # the worker thread stops at the next cancellation check, its output is dropped meanwhile
+        if not event.is_set():
+            event.set()
+            cli.output(Colorizer.warn(f"\nStopping '{command}'..."))
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(asyncio.to_thread(execute))
+    progress = asyncio.create_task(show_progress())
+    try:
+        loop.add_signal_handler(signal.SIGINT, cancel)
+    # signal handlers are not supported by event loop on Windows
+    except NotImplementedError:
+        pass
+
+    try:
+        # cancelled command is awaited too, it holds storage lock until it stops
+        await task
+        if event.is_set():
+            cli.output(Colorizer.warn(f"Command '{command}' finished before it could be cancelled."))
+    except CommandCancelledError:
+        cli.output(Colorizer.warn(f"Command '{command}' cancelled."))
+    except asyncio.CancelledError:
+        # the prompt stops, e.g. on exit, the command is stopped with it
+        event.set()
+        raise
+    finally:
+        progress.cancel()
+        try:
+            loop.remove_signal_handler(signal.SIGINT)
+        except NotImplementedError:
+            pass
+
+async def repl(serializer: Serializer, history_filename: str = None, trace_filename: str = None, reminders_filename: str = None) -> None:
+    """
+    Runs interactive prompt with background jobs in asyncio event loop
+    trace_filename: str - file to record commands with their field inputs to
+    reminders_filename: str - file to append birthday reminders to instead of showing them
+    """
+    # loaded records live until exit, they are moved out of collections before the collector is resumed,
+    # so it never pauses typing to walk all of them
+    with paused_gc():
+        # load storage in background while the terminal interface is initialized
+        storage_future = asyncio.get_running_loop().run_in_executor(None, serializer.load_data)
+        cli = CommandLineInterface(history_filename)
+        storage = await storage_future
+        gc.freeze()
+    storage_lock = Lock()
+    # indexes are built while the user types the first command, queries scan records until they're ready
+    serializer.warm_up_indexes(storage, lambda: storage_lock)
+    cli.set_live_search(LiveSearch(storage, storage_lock))
+
+    recorder = TraceRecorder(trace_filename) if trace_filename else None
+    # handlers prompt through recording interface to remember field inputs
+    handlers_cli = RecordingInterface(cli) if recorder else cli
+
+    log = OperationLog(storage)
+    handlers = create_handlers(storage, handlers_cli, log)
+    completion = get_commands()
+
+    commands_since_save = 0
+
+    def autosave():
+        nonlocal commands_since_save
+        # skip if nothing changed or a command is running, it will be saved on next run
+        if commands_since_save == 0 or not storage_lock.acquire(blocking=False):
+            return
+        try:
+            # changes of open transaction are saved after commit
+            if storage.in_transaction():
+                return
+            serializer.save_data(storage)
+            commands_since_save = 0
+        finally:
+            storage_lock.release()
+
+    reminders = Reminders(storage.contacts_book)
+    reminders_file = RemindersFile(reminders_filename) if reminders_filename else None
+
+    def remind():
+        today = date.today()
+        with storage_lock:
+            messages = reminders.check(today)
+        if reminders_file:
+            reminders_file.write(today, messages)
+        else:
+            for message in messages:
+                cli.output(Colorizer.info(message))
+
+    scheduler = Scheduler(on_error=lambda e: cli.output(Colorizer.error(f"Background job failed: {e}")))
+    scheduler.every(AUTOSAVE_INTERVAL, autosave)
+    # announces birthdays on start and after midnight
+    scheduler.every(REMINDERS_INTERVAL, remind, immediately=True)
+
+    # print output of background jobs above the prompt, keeping colors
+    with patch_stdout(raw=True):
+        scheduler.start()
+        cli.output(Colorizer.highlight("Welcome to the assistant bot!"))
+
+        while True:
+            user_input = ""
+            try:
+                user_input = await cli.prompt_async("Enter a command: ", completion=completion)
+            # handle Exit on Ctrl+C
+            except KeyboardInterrupt:
+                cli.output(Colorizer.highlight("\nGood bye!"))
+                break
+
+            if not user_input.strip():
+                continue
+
+            command, *args = parse_input(user_input)
+
+            if command in ["close", "exit"]:
+                cli.output(Colorizer.highlight("Good bye!"))
+                break
+
+            await run_command(command, args, storage, storage_lock, handlers_cli, handlers, log)
+            commands_since_save += 1
+
+            if recorder:
+                recorder.record(command, args, handlers_cli.inputs)
+                handlers_cli.inputs = []
+
+        await scheduler.stop()
+
+    with storage_lock:
+        if storage.in_transaction():
+            storage.rollback()
+            cli.output(Colorizer.warn("Transaction was not committed, its changes are discarded."))
+        await asyncio.to_thread(serializer.save_data, storage, True)
+        await asyncio.to_thread(serializer.save_indexes, storage)
+
+def run_repl(serializer: Serializer, history_filename: str = None, trace_filename: str = None, reminders_filename: str = None) -> None:
+    """ Runs interactive prompt """
+    asyncio.run(repl(serializer, history_filename, trace_filename, reminders_filename))
@@ -0,0 +1,46 @@
+from typing import Iterable, Iterator
+
+from nestor.services.colorizer import Message
+from nestor.utils.cancellation import raise_if_cancelled
+from nestor.utils.csv_as_table import records_table
+from nestor.utils.to_dict import to_dict
+
+class Records:
+    """
+    Records returned by a command, e.g. contacts found by search or rows of a report as dicts.
+    Iterating yields lines of their table, it's rendered only as lines are taken; structured output takes the records themselves.
+    before, after: list[str] - messages around the table, e.g. query plan or page number
+    """
+    def __init__(self, records: list, before: list[str] = None, after: list[str] = None):
+        self.records = records
+        self.before = before or []
+        self.after = after or []
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.before
+        if self.records:
+            yield from records_table(self.records)
+        yield from self.after
+
+def text_object(text: str) -> dict:
+    """ Returns JSON object of output text, messages have their status """
+    if isinstance(text, Message):
+        return {"status": text.kind, "message": text.text}
+    return {"text": text}
+
+def json_objects(result: str | Iterable[str]) -> Iterator[dict]:
+    """
+    Yields JSON objects of command result as they are produced: an object of fields per record, one per message or line of text.
+    Tables of records are never rendered.
+    """
+    if isinstance(result, str):
+        yield text_object(result)
+    elif isinstance(result, Records):
+        yield from map(text_object, result.before)
+        for index, record in enumerate(result.records):
+            if index % 1000 == 0:
+                raise_if_cancelled()
+            yield to_dict(record)
+        yield from map(text_object, result.after)
+    else:
+        yield from map(text_object, result)
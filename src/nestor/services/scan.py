@@ -0,0 +1,232 @@
+import atexit
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from threading import Lock
+from typing import Iterable
+
+from nestor.models.book import Book
+from nestor.models.operation import Operation, changed_keys
+
+# records in a chunk, a chunk is the unit of work of a scan worker
+CHUNK_SIZE = 50_000
+# smaller books are scanned in the calling process, sending them to workers takes longer than the scan
+PARALLEL_THRESHOLD = 100_000
+# separator of values in column text sent to workers, it doesn't appear in typed values
+ROW_SEPARATOR = "\x1e"
+
+CONDITION_REGEXP = re.compile(r"^(\w+)(!~|~|!=|=)(.*)$", re.DOTALL)
+
+def parse_condition(text: str, fields: tuple[str, ...]) -> tuple[int, str, str]:
+    """
+    Parses condition like 'address~kyiv' to (field index, operator, value), values are compared ignoring case.
+    Operators: '~' contains, '!~' doesn't contain, '=' equals, '!=' doesn't equal, 'email=' is empty email.
+    """
+    match = CONDITION_REGEXP.match(text)
+    if match is None:
+        raise ValueError(f"Invalid condition '{text}', use field~text, field!~text, field=text or field!=text")
+    field, operator, value = match.groups()
+    if field not in fields:
+        raise ValueError(f"Unknown field '{field}', use one of: {', '.join(fields)}")
+    return fields.index(field), operator, value.casefold()
+
+def scan_columns(columns: dict[int, list[str]], conditions: list[tuple[int, str, str]], size: int) -> list[int]:
+    """ Returns positions of rows matching all conditions, each condition narrows positions left by the previous one """
+    positions = range(size)
+    for index, operator, value in conditions:
+        column = columns[index]
+        if operator == "~":
+            positions = [position for position in positions if value in column[position]]
+        elif operator == "!~":
+            positions = [position for position in positions if value not in column[position]]
+        elif operator == "=":
+            positions = [position for position in positions if column[position] == value]
+        else:
+            positions = [position for position in positions if column[position] != value]
+    return list(positions)
+
+def text_matches(text: str, operator: str, value: str) -> bool:
+    """ Returns True if casefolded text matches condition """
+    if operator == "~":
+        return value in text
+    if operator == "!~":
+        return value not in text
+    if operator == "=":
+        return text == value
+    return text != value
+
+def chunks_contain(chunks: Iterable[str], value: str) -> bool:
+    """ Returns True if text given by chunks contains casefolded value, text is never joined """
+    if not value:
+        return True
+    tail = ""
+    for chunk in chunks:
+        window = tail + chunk.casefold()
+        if value in window:
+            return True
+        # value may start at the end of a chunk and continue in the next one
+        tail = window[len(window) - len(value) + 1:]
+    return False
+
+def chunks_equal(chunks: Iterable[str], value: str) -> bool:
+    """ Returns True if text given by chunks equals casefolded value, reading stops at the first difference """
+    position = 0
+    for chunk in chunks:
+        chunk = chunk.casefold()
+        if value[position:position + len(chunk)] != chunk:
+            return False
+        position += len(chunk)
+    return position == len(value)
+
+def chunks_match(chunks: Iterable[str], operator: str, value: str) -> bool:
+    """ Returns True if text given by chunks matches condition """
+    if operator in ("~", "!~"):
+        return chunks_contain(chunks, value) == (operator == "~")
+    return chunks_equal(chunks, value) == (operator == "=")
+
+def scan_chunk(texts: dict[int, str], conditions: list[tuple[int, str, str]], size: int) -> list[int]:
+    """ Returns positions of rows of a chunk matching all conditions, runs in worker processes """
+    return scan_columns({index: text.split(ROW_SEPARATOR) for index, text in texts.items()}, conditions, size)
+
+class ScanChunks:
+    """
+    Records of a book as columns of casefolded field values, rows are in the order of the book.
+    Columns are kept in sync with the book through its listeners, chunk text for workers is joined only for changed chunks.
+    """
+    def __init__(self, book: Book, chunk_size: int = CHUNK_SIZE):
+        self.book = book
+        self.chunk_size = chunk_size
+        self.keys: list[str | None] = []
+        self.columns: list[list[str]] = []
+        self.positions: dict[str, int] = {}
+        self.texts: dict[tuple[int, int], str] = {}
+        self.deleted = 0
+        # positions of rows with only a part of the text of a chunked field, see Book.scan_chunks()
+        self.chunked: set[int] = set()
+        self.__build()
+        book.listeners.append(self.__update)
+
+    @staticmethod
+    def get(book: Book) -> "ScanChunks":
+        """ Returns chunks of the book, they are built on first use """
+        return book.cache("scan", ScanChunks)
+
+    def __row(self, record) -> list[str]:
+        return [value.casefold() for value in self.book.scan_row(record)]
+
+    def __is_chunked(self, record) -> bool:
+        return any(self.book.scan_chunks(record, field) is not None for field in self.book.CHUNKED_SCAN_FIELDS)
+
+    def __build(self) -> None:
+        self.keys = list(self.book.data.keys())
+        rows = [self.__row(record) for record in self.book.data.values()]
+        self.columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in self.book.SCAN_FIELDS]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.texts = {}
+        self.deleted = 0
+        self.chunked = set()
+        if self.book.CHUNKED_SCAN_FIELDS:
+            self.chunked = {position for position, record in enumerate(self.book.data.values()) if self.__is_chunked(record)}
+
+    def __forget_texts(self, position: int) -> None:
+        chunk = position // self.chunk_size
+        for index in range(len(self.columns)):
+            self.texts.pop((chunk, index), None)
+
+    def __refresh(self, key: str) -> None:
+        """ Makes row of the key match the book, new keys are appended like in the book dict """
+        position = self.positions.get(key)
+        record = self.book.data.get(key)
+        if record is None:
+            if position is not None:
+                del self.positions[key]
+                self.keys[position] = None
+                self.deleted += 1
+                self.chunked.discard(position)
+                self.__forget_texts(position)
+            return
+
+        if position is None:
+            position = self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            for column in self.columns:
+                column.append("")
+        for column, value in zip(self.columns, self.__row(record)):
+            column[position] = value
+        if self.__is_chunked(record):
+            self.chunked.add(position)
+        else:
+            self.chunked.discard(position)
+        self.__forget_texts(position)
+
+    def __update(self, changes: list[tuple[Operation, Operation]]) -> None:
+        for key in changed_keys(changes):
+            self.__refresh(key)
+        # rebuild when most rows are left by deleted records
+        if self.deleted > len(self.keys) // 2:
+            self.__build()
+
+    def get_texts(self, chunk: int, indexes: set[int]) -> dict[int, str]:
+        """ Returns text of the chunk for each of the columns """
+        start = chunk * self.chunk_size
+        for index in indexes:
+            if (chunk, index) not in self.texts:
+                self.texts[chunk, index] = ROW_SEPARATOR.join(self.columns[index][start:start + self.chunk_size])
+        return {index: self.texts[chunk, index] for index in indexes}
+
+pool: ProcessPoolExecutor | None = None
+pool_lock = Lock()
+
+def get_pool() -> ProcessPoolExecutor:
+    """ Returns process pool shared by scans, workers are started on first parallel scan """
+    global pool
+    with pool_lock:
+        if pool is None:
+            # spawned workers don't inherit threads and locks of the interactive session
+            pool = ProcessPoolExecutor(os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(pool.shutdown, cancel_futures=True)
+        return pool
+
+def scan(book: Book, conditions: list[str]) -> list:
+    """
+    Returns records of the book matching all conditions, in the order of the book.
+    Huge books are scanned by chunks in parallel processes, workers get text of the compared columns rather than records.
+    """
+    parsed = [parse_condition(condition, book.SCAN_FIELDS) for condition in conditions]
+    chunks = ScanChunks.get(book)
+    size = len(chunks.keys)
+
+    if size < PARALLEL_THRESHOLD or (os.cpu_count() or 1) < 2:
+        positions = scan_columns(dict(enumerate(chunks.columns)), parsed, size)
+    else:
+        indexes = {index for index, _, _ in parsed}
+        starts = range(0, size, chunks.chunk_size)
+        texts = [chunks.get_texts(start // chunks.chunk_size, indexes) for start in starts]
+        sizes = [min(chunks.chunk_size, size - start) for start in starts]
+        positions = []
+        for start, chunk_positions in zip(starts, get_pool().map(scan_chunk, texts, repeat(parsed), sizes)):
+            positions += [start + position for position in chunk_positions]
+
+    # rows with a part of text of a chunked field are matched against the whole text, read chunk by chunk
+    if chunks.chunked and any(book.SCAN_FIELDS[index] in book.CHUNKED_SCAN_FIELDS for index, _, _ in parsed):
+        matched = {position for position in chunks.chunked if chunks.keys[position] is not None and
+                   matches_chunked(book, chunks, position, parsed)}
+        positions = sorted(matched.union(position for position in positions if position not in chunks.chunked))
+
+    # deleted records leave rows without keys
+    return [book.data[key] for key in map(chunks.keys.__getitem__, positions) if key is not None]
+
+def matches_chunked(book: Book, chunks: ScanChunks, position: int, conditions: list[tuple[int, str, str]]) -> bool:
+    """ Returns True if row matches all conditions, chunked fields are compared by their whole text """
+    record = book.data[chunks.keys[position]]
+    for index, operator, value in conditions:
+        text_chunks = book.scan_chunks(record, book.SCAN_FIELDS[index])
+        if text_chunks is None:
+            matched = text_matches(chunks.columns[index][position], operator, value)
+        else:
+            matched = chunks_match(text_chunks, operator, value)
+        if not matched:
+            return False
+    return True
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Awaitable, Callable
+
+class Scheduler:
+    """
+    Runs periodic background jobs in the asyncio event loop of the prompt.
+    Blocking jobs run in the default executor, so the prompt stays responsive.
+    """
+    def __init__(self, on_error: Callable[[Exception], None] = None):
+        self.on_error = on_error
+        self.jobs = []
+        self.tasks = []
+
+    def every(self, seconds: float, job: Callable[[], None | Awaitable], blocking: bool = True, immediately: bool = False) -> None:
+        """
+        Registers a job to run every given number of seconds
+        blocking: bool - run the job in executor, otherwise job must return awaitable
+        immediately: bool - also run the job on start
+        """
+        self.jobs.append((seconds, job, blocking, immediately))
+
+    def start(self) -> None:
+        """ Starts registered jobs, must be called from running event loop """
+        for seconds, job, blocking, immediately in self.jobs:
+            self.tasks.append(asyncio.create_task(self.__run_periodically(seconds, job, blocking, immediately)))
+
+    async def stop(self) -> None:
+        """ Cancels running jobs and waits until they stop """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def __run_periodically(self, seconds: float, job: Callable, blocking: bool, immediately: bool) -> None:
+        if not immediately:
+            await asyncio.sleep(seconds)
+        while True:
+            try:
+                if blocking:
+                    await asyncio.to_thread(job)
+                else:
+                    await job()
+            # job failure should not stop other jobs or next runs
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+            await asyncio.sleep(seconds)
@@ -1,7 +1,15 @@
+import hashlib
+import os
 import pickle
+import zlib
+from itertools import islice
+from typing import BinaryIO, Callable, ContextManager, Iterable, Iterator
 
+from nestor.models.book import Book
 from nestor.models.contacts_book import ContactsBook
-from nestor.models.notes_book import NotesBook
+from nestor.models.notes_book import LargeContent, NotesBook
+from nestor.services.chunk_store import ChunkStore
+from nestor.utils.paused_gc import paused_gc
 
 
 class Storage:
@@ -12,6 +20,280 @@ class Storage:
         self.contacts_book = ContactsBook()
         self.notes_book = NotesBook()
 
+    def get_books(self) -> list[Book]:
+        """
+        Returns all books of the storage.
+        """
+        return [self.contacts_book, self.notes_book]
+
+    def get_book(self, kind: str) -> Book:
+        """
+        Returns book by its kind, e.g. 'contacts'.
+        """
+        return next(book for book in self.get_books() if book.KIND == kind)
+
+    def begin(self) -> None:
+        """
+        Starts transaction in all books.
+        """
+        for book in self.get_books():
+            book.begin()
+
+    def commit(self) -> None:
+        """
+        Commits transaction of all books.
+        """
+        for book in self.get_books():
+            book.commit()
+
+    def rollback(self) -> None:
+        """
+        Reverts changes of transaction in all books.
+        """
+        for book in self.get_books():
+            book.rollback()
+
+    def in_transaction(self) -> bool:
+        """
+        Returns True if transaction is open, its changes are not saved until commit.
+        """
+        return any(book.in_transaction() for book in self.get_books())
+
+
+# data files start with it, files saved before are a single pickle of Storage
+MAGIC = b"NESTOR DATA 2\n"
+
+BOOK_FRAME = "book"
+RECORDS_FRAME = "records"
+ORDER_FRAME = "order"
+END_FRAME = "end"
+
+# a batch of records ends after a key whose hash is divisible by it, so boundaries depend on keys only
+BATCH_DIVISOR = 1000
+MAX_BATCH_SIZE = 8 * BATCH_DIVISOR
+# keys in a frame of book order
+ORDER_BATCH_SIZE = 100_000
+# chunk file of large notes is compacted when less of it is referenced
+CHUNKS_COMPACT_RATIO = 0.5
+# bytes of data file hashed at once, see data_file_version()
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def chunks_filename(filename: str, generation: int) -> str:
+    """ Returns chunk file of large notes of the data file, compaction of chunks writes the next generation of it """
+    base = filename.removesuffix(".pkl")
+    return f"{base}.chunks" if generation == 0 else f"{base}.{generation}.chunks"
+
+
+def ends_batch(key: str, size: int) -> bool:
+    """ Returns True if a batch of records ends with the key, size is the number of records in the batch with it """
+    return size >= MAX_BATCH_SIZE or zlib.crc32(key.encode("utf-8")) % BATCH_DIVISOR == 0
+
+
+def batched_records(records: Iterable[tuple[str, object]]) -> Iterator[list[tuple[str, object]]]:
+    """
+    Splits (key, record) pairs sorted by key into batches.
+    A change of a record changes only its batch, a new or deleted record changes only the batch of its key,
+    so the same records make the same batches in different files.
+    """
+    batch = []
+    for key, record in records:
+        batch.append((key, record))
+        if ends_batch(key, len(batch)):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def has_chunks(records: list[tuple[str, object]]) -> bool:
+    """ Returns True if a record has content in chunk store, e.g. a large note """
+    return any(isinstance(getattr(record, "content", None), LargeContent) for _, record in records)
+
+
+class RecordsBatch:
+    """
+    Batch of records of a data file, records are read on demand, so batches which are the same in two files are never read.
+    digest: bytes - hash of saved batch, None if the batch was not saved in batches
+    chunks: bool - True if records have content in chunk store of the file
+    read: function returning records, or their saved bytes if raw is True
+    """
+    def __init__(self, first_key: str, last_key: str, count: int, digest: bytes | None, chunks: bool, read: Callable[..., object]):
+        self.first_key = first_key
+        self.last_key = last_key
+        self.count = count
+        self.digest = digest
+        self.chunks = chunks
+        self.read = read
+
+    def same(self, other: "RecordsBatch") -> bool:
+        """
+        Returns True if batches have the same saved bytes, so their records are the same.
+        Records with content in chunk stores are never the same by bytes, their references point to different files.
+        Different bytes don't mean different records.
+        """
+        if self.digest is None or self.chunks or other.chunks:
+            return False
+        return (self.first_key, self.last_key, self.count, self.digest) == (other.first_key, other.last_key, other.count, other.digest)
+
+
+class DataFileWriter:
+    """
+    Writes data file as frames: state of each book, its records in batches sorted by key, order of its records.
+    A frame is a small pickled header followed by its pickled payload, so readers skip payloads they don't need.
+    """
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        f.write(MAGIC)
+
+    def __frame(self, frame_type: str, kind: str, payload: bytes, *meta) -> None:
+        pickle.dump((frame_type, kind, len(payload), *meta), self.f)
+        self.f.write(payload)
+
+    def write_state(self, kind: str, state: dict) -> None:
+        """ Writes attributes of the book other than its records """
+        self.__frame(BOOK_FRAME, kind, pickle.dumps(state))
+
+    def write_records(self, kind: str, records: Iterable[tuple[str, object]]) -> None:
+        """ Writes (key, record) pairs sorted by key in batches """
+        for batch in batched_records(records):
+            self.write_batch(kind, pickle.dumps(batch), batch[0][0], batch[-1][0], len(batch), has_chunks(batch))
+
+    def write_batch(self, kind: str, payload: bytes, first_key: str, last_key: str, count: int, chunks: bool) -> None:
+        """ Writes pickled batch as is, e.g. a batch copied from another file """
+        self.__frame(RECORDS_FRAME, kind, payload, first_key, last_key, count, hashlib.blake2b(payload, digest_size=16).digest(), chunks)
+
+    def write_order(self, kind: str, keys: Iterable[str]) -> None:
+        """ Writes keys in order of the book, records are loaded in it """
+        keys = iter(keys)
+        while batch := list(islice(keys, ORDER_BATCH_SIZE)):
+            self.__frame(ORDER_FRAME, kind, pickle.dumps(batch))
+
+    def write_book(self, book: Book) -> None:
+        state = book.__getstate__()
+        data = state.pop("data")
+        self.write_state(book.KIND, state)
+        self.write_records(book.KIND, ((key, data[key]) for key in sorted(data)))
+        self.write_order(book.KIND, data.keys())
+
+    def close(self) -> None:
+        pickle.dump((END_FRAME, None, 0), self.f)
+
+
+class DataFile:
+    """
+    Data file read frame by frame, so records of big books are streamed in batches and memory stays bounded.
+    Files saved before batches are loaded whole, their records are split into batches in memory.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.legacy_storage: Storage | None = None
+
+    def store(self) -> ChunkStore:
+        """ Returns chunk store of large notes of the file """
+        return ChunkStore(chunks_filename(self.filename, self.book_state(NotesBook.KIND).get("chunks_generation", 0)))
+
+    def frames(self) -> Iterator[tuple[str, str, tuple, Callable[..., object]]]:
+        """
+        Yields (frame type, book kind, header values, function reading payload) of each frame, payloads which are not read are skipped.
+        Payload is read as saved bytes if raw argument is True.
+        """
+        with open(self.filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                yield from self.__legacy_frames(f)
+                return
+            while True:
+                frame_type, kind, size, *meta = pickle.load(f)
+                if frame_type == END_FRAME:
+                    return
+                start = f.tell()
+
+                def read(raw: bool = False, start=start, size=size):
+                    f.seek(start)
+                    payload = f.read(size)
+                    return payload if raw else pickle.loads(payload)
+
+                yield frame_type, kind, tuple(meta), read
+                f.seek(start + size)
+
+    def __legacy_frames(self, f: BinaryIO) -> Iterator[tuple[str, str, tuple, Callable[..., object]]]:
+        if self.legacy_storage is None:
+            f.seek(0)
+            self.legacy_storage = pickle.load(f)
+
+        def reader(value) -> Callable[..., object]:
+            return lambda raw=False: pickle.dumps(value) if raw else value
+
+        for book in self.legacy_storage.get_books():
+            state = book.__getstate__()
+            data = state.pop("data")
+            yield BOOK_FRAME, book.KIND, (), reader(state)
+            for batch in batched_records((key, data[key]) for key in sorted(data)):
+                yield RECORDS_FRAME, book.KIND, (batch[0][0], batch[-1][0], len(batch), None, has_chunks(batch)), reader(batch)
+            yield ORDER_FRAME, book.KIND, (), reader(list(data))
+
+    def book_state(self, kind: str) -> dict:
+        return next(read() for frame_type, frame_kind, _, read in self.frames() if (frame_type, frame_kind) == (BOOK_FRAME, kind))
+
+    def batches(self, kind: str) -> Iterator[RecordsBatch]:
+        """ Yields batches of records of the book in order of their keys """
+        for frame_type, frame_kind, meta, read in self.frames():
+            if (frame_type, frame_kind) == (RECORDS_FRAME, kind):
+                yield RecordsBatch(*meta, read)
+
+    def order(self, kind: str) -> Iterator[str]:
+        """ Yields keys of records of the book in its order """
+        for frame_type, frame_kind, _, read in self.frames():
+            if (frame_type, frame_kind) == (ORDER_FRAME, kind):
+                yield from read()
+
+    def load(self) -> Storage:
+        """ Returns storage with all books of the file """
+        # loading allocates a lot, cyclic garbage collector would repeatedly walk records loaded so far
+        with paused_gc():
+            return self.__load()
+
+    def __load(self) -> Storage:
+        with open(self.filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                f.seek(0)
+                return pickle.load(f)
+
+        storage = Storage()
+        # (key, record) pairs by key, keys of pairs are strings of records, keys of order are their copies
+        records: dict[str, dict[str, tuple[str, object]]] = {}
+        orders: dict[str, list[str]] = {}
+        for frame_type, kind, _, read in self.frames():
+            if frame_type == BOOK_FRAME:
+                storage.get_book(kind).__setstate__({**read(), "data": {}})
+            elif frame_type == RECORDS_FRAME:
+                records.setdefault(kind, {}).update((pair[0], pair) for pair in read())
+            elif frame_type == ORDER_FRAME:
+                orders.setdefault(kind, []).extend(read())
+
+        for book in storage.get_books():
+            book_records = records.pop(book.KIND, {})
+            if book_records:
+                # records are saved sorted by key, they are loaded in order of the book
+                book.data = dict(book_records.pop(key) for key in orders.get(book.KIND, []) if key in book_records)
+                book.data.update(book_records.values())
+        return storage
+
+
+def data_file_version(filename: str) -> str | None:
+    """
+    Returns hash of data file, None if there is no file.
+    Saving the same records gives the same file, so indexes saved for it stay valid after the next session saves unchanged data.
+    """
+    digest = hashlib.blake2b()
+    try:
+        with open(filename, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
 
 class Serializer:
     """
@@ -19,21 +301,89 @@ class Serializer:
     """
     def __init__(self, filename):
         self.filename = f"{filename}.pkl"
+        self.indexes_filename = f"{filename}.indexes"
 
     def load_data(self) -> Storage:
         """
         Loads data from file, returns empty contacts book if file not found.
         """
         try:
-            with open(self.filename, "rb") as f:
-                return pickle.load(f)
+            storage = DataFile(self.filename).load()
         except FileNotFoundError:
             # Return empty contacts book if file not found
-            return Storage()
+            storage = Storage()
+        # contents of large notes are kept next to the data file
+        storage.notes_book.store = ChunkStore(chunks_filename(self.filename, storage.notes_book.chunks_generation))
+        return storage
+
+    def save_data(self, storage: Storage, compact: bool = False):
+        """
+        Saves data to file, records are saved in batches, see DataFileWriter.
+        The file is written next to the data file and replaces it when complete, so a crash while saving keeps the previous data.
+        compact: bool - drop chunks of large notes which are not referenced any more if they take most of the chunk file,
+        it's done at the end of a session only, as undo log may refer to old chunks
+        """
+        previous_store = self.__compact_chunks(storage) if compact else None
+        temporary_filename = f"{self.filename}.tmp"
+        try:
+            with open(temporary_filename, "wb") as f:
+                writer = DataFileWriter(f)
+                for book in storage.get_books():
+                    writer.write_book(book)
+                writer.close()
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_filename, self.filename)
+        finally:
+            if os.path.exists(temporary_filename):
+                os.remove(temporary_filename)
+        # saved data refers to the compacted chunk file now
+        if previous_store is not None:
+            os.remove(previous_store.filename)
+
+    def __compact_chunks(self, storage: Storage) -> ChunkStore | None:
+        """
+        Copies chunks referenced by large notes and their previous versions to the next chunk file and updates the references,
+        returns the previous store or None if it's not worth compacting.
+        The previous file is kept until the data file referring to the new one is saved.
+        """
+        book = storage.notes_book
+        store = book.store
+        if store is None or not os.path.exists(store.filename):
+            return None
+        contents = book.large_contents()
+        refs = dict.fromkeys(ref for content in contents for ref in content.refs)
+        if sum(size for _, size in refs) >= os.path.getsize(store.filename) * CHUNKS_COMPACT_RATIO:
+            return None
+
+        generation = book.chunks_generation + 1
+        moved = store.copy_to(refs, chunks_filename(self.filename, generation))
+        for content in contents:
+            content.refs = [moved[ref] for ref in content.refs]
+        book.chunks_generation = generation
+        book.store = ChunkStore(chunks_filename(self.filename, generation))
+        return store
+
+    def warm_up_indexes(self, storage: Storage, lock: Callable[[], ContextManager]) -> None:
+        """
+        Builds indexes of contacts in background right after load_data(), they are loaded from indexes file if it was saved for the same data.
+        lock: function returning lock of storage held by commands
+        """
+        # index code isn't needed by single commands of batch mode
+        from nestor.services.indexes import ContactIndexes, load_indexes
+
+        def load():
+            version = data_file_version(self.filename)
+            return load_indexes(self.indexes_filename, version) if version else {}
+
+        ContactIndexes.get(storage.contacts_book).start_warm_up(lock, load)
 
-    def save_data(self, storage: Storage):
+    def save_indexes(self, storage: Storage) -> None:
         """
-        Saves data to file.
+        Saves indexes of contacts next to data file, so the next session doesn't build them.
+        Called right after save_data(), indexes are valid only for the saved version of data file.
         """
-        with open(self.filename, "wb") as f:
-            pickle.dump(storage, f)
\ No newline at end of file
+        indexes = storage.contacts_book.caches.get("indexes")
+        version = data_file_version(self.filename)
+        if indexes is not None and version:
+            indexes.save(self.indexes_filename, version)
\ No newline at end of file
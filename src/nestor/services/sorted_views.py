@@ -0,0 +1,112 @@
+from itertools import islice
+
+from nestor.models.book import Book
+from nestor.models.operation import Operation, changed_keys
+from nestor.utils.sorted_list import SortedList
+
+# greater than any key of records, closes range of entries with the same sort value
+MAX_KEY = "\U0010ffff"
+
+# records on a page of listing
+PAGE_SIZE = 50
+LISTING_OPTIONS = ("--sort", "--from", "--to", "--page")
+
+class SortedView:
+    """
+    Keys of book records in order of a field, records without the field are at the end.
+    Entries are (sort value, key) pairs kept in a sorted list, so a range of values is found by binary search.
+    The view is kept in sync with the book through its listeners.
+    """
+    def __init__(self, book: Book, field: str):
+        self.book = book
+        self.field = field
+        # sort entries of records, to remove them when records change
+        self.entries_of = {key: self.__entry(key, record) for key, record in book.data.items()}
+        self.entries = SortedList(self.entries_of.values())
+        book.listeners.append(self.__update)
+
+    @staticmethod
+    def get(book: Book, field: str) -> "SortedView":
+        """ Returns view of the book sorted by the field, it's built on first use """
+        if field not in book.SORT_FIELDS:
+            raise ValueError(f"Unknown sort field '{field}', use one of: {', '.join(book.SORT_FIELDS)}")
+        return book.cache(f"sorted.{field}", lambda book: SortedView(book, field))
+
+    def __entry(self, key: str, record) -> tuple:
+        value = self.book.sort_value(record, self.field)
+        return (value is None, value), key
+
+    def __update(self, changes: list[tuple[Operation, Operation]]) -> None:
+        for key in changed_keys(changes):
+            old = self.entries_of.pop(key, None)
+            record = self.book.data.get(key)
+            new = self.__entry(key, record) if record is not None else None
+            if old != new:
+                if old is not None:
+                    self.entries.remove(old)
+                if new is not None:
+                    self.entries.add(new)
+            if new is not None:
+                self.entries_of[key] = new
+
+    def range(self, lower=None, upper=None) -> tuple[int, int]:
+        """
+        Returns positions of entries with values from lower to upper, bounds are included.
+        Text upper bound is a prefix, e.g. names from 'm' to 'p' include 'Peter'.
+        Records without the field are only in the range without bounds.
+        """
+        if lower is None and upper is None:
+            return 0, len(self.entries)
+        start = self.entries.bisect_left(((False, lower),)) if lower is not None else 0
+        if upper is None:
+            return start, self.entries.bisect_left(((True,),))
+        if isinstance(upper, str):
+            upper += MAX_KEY
+        return start, max(start, self.entries.bisect_right(((False, upper), MAX_KEY)))
+
+    def keys(self, start: int, stop: int) -> list[str]:
+        return [key for _, key in self.entries.islice(start, stop)]
+
+def parse_listing_options(args: list[str]) -> dict:
+    """ Returns arguments of select_page() given as options, e.g. ['--sort', 'name', '--page', '2'] """
+    options = {}
+    for name, value in zip(args[::2], args[1::2] + [None]):
+        if name not in LISTING_OPTIONS:
+            raise ValueError(f"Unknown option '{name}', use {', '.join(LISTING_OPTIONS)}")
+        if value is None:
+            raise ValueError(f"Value of {name} is required")
+        options[name[2:]] = value
+
+    if "page" in options:
+        if not options["page"].isdigit():
+            raise ValueError("Page should be a number")
+        options["page"] = int(options["page"])
+    options["lower"] = options.pop("from", None)
+    options["upper"] = options.pop("to", None)
+    return options
+
+def select_page(book: Book, sort: str = None, lower: str = None, upper: str = None, page: int = None, page_size: int = PAGE_SIZE) -> tuple[list, int]:
+    """
+    Returns records of a listing and total number of records in it.
+    Listing is sorted by the field if given, bounds are parsed by the book; page is counted from 1.
+    """
+    if (lower is not None or upper is not None) and sort is None:
+        raise ValueError("--from and --to need --sort")
+    if page is not None and page < 1:
+        raise ValueError("Page is counted from 1")
+
+    if sort is None:
+        start, stop = 0, len(book.data)
+    else:
+        view = SortedView.get(book, sort)
+        start, stop = view.range(
+            book.parse_sort_value(sort, lower) if lower is not None else None,
+            book.parse_sort_value(sort, upper) if upper is not None else None
+        )
+    total = stop - start
+    if page is not None:
+        start, stop = min(start + (page - 1) * page_size, stop), min(start + page * page_size, stop)
+
+    if sort is None:
+        return list(islice(book.data.values(), start, stop)), total
+    return [book.data[key] for key in view.keys(start, stop)], total
@@ -0,0 +1,48 @@
+import json
+
+from nestor.services.ui import UserInterface
+
+class RecordingInterface(UserInterface):
+    """
+    Wraps user interface and remembers answers given to command prompts.
+    Other attributes are taken from the wrapped interface.
+    """
+    def __init__(self, cli: UserInterface):
+        self.cli = cli
+        self.inputs = []
+
+    def output(self, text: str) -> None:
+        self.cli.output(text)
+
+    def output_lines(self, lines) -> bool:
+        # answers to pager are not recorded, replayed commands are not paged
+        return self.cli.output_lines(lines)
+
+    def prompt(self, text: str, default_value: str = None, completion: list[str] = None, skip_history: bool = False) -> str:
+        value = self.cli.prompt(text, default_value, completion, skip_history)
+        self.inputs.append(value)
+        return value
+
+    def get_page_size(self) -> int | None:
+        return self.cli.get_page_size()
+
+    def __getattr__(self, name):
+        return getattr(self.cli, name)
+
+class TraceRecorder:
+    """
+    Appends executed commands to JSON Lines file, one object per command:
+    {"command": str, "args": [str], "inputs": [str]}
+    inputs are answers to command fields, so the trace can be replayed headless.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def record(self, command: str, args: list[str], inputs: list[str]) -> None:
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"command": command, "args": list(args), "inputs": list(inputs)}, ensure_ascii=False) + "\n")
+
+def read_trace(filename: str) -> list[dict]:
+    """ Returns commands recorded to trace file """
+    with open(filename, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,69 +1,240 @@
+import json
+import shutil
+import sys
+from itertools import islice
+from typing import Iterable
 
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
-from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.completion import Completer, WordCompleter, PathCompleter
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from nestor.services.results import json_objects
+from nestor.utils.cancellation import is_cancelled, raise_if_cancelled
 
-class ContextualCompleter(Completer):
-    def __init__(self, commands: list[str]):
-        # Define command completers
-        self.command_completer = WordCompleter(commands, ignore_case=True)
-        # Define path completer for file system paths
-        self.path_completer = PathCompleter()
-
-    def get_completions(self, document, complete_event):
-        text_before_cursor = document.text_before_cursor
-        words = text_before_cursor.split()
-
-        if len(words) == 1 and text_before_cursor.strip() == text_before_cursor:
-            # Provide command completions for the first word
-            return self.command_completer.get_completions(document, complete_event)
-        else:
-
-            # Provide path completions for subsequent words
-            return self.path_completer.get_completions(document, complete_event)
-        
+PAGER_PROMPT = "-- Enter to continue, q to quit -- "
+# lines written at once when output is not paged
+OUTPUT_BATCH_SIZE = 1000
 
 class UserInterface:
     def output(self, text: str) -> None:
         pass
 
+    def output_lines(self, lines: Iterable[str]) -> bool:
+        """
+        Outputs lines page by page, asking to continue after each page if output is paged.
+        Lines are taken as they are shown, so long output is never joined whole, quitting the pager stops producing it.
+        Returns False if the pager was quit.
+        """
+        page_size = self.get_page_size()
+        lines = iter(lines)
+        page = list(islice(lines, page_size or OUTPUT_BATCH_SIZE))
+        while page:
+            raise_if_cancelled()
+            self.output("\n".join(page))
+            page = list(islice(lines, page_size or OUTPUT_BATCH_SIZE))
+            if page and page_size:
+                try:
+                    if self.prompt(PAGER_PROMPT, skip_history=True).strip().lower() == "q":
+                        return False
+                except KeyboardInterrupt:
+                    return False
+        return True
+
     def prompt(self, text: str, default_value: str = None, completion: list[str] = None) -> str:
         pass
 
+    def get_page_size(self) -> int | None:
+        """ Returns number of lines to show before asking to continue, None if output is not paged """
+        return None
+
+class PlainInterface(UserInterface):
+    """
+    A lightweight interface for batch commands.
+
+    Uses builtin print and input, so prompt_toolkit is never imported.
+    """
+    def output(self, text: str) -> None:
+        """ Prints the given text."""
+        print(text)
+
+    def prompt(self, text: str, default_value: str = None, completion: list[str] = None, skip_history: bool = False) -> str:
+        try:
+            value = input(text)
+        # treat closed stdin as interrupted input
+        except EOFError as e:
+            raise KeyboardInterrupt() from e
+        return value if value else (default_value or "")
+
+    def output_lines(self, lines: Iterable[str]) -> bool:
+        try:
+            return super().output_lines(lines)
+        finally:
+            # batches of lines are written to stdout buffer, it's flushed once
+            sys.stdout.flush()
+
+    def get_page_size(self) -> int | None:
+        # output redirected to a file or a pipe is not paged
+        if not (sys.stdin.isatty() and sys.stdout.isatty()):
+            return None
+        return max(shutil.get_terminal_size().lines - 2, 1)
+
+class JsonLinesInterface(PlainInterface):
+    """
+    Interface for scripts reading output of batch commands, see '--output jsonl'.
+
+    Writes a JSON object per line: records as objects of their fields, messages as {"status": ..., "message": ...},
+    other text as {"text": ...}. Tables and colors are never rendered.
+    Prompts for command fields go to stderr, so stdout has only JSON.
+    """
+    def output(self, text: str) -> None:
+        # blank lines only space out human output
+        if text is not None and text.strip():
+            self.__write(json_objects(text))
+            sys.stdout.flush()
+
+    def output_lines(self, lines: Iterable[str]) -> bool:
+        try:
+            self.__write(json_objects(lines))
+        finally:
+            sys.stdout.flush()
+        return True
+
+    def __write(self, objects: Iterable[dict]) -> None:
+        objects = iter(objects)
+        batch = list(islice(objects, OUTPUT_BATCH_SIZE))
+        while batch:
+            sys.stdout.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch))
+            batch = list(islice(objects, OUTPUT_BATCH_SIZE))
+
+    def prompt(self, text: str, default_value: str = None, completion: list[str] = None, skip_history: bool = False) -> str:
+        sys.stderr.write(text)
+        sys.stderr.flush()
+        line = sys.stdin.readline()
+        # treat closed stdin as interrupted input
+        if not line:
+            raise KeyboardInterrupt()
+        value = line.rstrip("\n")
+        return value if value else (default_value or "")
+
+    def get_page_size(self) -> int | None:
+        return None
+
+class ScriptedInterface(UserInterface):
+    """
+    Headless interface for commands run by a server or a script.
+
+    Output is collected in outputs list, prompts are answered from given inputs.
+    When inputs run out, prompt is interrupted like Ctrl+C.
+    """
+    def __init__(self, inputs: list[str] = None):
+        self.inputs = list(inputs) if inputs else []
+        self.outputs = []
+
+    def output(self, text: str) -> None:
+        self.outputs.append(str(text))
+
+    def output_lines(self, lines: Iterable[str]) -> bool:
+        # output of a command is one text for clients
+        self.outputs.append("\n".join(lines))
+        return True
+
+    def prompt(self, text: str, default_value: str = None, completion: list[str] = None, skip_history: bool = False) -> str:
+        if not self.inputs:
+            raise KeyboardInterrupt()
+        value = self.inputs.pop(0)
+        return value if value else (default_value or "")
+
 class CommandLineInterface(UserInterface):
     """
     A class representing a command-line interface for user interaction.
 
     This class inherits from the UserInterface class and provides methods for outputting text and prompting the user for input.
+    prompt_toolkit is imported when the interface is created, not when the module is imported.
 
     Attributes:
-        None
+        history: command history, saved to history_filename if given, up to history_size entries
+        session: prompt session reused for every command prompt
+        field_session: prompt session for command fields, which are not saved to history
+        prompting: True while a command waits for field input
 
     Methods:
         output(text: str) -> None: Outputs the given text to the command line.
         prompt(text: str, completion: list[str]) -> str: Prompts the user with the given text and a list of possible completions, and returns the user's input as a string.
+        prompt_async(text: str, completion: list[str]) -> str: Same as prompt, to be awaited in asyncio event loop.
     """
-    style = Style.from_dict({
-        'prompt': '#4f8dd4',
-        'input': '#000000'
-    })
 
-    def __init__(self):
-        self.history = InMemoryHistory()
+    def __init__(self, history_filename: str = None, history_size: int = 1000):
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.styles import Style
+        from prompt_toolkit.history import DummyHistory, InMemoryHistory
+        from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+        from nestor.services.history import BoundedFileHistory
+
+        self.style = Style.from_dict({
+            'prompt': '#4f8dd4',
+            'input': '#000000',
+            # matches of live search, the line stays blank without them
+            'bottom-toolbar': 'noreverse #888888'
+        })
+        self.history = BoundedFileHistory(history_filename, history_size) if history_filename else InMemoryHistory()
         self.auto_suggest = AutoSuggestFromHistory()
+        # long-lived sessions, one for commands and one for fields which are not saved to history
+        self.session = PromptSession(history=self.history, auto_suggest=self.auto_suggest, style=self.style)
+        self.field_session = PromptSession(history=DummyHistory(), auto_suggest=self.auto_suggest, style=self.style)
+        self.completers = {}
+        self.prompting = False
+        self.live_search = None
 
     def output(self, text: str) -> None:
-        """ Prints the given text."""
+        """ Prints the given text, output of cancelled command is dropped."""
+        if is_cancelled():
+            return
         print(text)
 
     def prompt(self, text: str, default_value: str = None, completion: list[str] = None, skip_history: bool = False) -> str:
-        return prompt(
-                message=text,
-                default=default_value if default_value else "",
-                completer=ContextualCompleter(completion if completion else []),
-                history=self.history if not skip_history else None,
-                auto_suggest=self.auto_suggest,
-                style=CommandLineInterface.style
-            )
+        raise_if_cancelled()
+        session = self.field_session if skip_history else self.session
+
+        self.prompting = True
+        try:
+            return session.prompt(
+                    message=text,
+                    default=default_value if default_value else "",
+                    completer=self.__get_completer(completion)
+                )
+        finally:
+            self.prompting = False
+
+    def get_page_size(self) -> int | None:
+        # room for the line asking to continue
+        return max(shutil.get_terminal_size().lines - 2, 1)
+
+    async def prompt_async(self, text: str, completion: list[str] = None) -> str:
+        """ Prompts for a command without blocking the event loop, matches of a search being typed are shown under it """
+        if self.live_search is None:
+            return await self.session.prompt_async(
+                    message=text,
+                    completer=self.__get_completer(completion)
+                )
+
+        self.live_search.reset()
+        try:
+            return await self.session.prompt_async(
+                    message=text,
+                    completer=self.__get_completer(completion),
+                    bottom_toolbar=lambda: self.live_search.text
+                )
+        finally:
+            # the command must not wait for the search
+            self.live_search.reset()
+
+    def set_live_search(self, live_search) -> None:
+        """ Shows matches of search-contacts and search-notes under the command prompt as they are typed, see LiveSearch """
+        self.live_search = live_search
+        live_search.on_change = self.session.app.invalidate
+        self.session.default_buffer.on_text_changed += lambda buffer: live_search.update(buffer.text)
+
+    def __get_completer(self, completion: list[str] | None):
+        """ Returns completer for given commands, it's created once per set of commands """
+        from nestor.services.completers import ContextualCompleter
+
+        key = tuple(completion) if completion else ()
+        if key not in self.completers:
+            self.completers[key] = ContextualCompleter(list(key))
+        return self.completers[key]
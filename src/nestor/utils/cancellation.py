@@ -0,0 +1,18 @@
+from contextvars import ContextVar
+from threading import Event
+
+class CommandCancelledError(Exception):
+    pass
+
+# Cancel event of the command running in current context, None outside of cancellable commands
+cancel_event: ContextVar[Event | None] = ContextVar("cancel_event", default=None)
+
+def is_cancelled() -> bool:
+    """ Returns True if current command was cancelled """
+    event = cancel_event.get()
+    return event is not None and event.is_set()
+
+def raise_if_cancelled() -> None:
+    """ Stops current command if it was cancelled """
+    if is_cancelled():
+        raise CommandCancelledError("Command cancelled")
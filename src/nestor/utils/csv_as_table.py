@@ -1,5 +1,114 @@
 import csv
-from tabulate import tabulate
+from typing import Iterable, Iterator
+
+from nestor.utils.cancellation import raise_if_cancelled
+from nestor.utils.to_csv import to_rows
+
+# column types from the least to the most generic, like in tabulate
+NONE, BOOL, INT, FLOAT, TEXT = range(5)
+# spaces around header, a column is at least that wider than its header
+MIN_PADDING = 2
+
+def cell_type(value: str) -> int:
+	if value in ("True", "False"):
+		return BOOL
+	try:
+		int(value)
+		return INT
+	except ValueError:
+		pass
+	try:
+		number = float(value)
+	except ValueError:
+		return TEXT
+	# 'nan' and 'inf' are numbers, other spellings of them are text
+	if number != number or number in (float("inf"), float("-inf")):
+		return FLOAT if value.lower() in ("inf", "-inf", "nan") else TEXT
+	return FLOAT
+
+def text_width(text: str) -> int:
+	""" Returns number of terminal columns the text takes, wide characters take two """
+	if text.isascii():
+		return len(text)
+	from wcwidth import wcswidth
+
+	width = wcswidth(text)
+	return width if width >= 0 else len(text)
+
+def after_point(value: str) -> int:
+	""" Returns number of characters after decimal point or exponent, -1 for integers """
+	if cell_type(value) != FLOAT:
+		return -1
+	position = value.rfind(".")
+	if position < 0:
+		position = value.lower().rfind("e")
+	return len(value) - position - 1 if position >= 0 else -1
+
+def table_lines(headers: list[str], rows: Iterable[list[str]]) -> Iterator[str]:
+	"""
+	Yields lines of grid table, the same as 'grid' format of tabulate.
+	Columns are measured first, lines of rows are formatted only as they are taken, so long tables are streamed.
+	"""
+	columns = len(headers)
+	rows = [row if len(row) >= columns else row + [""] * (columns - len(row)) for row in rows]
+	types = [NONE] * columns
+	for row in rows:
+		for index in range(columns):
+			# empty values are missing, text is the most generic type, other values don't change it
+			if types[index] != TEXT and row[index]:
+				types[index] = max(types[index], cell_type(row[index]))
+
+	# floats are formatted like numbers, integers keep their spelling, e.g. leading zeros of phones
+	floats = [column_type == FLOAT for column_type in types]
+	decimals = [max((after_point(format(float(row[index]), "g")) for row in rows if row[index]), default=-1) if floats[index] else -1 for index in range(columns)]
+
+	def cell(index: int, value: str) -> str:
+		if not floats[index]:
+			return value.strip()
+		value = format(float(value), "g") if value else ""
+		# decimal points of the column are aligned
+		return value + " " * (decimals[index] - after_point(value)) if decimals[index] >= 0 else value
+
+	widths = [text_width(header) + MIN_PADDING for header in headers]
+	for count, row in enumerate(rows):
+		if count % 1000 == 0:
+			raise_if_cancelled()
+		for index in range(columns):
+			text = cell(index, row[index])
+			widths[index] = max(widths[index], max(map(text_width, text.split("\n"))) if "\n" in text else text_width(text))
+
+	right = [column_type in (INT, FLOAT) for column_type in types]
+
+	def align(index: int, text: str) -> str:
+		padding = " " * (widths[index] - text_width(text))
+		return padding + text if right[index] else text + padding
+
+	def line(cells: list[str]) -> str:
+		return "| " + " | ".join(align(index, text) for index, text in enumerate(cells)) + " |"
+
+	separator = "+" + "+".join("-" * (width + 2) for width in widths) + "+"
+	yield separator
+	yield line([header.strip() for header in headers])
+	yield "+" + "+".join("=" * (width + 2) for width in widths) + "+"
+	for count, row in enumerate(rows):
+		if count % 1000 == 0:
+			raise_if_cancelled()
+		cells = [cell(index, row[index]) for index in range(columns)]
+		if any("\n" in text for text in cells):
+			# multiline cells are padded with empty lines to the highest one
+			cell_lines = [text.split("\n") for text in cells]
+			for number in range(max(map(len, cell_lines))):
+				yield line([lines[number] if number < len(lines) else "" for lines in cell_lines])
+		else:
+			yield line(cells)
+		yield separator
+	if not rows:
+		yield separator
+
+def records_table(records: list) -> Iterator[str]:
+	""" Yields lines of table of records, a column per attribute """
+	headers, rows = to_rows(records)
+	return table_lines([header.capitalize() for header in headers], rows)
 
 def csv_as_table(csv_string: str) -> str:
 	""" Convert a CSV string into a formatted table. """
@@ -9,8 +118,5 @@ def csv_as_table(csv_string: str) -> str:
 	headers = list(map(lambda x: x.capitalize(), headers))
 	rows = list(reader)     # Extract the remaining rows
 
-	# Use tabulate to format the table
-	table = tabulate(rows, headers, tablefmt='grid')
-	
 	# Return the formatted table
-	return table
+	return "\n".join(table_lines(headers, rows))
@@ -0,0 +1,90 @@
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Iterable
+
+from nestor.models.contacts_book import Contact
+from nestor.utils.paused_gc import paused_gc
+from nestor.utils.phonetic import soundex
+
+# blocks with more contacts than this don't tell duplicates apart, e.g. a popular phonetic code
+MAX_BLOCK_SIZE = 50
+WORD_REGEXP = re.compile(r"\w+")
+
+def normalize_name(name: str) -> str:
+    """ Returns name in lower case without punctuation, words are sorted, so 'Doe, John' is 'doe john' """
+    return " ".join(sorted(WORD_REGEXP.findall(name.casefold())))
+
+def phonetic_name(name: str) -> str:
+    """ Returns sorted phonetic codes of name words, numbers are kept as they are """
+    return " ".join(sorted([word if word.isdigit() else soundex(word) for word in WORD_REGEXP.findall(name.casefold())]))
+
+def blocking_keys(contact: Contact) -> list[str]:
+    """ Returns keys of blocks the contact belongs to, only contacts sharing a block are compared """
+    words = WORD_REGEXP.findall(contact.name.value.casefold())
+    keys = [
+        "name:" + " ".join(sorted(words)),
+        "sound:" + " ".join(sorted([word if word.isdigit() else soundex(word) for word in words])),
+    ]
+    keys += [f"phone:{phone.value}" for phone in contact.phones]
+    if contact.email:
+        keys.append(f"email:{contact.email.value.casefold()}")
+    return keys
+
+def duplicate_score(a: Contact, b: Contact) -> tuple[float, list[str]]:
+    """ Returns score from 0 to 1 that contacts are the same person and reasons for it """
+    reasons = []
+    name_a, name_b = normalize_name(a.name.value), normalize_name(b.name.value)
+    if name_a == name_b:
+        score = 0.5
+        reasons.append("same name")
+    else:
+        score = 0.5 * SequenceMatcher(None, name_a, name_b).ratio()
+        if phonetic_name(a.name.value) == phonetic_name(b.name.value):
+            reasons.append("similar name")
+
+    if {phone.value for phone in a.phones} & {phone.value for phone in b.phones}:
+        score += 0.3
+        reasons.append("same phone")
+    if a.email and b.email and a.email.value.casefold() == b.email.value.casefold():
+        score += 0.3
+        reasons.append("same email")
+    if a.birthday and b.birthday:
+        if a.birthday.value == b.birthday.value:
+            score += 0.1
+            reasons.append("same birthday")
+        else:
+            score -= 0.3
+
+    return min(max(score, 0.0), 1.0), reasons
+
+def find_duplicates(contacts: Iterable[Contact], threshold: float = 0.5, max_block_size: int = MAX_BLOCK_SIZE) -> list[tuple[str, str, float, list[str]]]:
+    """
+    Returns pairs of contact names that are probably duplicates, with score and reasons, best first.
+    Contacts are grouped into blocks by normalized name, phonetic name, phone and email,
+    only contacts within a block are compared, so it scales with the number of contacts rather than pairs.
+    """
+    blocks = defaultdict(list)
+    # millions of small objects are created, cyclic garbage collector would walk them again and again
+    with paused_gc():
+        for contact in contacts:
+            for key in blocking_keys(contact):
+                blocks[key].append(contact)
+
+    compared = set()
+    result = []
+    for block in blocks.values():
+        if len(block) < 2 or len(block) > max_block_size:
+            continue
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                pair = (a.name.value, b.name.value) if a.name.value < b.name.value else (b.name.value, a.name.value)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                score, reasons = duplicate_score(a, b)
+                if score >= threshold:
+                    result.append((*pair, score, reasons))
+
+    result.sort(key=lambda item: (-item[2], item[0], item[1]))
+    return result
@@ -9,7 +9,8 @@ def input_error(errors_config: dict = {}):
     """
     errors = {
         ValueError: "Contact name and phone are required",
-        IndexError: "Contact name is required"
+        IndexError: "Contact name is required",
+        KeyboardInterrupt: "Command interrupted."
     }
 
     errors.update(errors_config or {})
@@ -0,0 +1,99 @@
+import sys
+import tracemalloc
+from collections import Counter, defaultdict
+
+# containers whose items are walked, other objects are walked through their __dict__ or __slots__
+CONTAINERS = (list, tuple, set, frozenset)
+
+def is_model(obj) -> bool:
+    return type(obj).__module__.startswith("nestor.models")
+
+def children(obj) -> list:
+    """ Returns objects referenced by containers and nestor objects, other objects are leaves """
+    if isinstance(obj, dict):
+        return [*obj.keys(), *obj.values()]
+    if isinstance(obj, CONTAINERS):
+        return list(obj)
+    if isinstance(obj, type) or not type(obj).__module__.startswith("nestor."):
+        return []
+    result = list(vars(obj).values()) if hasattr(obj, "__dict__") else []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                result.append(getattr(obj, name))
+    return result
+
+def sample_items(obj: dict, size: int) -> tuple[list, float]:
+    """ Returns evenly spaced keys and values of dict and weight of each of them """
+    items = list(obj.items())
+    step = len(items) / size
+    return [item for i in range(size) for item in items[int(i * step)]], step
+
+def memory_by_owner(root, stop: set[int] = None, owner: str = None, sample: int = 1000) -> dict[str, list[int]]:
+    """
+    Walks objects reachable from root and returns dict of owner name to [instances, bytes].
+    Model objects own themselves, other objects belong to the nearest model object referencing them.
+    Objects reachable from many owners are counted once, objects with ids in stop are skipped.
+    Of dicts with more than sample model values, e.g. book data, only sample values are walked
+    and their sizes are extrapolated.
+    """
+    sizes = defaultdict(lambda: [0, 0])
+    seen = set(stop or ())
+    stack = [(root, owner or type(root).__name__, 1)]
+
+    while stack:
+        obj, owner, weight = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if is_model(obj):
+            owner = type(obj).__name__
+            sizes[owner][0] += weight
+        sizes[owner][1] += sys.getsizeof(obj) * weight
+
+        if isinstance(obj, dict) and sample and len(obj) > sample and is_model(next(iter(obj.values()))):
+            items, step = sample_items(obj, sample)
+            stack.extend((item, owner, weight * step) for item in items)
+        else:
+            stack.extend((child, owner, weight) for child in children(obj))
+
+    return {owner: [round(instances), round(size)] for owner, (instances, size) in sizes.items()}
+
+def memory_of_structures(book) -> dict[str, int]:
+    """
+    Returns bytes of book structures without the records, e.g. the data dict and indexes.
+    Keys of dicts are counted, as record names are stored in them.
+    """
+    records = {id(record) for record in book.data.values()}
+    return {
+        f"{type(book).__name__}.{name}": sum(size for _, size in memory_by_owner(value, records, name, 0).values())
+        for name, value in vars(book).items()
+    }
+
+def tracemalloc_top(limit: int = 10, sample: int = 100_000) -> list[str]:
+    """
+    Returns top allocation sites since tracing started, empty list if tracemalloc isn't tracing.
+    Of more than sample traces only sample evenly spaced traces are grouped and their sizes are extrapolated.
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    # sampled traces are grouped here, as Snapshot.statistics() creates objects for each trace,
+    # which takes minutes for millions of traced objects of a large book
+    traces = tracemalloc.take_snapshot().traces
+    step = max(1, len(traces) // sample)
+    sizes, counts = Counter(), Counter()
+    for trace in traces[::step]:
+        # the most recent frame is the allocation site
+        frame = trace.traceback[-1]
+        sizes[frame.filename, frame.lineno] += trace.size
+        counts[frame.filename, frame.lineno] += 1
+
+    result = []
+    for (filename, lineno), size in sizes.most_common():
+        if filename == tracemalloc.__file__ or filename.startswith("<frozen importlib._bootstrap"):
+            continue
+        count = counts[filename, lineno]
+        result.append(f"{filename}:{lineno}: size={size * step / 1024:.1f} KiB, count={count * step}, average={size // count} B")
+        if len(result) == limit:
+            break
+    return result
@@ -0,0 +1,84 @@
+import json
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from threading import Lock, local
+
+# returned instead of a timer when metrics are disabled, so disabled metrics cost one attribute check
+NO_TIMER = nullcontext()
+
+class Metrics:
+    """
+    Records wall time, CPU time and net change of allocated memory blocks of commands and time of their phases.
+    Phases are timed by the dispatcher, models and rendering aren't wrapped, so disabled metrics cost nothing there.
+    Records are kept in a ring buffer of given size and optionally appended to JSON Lines file.
+    """
+    def __init__(self, size: int = 1000):
+        self.enabled = False
+        self.records = deque(maxlen=size)
+        self.current = local()
+        self.file = None
+        self.file_lock = Lock()
+
+    def enable(self, filename: str = None) -> None:
+        """ Starts recording, records are also appended to filename if given """
+        self.enabled = True
+        if filename:
+            self.file = open(filename, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        """ Stops recording and closes metrics file """
+        self.enabled = False
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def command(self, name: str):
+        """ Returns context manager measuring command """
+        return self.__measure_command(name) if self.enabled else NO_TIMER
+
+    def phase(self, name: str):
+        """ Returns context manager measuring phase of current command """
+        return self.__measure_phase(name) if self.enabled and getattr(self.current, "phases", None) is not None else NO_TIMER
+
+    @contextmanager
+    def __measure_command(self, name: str):
+        # a command run by another one, e.g. by 'profile', has its own phases, the outer command gets its own back after it
+        outer_phases = getattr(self.current, "phases", None)
+        self.current.phases = phases = {}
+        started = time.time()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        blocks = sys.getallocatedblocks()
+        try:
+            yield
+        finally:
+            record = {
+                "command": name,
+                "started": started,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.thread_time() - cpu,
+                # blocks allocated and not freed by all threads, exact when commands don't overlap
+                "net_blocks": sys.getallocatedblocks() - blocks,
+                "phases": phases,
+            }
+            self.current.phases = outer_phases
+            self.records.append(record)
+            if self.file:
+                with self.file_lock:
+                    self.file.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def __measure_phase(self, name: str):
+        phases = self.current.phases
+        # nested phases are counted by the outer one only
+        self.current.phases = None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+            self.current.phases = phases
+
+metrics = Metrics()
@@ -0,0 +1,16 @@
+import gc
+from contextlib import contextmanager
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses cyclic garbage collector in the block, e.g. while loading or changing many records,
+    so it doesn't repeatedly walk objects allocated so far. It's resumed only if it was enabled.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
@@ -0,0 +1,8 @@
+import math
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """ Returns percentile of sorted values using nearest-rank method, 0 for empty list """
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
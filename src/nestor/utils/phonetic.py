@@ -0,0 +1,308 @@
+from functools import lru_cache
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+# names repeat a lot in big books, so codes of words are cached
+@lru_cache(maxsize=65536)
+def soundex(word: str) -> str:
+    """ Returns American Soundex code of the word, e.g. 'R163' for 'Robert' and 'Rupert', empty string if it has no letters """
+    letters = [char for char in word.lower() if "a" <= char <= "z"]
+    if not letters:
+        return ""
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'h' and 'w' don't separate letters with the same code, vowels do
+        if char not in "hw":
+            previous = digit
+
+    return code.ljust(4, "0")
+
+VOWELS = "AEIOUY"
+
+@lru_cache(maxsize=65536)
+def double_metaphone(word: str) -> tuple[str, str]:
+    """
+    Returns primary and alternate Double Metaphone codes of the word, e.g. ('SM0', 'XMT') for 'Smith' and 'Smyth'.
+    Alternate code is the primary one if the word has a single pronunciation, codes are empty if it has no letters.
+    """
+    letters = "".join(char for char in word.upper() if "A" <= char <= "Z")
+    if not letters:
+        return "", ""
+    last = len(letters) - 1
+    # padding spares checks of the word end, rules look a few letters ahead
+    word = letters + "     "
+    primary, alternate = [], []
+
+    def add(main: str, other: str = None) -> None:
+        primary.append(main)
+        alternate.append(main if other is None else other)
+
+    def at(start: int, length: int, *options: str) -> bool:
+        return start >= 0 and word[start:start + length] in options
+
+    def is_vowel(index: int) -> bool:
+        return 0 <= index <= last and word[index] in VOWELS
+
+    slavo_germanic = any(part in letters for part in ("W", "K", "CZ", "WITZ"))
+    index = 0
+    if at(0, 2, "GN", "KN", "PN", "WR", "PS"):
+        index = 1
+    elif word[0] == "X":
+        add("S")
+        index = 1
+
+    while index <= last:
+        char = word[index]
+        next_char = word[index + 1]
+        step = 1
+        if char in VOWELS:
+            if index == 0:
+                add("A")
+        elif char in "BFKNQV":
+            add({"B": "P", "F": "F", "K": "K", "N": "N", "Q": "K", "V": "F"}[char])
+            step = 2 if next_char == char else 1
+        elif char == "C":
+            step = double_metaphone_c(word, index, add, at, is_vowel)
+        elif char == "D":
+            if at(index, 2, "DG"):
+                if at(index + 2, 1, "I", "E", "Y"):
+                    add("J")
+                    step = 3
+                else:
+                    add("TK")
+                    step = 2
+            else:
+                add("T")
+                step = 2 if at(index, 2, "DT", "DD") else 1
+        elif char == "G":
+            step = double_metaphone_g(word, index, add, at, is_vowel, slavo_germanic)
+        elif char == "H":
+            if (index == 0 or is_vowel(index - 1)) and is_vowel(index + 1):
+                add("H")
+                step = 2
+        elif char == "J":
+            if at(index, 4, "JOSE") or at(0, 4, "SAN "):
+                if (index == 0 and word[index + 4] == " ") or at(0, 4, "SAN "):
+                    add("H")
+                else:
+                    add("J", "H")
+            else:
+                if index == 0:
+                    add("J", "A")
+                elif is_vowel(index - 1) and not slavo_germanic and next_char in "AO":
+                    add("J", "H")
+                elif index == last:
+                    add("J", "")
+                elif not at(index + 1, 1, "L", "T", "K", "S", "N", "M", "B", "Z") and not at(index - 1, 1, "S", "K", "L"):
+                    add("J")
+                step = 2 if next_char == "J" else 1
+        elif char == "L":
+            if next_char == "L":
+                step = 2
+                if (index == last - 2 and at(index - 1, 4, "ILLO", "ILLA", "ALLE")) or \
+                        ((at(last - 1, 2, "AS", "OS") or at(last, 1, "A", "O")) and at(index - 1, 4, "ALLE")):
+                    add("L", "")
+                else:
+                    add("L")
+            else:
+                add("L")
+        elif char == "M":
+            add("M")
+            if (at(index - 1, 3, "UMB") and (index + 1 == last or at(index + 2, 2, "ER"))) or next_char == "M":
+                step = 2
+        elif char == "P":
+            if next_char == "H":
+                add("F")
+                step = 2
+            else:
+                add("P")
+                step = 2 if next_char in "PB" else 1
+        elif char == "R":
+            if index == last and not slavo_germanic and at(index - 2, 2, "IE") and not at(index - 4, 2, "ME", "MA"):
+                add("", "R")
+            else:
+                add("R")
+            step = 2 if next_char == "R" else 1
+        elif char == "S":
+            step = double_metaphone_s(word, index, last, add, at, is_vowel, slavo_germanic)
+        elif char == "T":
+            if at(index, 4, "TION") or at(index, 3, "TIA", "TCH"):
+                add("X")
+                step = 3
+            elif at(index, 2, "TH") or at(index, 3, "TTH"):
+                if at(index + 2, 2, "OM", "AM") or at(0, 4, "VAN ", "VON ") or at(0, 3, "SCH"):
+                    add("T")
+                else:
+                    add("0", "T")
+                step = 2
+            else:
+                add("T")
+                step = 2 if at(index + 1, 1, "T", "D") else 1
+        elif char == "W":
+            if at(index, 2, "WR"):
+                add("R")
+                step = 2
+            else:
+                if index == 0 and (is_vowel(index + 1) or at(index, 2, "WH")):
+                    add("A", "F") if is_vowel(index + 1) else add("A")
+                if (index == last and is_vowel(index - 1)) or at(index - 1, 5, "EWSKI", "EWSKY", "OWSKI", "OWSKY") or at(0, 3, "SCH"):
+                    add("", "F")
+                elif at(index, 4, "WICZ", "WITZ"):
+                    add("TS", "FX")
+                    step = 4
+        elif char == "X":
+            if not (index == last and (at(index - 3, 3, "IAU", "EAU") or at(index - 2, 2, "AU", "OU"))):
+                add("KS")
+            step = 2 if at(index + 1, 1, "C", "X") else 1
+        elif char == "Z":
+            if next_char == "H":
+                add("J")
+                step = 2
+            else:
+                if at(index + 1, 2, "ZO", "ZI", "ZA") or (slavo_germanic and index > 0 and word[index - 1] != "T"):
+                    add("S", "TS")
+                else:
+                    add("S")
+                step = 2 if next_char == "Z" else 1
+        index += step
+
+    return "".join(primary)[:4], "".join(alternate)[:4]
+
+def double_metaphone_c(word: str, index: int, add, at, is_vowel) -> int:
+    """ Adds codes of 'C' at the index, returns number of letters it takes """
+    if index > 1 and not is_vowel(index - 2) and at(index - 1, 3, "ACH") and \
+            word[index + 2] != "I" and (word[index + 2] != "E" or at(index - 2, 6, "BACHER", "MACHER")):
+        add("K")
+        return 2
+    if index == 0 and at(index, 6, "CAESAR"):
+        add("S")
+        return 2
+    if at(index, 4, "CHIA"):
+        add("K")
+        return 2
+    if at(index, 2, "CH"):
+        if index > 0 and at(index, 4, "CHAE"):
+            add("K", "X")
+        elif index == 0 and (at(index + 1, 5, "HARAC", "HARIS") or at(index + 1, 3, "HOR", "HYM", "HIA", "HEM")) and not at(0, 5, "CHORE"):
+            add("K")
+        elif at(0, 4, "VAN ", "VON ") or at(0, 3, "SCH") or at(index - 2, 6, "ORCHES", "ARCHIT", "ORCHID") or at(index + 2, 1, "T", "S") or \
+                ((at(index - 1, 1, "A", "O", "U", "E") or index == 0) and at(index + 2, 1, "L", "R", "N", "M", "B", "H", "F", "V", "W", " ")):
+            add("K")
+        elif index > 0:
+            add("K") if at(0, 2, "MC") else add("X", "K")
+        else:
+            add("X")
+        return 2
+    if at(index, 2, "CZ") and not at(index - 2, 4, "WICZ"):
+        add("S", "X")
+        return 2
+    if at(index + 1, 3, "CIA"):
+        add("X")
+        return 3
+    if at(index, 2, "CC") and not (index == 1 and word[0] == "M"):
+        if at(index + 2, 1, "I", "E", "H") and not at(index + 2, 2, "HU"):
+            add("KS") if (index == 1 and word[0] == "A") or at(index - 1, 5, "UCCEE", "UCCES") else add("X")
+            return 3
+        add("K")
+        return 2
+    if at(index, 2, "CK", "CG", "CQ"):
+        add("K")
+        return 2
+    if at(index, 2, "CI", "CE", "CY"):
+        add("S", "X") if at(index, 3, "CIO", "CIE", "CIA") else add("S")
+        return 2
+    add("K")
+    return 2 if at(index + 1, 1, "C", "K", "Q") and not at(index + 1, 2, "CE", "CI") else 1
+
+def double_metaphone_g(word: str, index: int, add, at, is_vowel, slavo_germanic: bool) -> int:
+    """ Adds codes of 'G' at the index, returns number of letters it takes """
+    next_char = word[index + 1]
+    if next_char == "H":
+        if index > 0 and not is_vowel(index - 1):
+            add("K")
+        elif index == 0:
+            add("J") if word[index + 2] == "I" else add("K")
+        elif (index > 1 and at(index - 2, 1, "B", "H", "D")) or (index > 2 and at(index - 3, 1, "B", "H", "D")) or (index > 3 and at(index - 4, 1, "B", "H")):
+            pass
+        elif index > 2 and word[index - 1] == "U" and at(index - 3, 1, "C", "G", "L", "R", "T"):
+            add("F")
+        elif word[index - 1] != "I":
+            add("K")
+        return 2
+    if next_char == "N":
+        if index == 1 and is_vowel(0) and not slavo_germanic:
+            add("KN", "N")
+        elif not at(index + 2, 2, "EY") and not slavo_germanic:
+            add("N", "KN")
+        else:
+            add("KN")
+        return 2
+    if at(index + 1, 2, "LI") and not slavo_germanic:
+        add("KL", "L")
+        return 2
+    if index == 0 and (next_char == "Y" or at(index + 1, 2, "ES", "EP", "EB", "EL", "EY", "IB", "IL", "IN", "IE", "EI", "ER")):
+        add("K", "J")
+        return 2
+    if (at(index + 1, 2, "ER") or next_char == "Y") and not at(0, 6, "DANGER", "RANGER", "MANGER") and \
+            not at(index - 1, 1, "E", "I") and not at(index - 1, 3, "RGY", "OGY"):
+        add("K", "J")
+        return 2
+    if at(index + 1, 1, "E", "I", "Y") or at(index - 1, 4, "AGGI", "OGGI"):
+        if at(0, 4, "VAN ", "VON ") or at(0, 3, "SCH") or at(index + 1, 2, "ET"):
+            add("K")
+        elif at(index + 1, 4, "IER "):
+            add("J")
+        else:
+            add("J", "K")
+        return 2
+    add("K")
+    return 2 if next_char == "G" else 1
+
+def double_metaphone_s(word: str, index: int, last: int, add, at, is_vowel, slavo_germanic: bool) -> int:
+    """ Adds codes of 'S' at the index, returns number of letters it takes """
+    if at(index - 1, 3, "ISL", "YSL"):
+        return 1
+    if index == 0 and at(index, 5, "SUGAR"):
+        add("X", "S")
+        return 1
+    if at(index, 2, "SH"):
+        add("S") if at(index + 1, 4, "HEIM", "HOEK", "HOLM", "HOLZ") else add("X")
+        return 2
+    if at(index, 3, "SIO", "SIA") or at(index, 4, "SIAN"):
+        add("S") if slavo_germanic else add("S", "X")
+        return 3
+    if (index == 0 and at(index + 1, 1, "M", "N", "L", "W")) or at(index + 1, 1, "Z"):
+        add("S", "X")
+        return 2 if at(index + 1, 1, "Z") else 1
+    if at(index, 2, "SC"):
+        if word[index + 2] == "H":
+            if at(index + 3, 2, "OO", "ER", "EN", "UY", "ED", "EM"):
+                add("X", "SK") if at(index + 3, 2, "ER", "EN") else add("SK")
+            elif index == 0 and not is_vowel(3) and word[3] != "W":
+                add("X", "S")
+            else:
+                add("X")
+        elif at(index + 2, 1, "I", "E", "Y"):
+            add("S")
+        else:
+            add("SK")
+        return 3
+    if index == last and at(index - 2, 2, "AI", "OI"):
+        add("", "S")
+    else:
+        add("S")
+    return 2 if at(index + 1, 1, "S", "Z") else 1
@@ -0,0 +1,21 @@
+import cProfile
+import io
+import pstats
+from typing import Callable
+
+def profile_call(func: Callable, *args, top: int = 25) -> str:
+    """
+    Runs function under cProfile and returns report of top functions by cumulative time.
+    Only calls made in current thread are profiled.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        func(*args)
+    finally:
+        profiler.disable()
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return stream.getvalue().strip()
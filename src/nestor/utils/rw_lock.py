@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+class ReadWriteLock:
+    """
+    Lock that allows many readers or one writer.
+    Waiting writers block new readers, so writes are not starved by a stream of reads.
+    """
+    def __init__(self):
+        self.condition = Condition(Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """ Holds the lock for reading """
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Holds the lock for writing """
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
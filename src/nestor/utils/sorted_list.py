@@ -0,0 +1,126 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable, Iterator
+
+class SortedList:
+    """
+    List of values kept sorted, split into chunks like leaves of a B-tree.
+    Adding or removing a value moves at most one chunk, chunks are found by binary search of their last values.
+    Positions are found in a Fenwick tree of sizes of chunks, in O(log n / CHUNK_SIZE) steps;
+    the tree is updated in place when a value is added or removed and rebuilt when chunks are split or dropped.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, values: Iterable = ()):
+        values = sorted(values)
+        self.chunks = [values[start:start + self.CHUNK_SIZE] for start in range(0, len(values), self.CHUNK_SIZE)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.size = len(values)
+        self.__rebuild_sizes()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator:
+        for chunk in self.chunks:
+            yield from chunk
+
+    def add(self, value) -> None:
+        if not self.chunks:
+            self.chunks.append([value])
+            self.maxes.append(value)
+            self.size = 1
+            self.__rebuild_sizes()
+            return
+
+        index = min(bisect_left(self.maxes, value), len(self.chunks) - 1)
+        chunk = self.chunks[index]
+        insort(chunk, value)
+        self.maxes[index] = chunk[-1]
+        self.size += 1
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            self.chunks[index:index + 1] = [chunk[:self.CHUNK_SIZE], chunk[self.CHUNK_SIZE:]]
+            self.maxes[index:index + 1] = [chunk[self.CHUNK_SIZE - 1], chunk[-1]]
+            self.__rebuild_sizes()
+        else:
+            self.__resize(index, 1)
+
+    def remove(self, value) -> None:
+        """ Removes the value, raises ValueError if it's not in the list """
+        index = bisect_left(self.maxes, value)
+        chunk = self.chunks[index] if index < len(self.chunks) else []
+        position = bisect_left(chunk, value)
+        if position == len(chunk) or chunk[position] != value:
+            raise ValueError(f"{value!r} is not in list")
+
+        del chunk[position]
+        self.size -= 1
+        if chunk:
+            self.maxes[index] = chunk[-1]
+            self.__resize(index, -1)
+        else:
+            del self.chunks[index]
+            del self.maxes[index]
+            self.__rebuild_sizes()
+
+    def __rebuild_sizes(self) -> None:
+        # sizes[i] is the total size of chunks from i - (i & -i) to i - 1, sizes[0] is unused
+        sizes = [0] + [len(chunk) for chunk in self.chunks]
+        for i in range(1, len(sizes)):
+            parent = i + (i & -i)
+            if parent < len(sizes):
+                sizes[parent] += sizes[i]
+        self.sizes = sizes
+
+    def __resize(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i < len(self.sizes):
+            self.sizes[i] += delta
+            i += i & -i
+
+    def __position(self, index: int, position: int) -> int:
+        """ Returns position in the list of the given position in chunk at index """
+        i = index
+        while i:
+            position += self.sizes[i]
+            i -= i & -i
+        return position
+
+    def __locate(self, position: int) -> tuple[int, int]:
+        """ Returns index of chunk with the given position and position in that chunk """
+        index = 0
+        step = 1 << (len(self.sizes) - 1).bit_length()
+        while step:
+            i = index + step
+            if i < len(self.sizes) and self.sizes[i] <= position:
+                index = i
+                position -= self.sizes[i]
+            step >>= 1
+        return index, position
+
+    def bisect_left(self, value) -> int:
+        """ Returns position of the first value which is not less than the given one """
+        index = bisect_left(self.maxes, value)
+        if index == len(self.chunks):
+            return self.size
+        return self.__position(index, bisect_left(self.chunks[index], value))
+
+    def bisect_right(self, value) -> int:
+        """ Returns position of the first value which is greater than the given one """
+        index = bisect_right(self.maxes, value)
+        if index == len(self.chunks):
+            return self.size
+        return self.__position(index, bisect_right(self.chunks[index], value))
+
+    def islice(self, start: int, stop: int) -> Iterator:
+        """ Returns values from start to stop positions, chunk of start is found without walking chunks before it """
+        if start >= stop:
+            return
+        index, start = self.__locate(start)
+        stop -= self.__position(index, 0)
+        for index in range(index, len(self.chunks)):
+            chunk = self.chunks[index]
+            if stop <= 0:
+                return
+            yield from chunk[start:stop]
+            start = 0
+            stop -= len(chunk)
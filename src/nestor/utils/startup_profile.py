@@ -0,0 +1,90 @@
+import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+PHASE_MARKER = "nestor-startup-phase:"
+
+# Code executed in a child interpreter started with -X importtime.
+# Phase markers are written to stderr, so import lines can be grouped by the phase that triggered them.
+PROBE = f"""
+import sys, time, json
+timings = {{}}
+def phase(name):
+    print("{PHASE_MARKER}" + name, file=sys.stderr, flush=True)
+phase("modules")
+start = time.perf_counter()
+import nestor.__main__
+from nestor.services.serializer import Serializer
+timings["modules"] = time.perf_counter() - start
+phase("storage")
+start = time.perf_counter()
+Serializer(sys.argv[1]).load_data()
+timings["storage"] = time.perf_counter() - start
+phase("terminal")
+start = time.perf_counter()
+import nestor.services.repl
+from nestor.services.ui import CommandLineInterface
+CommandLineInterface()
+timings["terminal"] = time.perf_counter() - start
+phase("first use")
+start = time.perf_counter()
+from nestor.services.colorizer import Colorizer
+from nestor.utils.csv_as_table import csv_as_table
+Colorizer.info("")
+csv_as_table("a;b")
+timings["first use"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+def parse_import_times(stderr: str) -> dict[str, list[tuple[str, int]]]:
+    """
+    Parses -X importtime output into top level imports and their direct imports per phase.
+    Returns dict of phase name to list of (module, cumulative microseconds).
+    """
+    phases = defaultdict(list)
+    phase = "interpreter"
+    for line in stderr.splitlines():
+        if line.startswith(PHASE_MARKER):
+            phase = line[len(PHASE_MARKER):]
+            continue
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level, deeper levels are skipped
+        if module.startswith("     "):
+            continue
+        phases[phase].append((module.rstrip()[1:], int(cumulative)))
+    return phases
+
+def startup_profile(filename: str, top: int = 5) -> tuple[str, float]:
+    """
+    Runs the startup path in a child interpreter and returns report text and total startup time in ms.
+    Time spent on first use of lazily imported modules is reported, but not counted in startup time.
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, filename],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    wall_time = (time.perf_counter() - started) * 1000
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_import_times(result.stderr)
+
+    lines = []
+    startup_ms = 0.0
+    for phase, seconds in timings.items():
+        ms = seconds * 1000
+        if phase != "first use":
+            startup_ms += ms
+        lines.append(f"{phase:<12} {ms:>9.1f} ms")
+        modules = sorted(imports.get(phase, []), key=lambda item: item[1], reverse=True)
+        for module, us in modules[:top]:
+            lines.append(f"  {module:<45} {us / 1000:>9.1f} ms")
+
+    lines.append(f"{'startup':<12} {startup_ms:>9.1f} ms (excluding first use)")
+    lines.append(f"{'process':<12} {wall_time:>9.1f} ms (including interpreter start)")
+    return "\n".join(lines), startup_ms
@@ -0,0 +1,15 @@
+from difflib import SequenceMatcher
+
+def make_delta(new: str, old: str) -> list[tuple[int, int] | str]:
+    """ Returns delta that turns new text into old one, ranges of new text to copy and old text to insert """
+    delta = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, new, old, autojunk=False).get_opcodes():
+        if tag == "equal":
+            delta.append((i1, i2))
+        elif j2 > j1:
+            delta.append(old[j1:j2])
+    return delta
+
+def apply_delta(new: str, delta: list[tuple[int, int] | str]) -> str:
+    """ Returns old text from new one and their delta """
+    return "".join(new[item[0]:item[1]] if isinstance(item, tuple) else item for item in delta)
@@ -1,16 +1,32 @@
-def to_csv(data_list: list) -> str:
+from nestor.utils.cancellation import raise_if_cancelled
+
+def fields_of(record) -> dict:
+    return record if isinstance(record, dict) else record.__dict__
+
+def to_rows(data_list: list) -> tuple[list[str], list[list[str]]]:
     """
-    Converts list to CSV format
-    contacts: list[Contact] - list of contacts
+    Returns names of attributes and rows of their values as strings, lists are joined with commas
+    data_list: list - records of the same class, or dicts with the same keys
     """
-    header = ";".join(data_list[0].__dict__.keys())
+    headers = list(fields_of(data_list[0]).keys())
     rows = []
-    for contact in data_list:
+    for index, record in enumerate(data_list):
+        # long lists are rendered by cancellable commands
+        if index % 1000 == 0:
+            raise_if_cancelled()
         row = []
-        for value in contact.__dict__.values():
+        for value in fields_of(record).values():
             if isinstance(value, list):
                 row.append(",".join([str(item) for item in value]))
             else:
                 row.append(str(value) if value else "")
-        rows.append(";".join(row))
-    return header + "\n" + "\n".join(rows)
+        rows.append(row)
+    return headers, rows
+
+def to_csv(data_list: list) -> str:
+    """
+    Converts list to CSV format
+    contacts: list[Contact] - list of contacts
+    """
+    headers, rows = to_rows(data_list)
+    return ";".join(headers) + "\n" + "\n".join(";".join(row) for row in rows)
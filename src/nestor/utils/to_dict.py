@@ -0,0 +1,20 @@
+from datetime import date
+
+from nestor.models.contacts_book import Field
+
+def to_dict(value):
+    """
+    Converts record to JSON compatible value
+    Fields are converted to their values, dates to ISO format, objects to dicts of their public attributes
+    """
+    if isinstance(value, Field):
+        value = value.value
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [to_dict(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_dict(item) for key, item in value.items()}
+    return {key: to_dict(item) for key, item in value.__dict__.items() if not key.startswith("_")}
@@ -0,0 +1,26 @@
+from typing import Callable
+
+class ValuePool:
+    """
+    Shared instances of values repeating across records, e.g. cities of addresses.
+    A value is made by factory on first use and later uses get the same instance,
+    so it's kept once in memory and once per batch of records in the data file, pickle saves repeats as references.
+    Shared values are never changed in place, see Book. They stay in the pool until exit, so pools are for fields with few distinct values.
+    """
+    def __init__(self, factory: Callable[[str], object]):
+        self.factory = factory
+        self.values: dict[str, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, value: str):
+        """ Returns shared instance of the value, errors of factory are raised for invalid values """
+        item = self.values.get(value)
+        if item is None:
+            item = self.values[value] = self.factory(value)
+        return item
+
+    def share(self, value: str, item):
+        """ Returns instance of the value in the pool, the given item becomes one if the value is new, e.g. it's loaded from data file """
+        return self.values.setdefault(value, item)
@@ -0,0 +1,58 @@
+from nestor.services.indexes import FieldIndex
+
+def tags_of(record) -> list[str]:
+    return record["tags"]
+
+def make_index() -> FieldIndex:
+    index = FieldIndex("tags", tags_of)
+    index.build({"a": {"tags": ["red", "green"]}, "b": {"tags": ["green", "green"]}, "c": {"tags": []}})
+    return index
+
+def test_build():
+    index = make_index()
+    assert index.sorted_values == ["green", "red"]
+    assert index.lookup("green") == {"a", "b"}
+    assert index.lookup("blue") == set()
+    # repeated values of a record are indexed once
+    assert index.size == 3
+
+def test_update_adds_changes_and_removes_values():
+    index = make_index()
+    index.update("c", {"tags": ["blue"]})
+    index.update("a", {"tags": ["red", "grey"]})
+    index.update("b", None)
+
+    assert index.sorted_values == ["blue", "grey", "red"]
+    assert index.postings == {"blue": {"c"}, "grey": {"a"}, "red": {"a"}}
+    assert index.record_values == {"a": ("red", "grey"), "c": ("blue",)}
+    assert index.size == 3
+
+def test_update_without_changes_keeps_index():
+    index = make_index()
+    index.update("a", {"tags": ["red", "green"]})
+    index.update("missing", None)
+    assert index.sorted_values == ["green", "red"]
+    assert index.lookup("red") == {"a"}
+    assert index.size == 3
+
+def test_update_matches_rebuilt_index():
+    index = make_index()
+    records = {"a": {"tags": ["red", "green"]}, "b": {"tags": ["green"]}, "c": {"tags": []}}
+    for key, tags in [("d", ["gold", "green"]), ("a", []), ("b", ["gold"]), ("d", ["red"]), ("e", ["green"])]:
+        records[key] = {"tags": tags}
+        index.update(key, records[key])
+
+    rebuilt = FieldIndex("tags", tags_of)
+    rebuilt.build(records)
+    assert index.postings == rebuilt.postings
+    assert index.sorted_values == rebuilt.sorted_values
+    assert index.size == rebuilt.size
+
+def test_prefix_lookup_and_estimates():
+    index = FieldIndex("phone", tags_of)
+    index.build({"a": {"tags": ["0671", "0672"]}, "b": {"tags": ["0671"]}, "c": {"tags": ["0501"]}})
+    assert index.lookup_prefix("067") == {"a", "b"}
+    assert index.lookup_prefix("09") == set()
+    assert index.estimate("0671") == 2
+    # 2 of 3 values with 4 entries in total
+    assert index.estimate_prefix("067") == 3
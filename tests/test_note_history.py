@@ -0,0 +1,124 @@
+import pytest
+
+import gc
+
+from nestor.models.notes_book import Content, LargeContent, Note, NoteHistory, NotesBook
+from nestor.services.operation_log import OperationLog
+from nestor.services.serializer import Storage
+from nestor.utils.text_delta import apply_delta, make_delta
+
+@pytest.mark.parametrize("new, old", [
+    ("", ""),
+    ("same text", "same text"),
+    ("new text", ""),
+    ("", "old text"),
+    ("apple pie with cream", "apple pie"),
+    ("first line\nsecond line\n", "first line\nchanged line\nthird line\n"),
+    ("Привіт, світе", "Привіт, друже"),
+])
+def test_delta_turns_new_text_into_old_one(new, old):
+    assert apply_delta(new, make_delta(new, old)) == old
+
+def test_delta_copies_common_text():
+    new, old = "a" * 1000 + "tail", "a" * 1000 + "end"
+    delta = make_delta(new, old)
+    assert (0, 1000) in delta
+    assert sum(len(item) for item in delta if isinstance(item, str)) < 10
+
+def versions_of(count: int) -> list[str | None]:
+    """ Returns contents of note versions, some repeat the previous one and some are empty """
+    versions = []
+    for number in range(count):
+        if number % 7 == 3:
+            versions.append(versions[-1])
+        elif number % 11 == 5:
+            versions.append(None)
+        else:
+            versions.append(f"Recipe {number}\n" + "flour, sugar, eggs\n" * (number % 4 + 1))
+    return versions
+
+def content(text: str | None) -> Content | None:
+    return Content(text) if text else None
+
+def test_content_at_rebuilds_every_version():
+    versions = versions_of(35)
+    history = NoteHistory()
+    # each version is replaced by the next one, the last one is the current content
+    for number, text in enumerate(versions[:-1]):
+        history.add(f"Title {number}", [], content(text), content(versions[number + 1]))
+
+    current = content(versions[-1])
+    assert [revision.number for revision in history.revisions] == list(range(1, 35))
+    assert any(revision.keyframe for revision in history.revisions)
+    for index, text in enumerate(versions[:-1]):
+        rebuilt = history.content_at(index, current)
+        assert (rebuilt.value if rebuilt else None) == text
+
+def test_oldest_revisions_are_dropped():
+    history = NoteHistory()
+    texts = [f"version {number}" for number in range(NoteHistory.MAX_REVISIONS + 11)]
+    for number, text in enumerate(texts[:-1]):
+        history.add("Title", [], Content(text), Content(texts[number + 1]))
+
+    assert len(history.revisions) == NoteHistory.MAX_REVISIONS
+    assert history.revisions[0].number == 11
+    assert history.find(11) == 0
+    assert history.find(1) is None
+    assert history.content_at(0, Content(texts[-1])).value == "version 10"
+
+def test_notes_book_keeps_versions_of_edits_and_renames():
+    book = NotesBook()
+    book.add(Note("Pie", "flour", ["food"]))
+    with book.edit("Pie") as note:
+        note.edit_content("flour, sugar")
+    book.rename("Pie", "Apple pie")
+    with book.edit("Apple pie") as note:
+        note.edit_content("flour, sugar, apples")
+
+    history = book.get_history("Apple pie")
+    assert book.get_history("Pie") is None
+    assert [revision.title for revision in history.revisions] == ["Pie", "Pie", "Apple pie"]
+    current = book.data["Apple pie"].content
+    assert [history.content_at(index, current).value for index in range(len(history.revisions))] == ["flour", "flour, sugar", "flour, sugar"]
+
+def test_deleted_note_takes_its_versions_until_the_delete_is_undone():
+    storage = Storage()
+    book = storage.notes_book
+    log = OperationLog(storage)
+    with log.command("add-note"):
+        book.add(Note("Pie", "flour"))
+    with log.command("edit-note"):
+        with book.edit("Pie") as note:
+            note.edit_content("flour, sugar")
+    with log.command("delete-note"):
+        book.delete("Pie")
+    assert book.get_history("Pie") is None
+
+    assert log.undo() == "delete-note"
+    history = book.get_history("Pie")
+    assert history.content_at(0, book.data["Pie"].content).value == "flour"
+
+    # redo deletes it again, a new note with the same title starts without versions
+    assert log.redo() == "delete-note"
+    book.add(Note("Pie", "apples"))
+    assert book.get_history("Pie") is None
+
+def test_versions_of_deleted_note_are_dropped_with_its_undo():
+    book = NotesBook()
+    book.add(Note("Pie", "flour"))
+    book.add(Note("Minutes", "short"))
+    large = LargeContent([(0, 10)], 10, "long text")
+    with book.edit("Minutes") as note:
+        note.set_large_content(large)
+    book.rename("Minutes", "Agenda")
+    with book.edit("Agenda") as note:
+        note.edit_content("shorter")
+    assert [revision.title for revision in book.get_history("Agenda").revisions] == ["Minutes", "Minutes", "Agenda"]
+    assert large in book.large_contents()
+
+    # nothing can add the note back, its versions and their large contents are gone
+    book.delete("Agenda")
+    gc.collect()
+    assert book.get_history("Agenda") is None
+    assert len(book.deleted_history) == 0
+    assert large not in book.large_contents()
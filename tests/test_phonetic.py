@@ -0,0 +1,39 @@
+import pytest
+
+from nestor.utils.phonetic import double_metaphone, soundex
+
+@pytest.mark.parametrize("word, codes", [
+    ("Smith", ("SM0", "XMT")),
+    ("Smyth", ("SM0", "XMT")),
+    ("Schmidt", ("XMT", "SMT")),
+    ("Katherine", ("K0RN", "KTRN")),
+    ("Xavier", ("SF", "SFR")),
+    ("Jon", ("JN", "AN")),
+    ("John", ("JN", "AN")),
+    ("Philip", ("FLP", "FLP")),
+    ("Jose", ("HS", "HS")),
+    ("Caesar", ("SSR", "SSR")),
+    ("Dumb", ("TM", "TM")),
+    ("Knight", ("NT", "NT")),
+    ("Aubrey", ("APR", "APR")),
+])
+def test_double_metaphone(word, codes):
+    assert double_metaphone(word) == codes
+
+def test_double_metaphone_ignores_case_and_other_symbols():
+    assert double_metaphone("sMiTh!") == double_metaphone("Smith")
+    assert double_metaphone("") == ("", "")
+    assert double_metaphone("Олена") == ("", "")
+
+@pytest.mark.parametrize("word, code", [
+    ("Robert", "R163"),
+    ("Rupert", "R163"),
+    ("Ashcraft", "A261"),
+    ("Tymczak", "T522"),
+    ("Pfister", "P236"),
+    ("Honeyman", "H555"),
+    ("Lee", "L000"),
+    ("", ""),
+])
+def test_soundex(word, code):
+    assert soundex(word) == code
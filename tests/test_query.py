@@ -0,0 +1,129 @@
+import re
+
+import pytest
+
+from nestor.models.contacts_book import Contact, ContactsBook
+from nestor.services.indexes import ContactIndexes
+from nestor.services.query import And, Filter, FullScan, IndexLookup, Not, Or, Parser, Term, Union, plan_query, run_query
+
+def make_book() -> ContactsBook:
+    book = ContactsBook()
+    for name, phone, email, birthday in [
+        ("John Smith", "0671234567", "john@gmail.com", "15.03.1990"),
+        ("Jon Doe", "0501112233", None, "01.03.1985"),
+        ("Anna Lee", "0672223344", "anna@ukr.net", "29.02.1992"),
+        ("Mary Jones", "0939998877", "mary@gmail.com", None),
+    ]:
+        book.add(Contact(name, [phone], email, birthday))
+    return book
+
+def names(contacts: list[Contact]) -> list[str]:
+    return [contact.name.value for contact in contacts]
+
+def test_parser_precedence():
+    query = Parser(["name:~jo", "OR", "NOT", "email:", "AND", "phone:067*"]).parse()
+    assert isinstance(query, Or)
+    assert isinstance(query.children[1], And)
+    assert isinstance(query.children[1].children[0], Not)
+    assert str(query) == "name:~jo OR NOT email: AND phone:067*"
+
+def test_parser_joins_conditions_without_operator_and_parentheses():
+    query = Parser(["(name:~jo", "OR", "name:~an)", "birthday:03"]).parse()
+    assert isinstance(query, And)
+    assert isinstance(query.children[0], Or)
+    assert str(query) == "(name:~jo OR name:~an) AND birthday:03"
+
+@pytest.mark.parametrize("args, message", [
+    ([], "Query is empty"),
+    (["(name:x"], "Missing ')'"),
+    (["name:x", "AND"], "Query ends unexpectedly"),
+    (["name:x)"], "Unexpected ')'"),
+    (["nick:x"], "Unknown field 'nick'"),
+    (["name"], "Invalid condition 'name'"),
+])
+def test_parser_errors(args, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        Parser(args).parse()
+
+@pytest.mark.parametrize("text", ["13", "00", "31.02", "30.02", "32.01", "29.02.2023", "3"])
+def test_impossible_birthdays_are_rejected(text):
+    with pytest.raises(ValueError):
+        Term("birthday", text)
+
+def test_leap_day_is_accepted():
+    assert Term("birthday", "29.02").birthday_parts == [29, 2]
+
+def test_term_matches():
+    book = make_book()
+    john = book.data["John Smith"]
+    assert Term("name", "JOHN SMITH").matches(john)
+    assert Term("name", "~smi").matches(john)
+    assert Term("phone", "067*").matches(john)
+    assert Term("email", "").matches(book.data["Jon Doe"])
+    assert Term("birthday", "03").matches(john)
+    assert not Term("birthday", "1985").matches(john)
+
+def test_planner_uses_cheapest_index_with_residual_filter():
+    book = make_book()
+    plan = plan_query(Parser(["phone:067*", "AND", "email:anna@ukr.net"]).parse(), book)
+    assert isinstance(plan, Filter)
+    assert isinstance(plan.source, IndexLookup)
+    assert plan.source.index.name == "email"
+    assert plan.run(book) == ["Anna Lee"]
+
+def test_planner_unions_indexed_alternatives_and_scans_otherwise():
+    book = make_book()
+    plan = plan_query(Parser(["name:jon doe", "OR", "birthday:03"]).parse(), book)
+    assert isinstance(plan, Union)
+    assert plan.run(book) == {"Jon Doe", "John Smith"}
+
+    plan = plan_query(Parser(["NOT", "name:~o"]).parse(), book)
+    assert isinstance(plan, Filter)
+    assert isinstance(plan.source, FullScan)
+    assert plan.run(book) == ["Anna Lee"]
+
+def test_query_results_match_scan():
+    book = make_book()
+    args = ["(name:~jo", "OR", "phone:067*)", "AND", "NOT", "email:*@gmail.com"]
+    query = Parser(args).parse()
+    contacts, _ = run_query(args, book)
+    assert names(contacts) == sorted(name for name, contact in book.data.items() if query.matches(contact))
+    assert names(contacts) == ["Anna Lee", "Jon Doe"]
+
+def test_indexes_follow_changes_of_the_book():
+    book = make_book()
+    ContactIndexes.get(book).get_index("name")
+    ContactIndexes.get(book).get_index("phone")
+
+    book.rename("John Smith", "Johnny Smith")
+    book.delete("Anna Lee")
+    with book.edit("Jon Doe") as contact:
+        contact.add_phone("0670000000")
+
+    # no keys of renamed or deleted records are left in the indexes
+    assert names(run_query(["name:john smith"], book)[0]) == []
+    assert names(run_query(["name:johnny smith"], book)[0]) == ["Johnny Smith"]
+    assert names(run_query(["phone:067*"], book)[0]) == ["Johnny Smith", "Jon Doe"]
+
+def test_rolled_back_changes_leave_no_keys_in_indexes():
+    book = make_book()
+    ContactIndexes.get(book).get_index("name")
+
+    with pytest.raises(RuntimeError):
+        with book.transaction():
+            book.add(Contact("Temporary Person"))
+            book.rename("Mary Jones", "Mary Smith")
+            assert names(run_query(["name:~smith"], book)[0]) == ["John Smith", "Mary Smith"]
+            raise RuntimeError("rollback")
+
+    assert names(run_query(["name:~smith"], book)[0]) == ["John Smith"]
+    assert names(run_query(["name:~temporary"], book)[0]) == []
+    assert names(run_query(["name:mary jones"], book)[0]) == ["Mary Jones"]
+
+@pytest.mark.parametrize("args", [["name:~jo"], ["birthday:1990"], ["phone:*67"], ["email:"]])
+def test_conditions_without_index_lookup_build_no_index(args):
+    book = make_book()
+    plan = plan_query(Parser(args).parse(), book)
+    assert isinstance(plan, Filter)
+    assert isinstance(plan.source, FullScan)
+    assert ContactIndexes.get(book).indexes == {}
@@ -0,0 +1,194 @@
+import os
+import pickle
+
+import pytest
+
+from nestor.models.contacts_book import Contact
+from nestor.models.notes_book import LargeContent, Note
+from nestor.services.merge import CHANGED, ONLY_FIRST, ONLY_SECOND, SAME_BATCH, SECOND, diff_files, merge_files
+from nestor.services.chunk_store import ChunkStore
+from nestor.services.scan import scan
+from nestor.services.serializer import DataFile, Serializer, Storage, chunks_filename
+
+def make_storage(count: int = 3000) -> Storage:
+    storage = Storage()
+    for number in range(count):
+        storage.contacts_book.add(Contact(f"Person {number:05}", [f"067{number:07}"]))
+    contact = Contact("Anna Lee", ["0501112233"], "anna@ukr.net", "29.02.1992")
+    contact.add_address("Main 1", "Kyiv", "Kyiv", "01001", "Ukraine")
+    storage.contacts_book.add(contact)
+
+    storage.notes_book.add(Note("Pie", "flour", ["food", "recipe"]))
+    with storage.notes_book.edit("Pie") as note:
+        note.edit_content("flour, sugar")
+    return storage
+
+def serializer_of(storage: Storage, path, name: str = "data") -> Serializer:
+    """ Returns serializer of a new data file, large notes of the storage are kept in its chunk file """
+    serializer = Serializer(str(path / name))
+    storage.notes_book.store = ChunkStore(chunks_filename(serializer.filename, 0))
+    return serializer
+
+def saved(storage: Storage, path, name: str = "data") -> Serializer:
+    serializer = serializer_of(storage, path, name)
+    serializer.save_data(storage)
+    return serializer
+
+def add_large_note(storage: Storage, title: str, text: str) -> None:
+    note = Note(title)
+    note.set_large_content(LargeContent.write(storage.notes_book.store, [text[:len(text) // 2], text[len(text) // 2:]]))
+    storage.notes_book.add(note)
+
+def test_round_trip(tmp_path):
+    storage = make_storage()
+    serializer = saved(storage, tmp_path)
+    add_large_note(storage, "Minutes", "long text " * 100)
+    # records added later come last in the book, not in order of keys
+    storage.contacts_book.add(Contact("Aaron First"))
+    serializer.save_data(storage)
+    assert not os.path.exists(f"{serializer.filename}.tmp")
+
+    loaded = serializer.load_data()
+    assert list(loaded.contacts_book.data) == list(storage.contacts_book.data)
+    assert list(loaded.notes_book.data) == list(storage.notes_book.data)
+    assert str(loaded.contacts_book.data["Anna Lee"]) == str(storage.contacts_book.data["Anna Lee"])
+    assert loaded.notes_book.data["Pie"].tags == ["food", "recipe"]
+    assert loaded.notes_book.get_history("Pie").content_at(0, loaded.notes_book.data["Pie"].content).value == "flour"
+    large = loaded.notes_book.data["Minutes"].content
+    assert "".join(loaded.notes_book.store.read(large.refs)) == "long text " * 100
+
+    # session state isn't saved
+    assert loaded.contacts_book.pending is None
+    assert loaded.contacts_book.caches == {}
+
+def test_saving_the_same_records_gives_the_same_file(tmp_path, monkeypatch):
+    # revisions of notes keep the second they were saved at
+    monkeypatch.setattr("time.time", lambda: 1700000000.0)
+    first, second = saved(make_storage(), tmp_path, "first"), saved(make_storage(), tmp_path, "second")
+    with open(first.filename, "rb") as f, open(second.filename, "rb") as g:
+        assert f.read() == g.read()
+
+def test_legacy_pickle_is_loaded(tmp_path):
+    storage = make_storage(10)
+    for book in storage.get_books():
+        book.listeners.clear()
+    with open(tmp_path / "data.pkl", "wb") as f:
+        pickle.dump(storage, f)
+
+    loaded = Serializer(str(tmp_path / "data")).load_data()
+    assert list(loaded.contacts_book.data) == list(storage.contacts_book.data)
+    assert loaded.notes_book.data["Pie"].content.value == "flour, sugar"
+    assert [batch.count for batch in DataFile(str(tmp_path / "data.pkl")).batches("contacts")] == [11]
+
+def test_diff_of_legacy_and_batched_files(tmp_path):
+    storage = make_storage(10)
+    with open(tmp_path / "legacy.pkl", "wb") as f:
+        pickle.dump(storage, f)
+    storage.contacts_book.delete("Person 00003")
+    storage.contacts_book.add(Contact("Zed New"))
+    saved(storage, tmp_path)
+
+    differences = [item for item in diff_files(str(tmp_path / "legacy.pkl"), str(tmp_path / "data.pkl")) if item[1] != SAME_BATCH]
+    assert differences == [("contacts", ONLY_FIRST, "Person 00003", []), ("contacts", ONLY_SECOND, "Zed New", [])]
+
+def test_diff_skips_same_batches(tmp_path):
+    first = make_storage()
+    saved(first, tmp_path, "first")
+    second = make_storage()
+    second.contacts_book.delete("Person 01500")
+    with second.contacts_book.edit("Anna Lee") as contact:
+        contact.set_email("anna@gmail.com")
+    second.contacts_book.add(Contact("Zed New"))
+    saved(second, tmp_path, "second")
+
+    differences = list(diff_files(str(tmp_path / "first.pkl"), str(tmp_path / "second.pkl")))
+    assert [item for item in differences if item[1] != SAME_BATCH] == [
+        ("contacts", CHANGED, "Anna Lee", ["email"]),
+        ("contacts", ONLY_FIRST, "Person 01500", []),
+        ("contacts", ONLY_SECOND, "Zed New", []),
+    ]
+    same_batches, batches = next(item[3] for item in differences if item[:2] == ("contacts", SAME_BATCH))
+    # changes are in the first, a middle and the last batch
+    assert batches > 3
+    assert same_batches == batches - 3
+
+def test_merge(tmp_path):
+    first = make_storage(100)
+    saved(first, tmp_path, "first")
+    second = make_storage(100)
+    with second.contacts_book.edit("Anna Lee") as contact:
+        contact.add_phone("0679999999")
+        contact.set_email("anna@gmail.com")
+    with second.contacts_book.edit("Person 00001") as contact:
+        contact.set_birthday("01.01.1990")
+    second.contacts_book.add(Contact("Zed New"))
+    serializer_of(second, tmp_path, "second")
+    add_large_note(second, "Minutes", "long text " * 100)
+    saved(second, tmp_path, "second")
+
+    changes = merge_files(str(tmp_path / "first.pkl"), str(tmp_path / "second.pkl"), prefer=SECOND)
+    assert sorted(changes) == [
+        ("contacts", CHANGED, "Anna Lee", ["email"]),
+        ("contacts", CHANGED, "Person 00001", []),
+        ("contacts", ONLY_SECOND, "Zed New", []),
+        ("notes", ONLY_SECOND, "Minutes", []),
+    ]
+    assert not os.path.exists(tmp_path / "first.pkl.merge")
+
+    merged = Serializer(str(tmp_path / "first")).load_data()
+    anna = merged.contacts_book.data["Anna Lee"]
+    assert [phone.value for phone in anna.phones] == ["0501112233", "0679999999"]
+    assert anna.email.value == "anna@gmail.com"
+    assert str(merged.contacts_book.data["Person 00001"].birthday) == "01.01.1990"
+    # records added from the second file come last
+    assert list(merged.contacts_book.data)[-1] == "Zed New"
+    # large content is copied to the chunk file of the first data file
+    large = merged.notes_book.data["Minutes"].content
+    assert "".join(merged.notes_book.store.read(large.refs)) == "long text " * 100
+    assert list(diff_files(str(tmp_path / "first.pkl"), str(tmp_path / "first.pkl")))[0][1] == SAME_BATCH
+
+def test_compaction_keeps_contents_of_live_notes(tmp_path):
+    storage = make_storage(10)
+    serializer = saved(storage, tmp_path)
+    add_large_note(storage, "Kept", "kept text " * 100)
+    # chunks of rolled back notes are left in the file
+    with pytest.raises(RuntimeError):
+        with storage.notes_book.transaction():
+            for number in range(10):
+                add_large_note(storage, f"Old {number}", f"old text {number} " * 100)
+            raise RuntimeError("rollback")
+    serializer.save_data(storage, compact=True)
+
+    assert storage.notes_book.chunks_generation == 1
+    assert not os.path.exists(tmp_path / "data.chunks")
+    loaded = serializer.load_data()
+    assert loaded.notes_book.store.filename == str(tmp_path / "data.1.chunks")
+    content = loaded.notes_book.data["Kept"].content
+    assert "".join(loaded.notes_book.store.read(content.refs)) == "kept text " * 100
+
+def test_scan_of_large_notes_reads_their_chunks(tmp_path):
+    storage = make_storage(10)
+    serializer_of(storage, tmp_path)
+    # 'needle' is split between chunks and is far from the preview
+    add_large_note(storage, "Minutes", "long text " * 100 + "nee" + "dle" + " long text" * 100)
+    add_large_note(storage, "Agenda", "other text " * 200)
+    book = storage.notes_book
+
+    def titles(*conditions: str) -> list[str]:
+        return [note.title.value for note in scan(book, list(conditions))]
+
+    assert titles("content~needle") == [note.title.value for note in book.search("needle")] == ["Minutes"]
+    assert titles("content!~needle") == ["Pie", "Agenda"]
+    assert titles("content~NEEDLE", "title~min") == ["Minutes"]
+    assert titles("content=" + "other text " * 200) == ["Agenda"]
+    book.delete("Minutes")
+    assert titles("content~needle") == []
+
+@pytest.mark.parametrize("count", [0, 1, 2500])
+def test_batches_cover_all_records_in_order_of_keys(tmp_path, count):
+    storage = make_storage(count)
+    saved(storage, tmp_path)
+    data_file = DataFile(str(tmp_path / "data.pkl"))
+    keys = [key for batch in data_file.batches("contacts") for key, _ in batch.read()]
+    assert keys == sorted(storage.contacts_book.data)
+    assert list(data_file.order("contacts")) == list(storage.contacts_book.data)
@@ -0,0 +1,71 @@
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+
+from nestor.utils.sorted_list import SortedList
+
+class SmallChunksList(SortedList):
+    # chunks are split and dropped after a few values
+    CHUNK_SIZE = 4
+
+def test_empty_list():
+    values = SortedList()
+    assert len(values) == 0
+    assert values.bisect_left(1) == 0
+    assert values.bisect_right(1) == 0
+    assert list(values.islice(0, 10)) == []
+    with pytest.raises(ValueError):
+        values.remove(1)
+
+def test_add_keeps_values_sorted():
+    values = SmallChunksList([5, 1, 3])
+    for value in [4, 2, 0, 6, 3, 3, 9, 8, 7]:
+        values.add(value)
+    assert list(values) == [0, 1, 2, 3, 3, 3, 4, 5, 6, 7, 8, 9]
+    assert len(values) == 12
+    assert all(len(chunk) <= 2 * SmallChunksList.CHUNK_SIZE for chunk in values.chunks)
+    assert values.maxes == [chunk[-1] for chunk in values.chunks]
+
+def test_remove():
+    values = SmallChunksList(range(10))
+    values.remove(0)
+    values.remove(9)
+    values.remove(5)
+    assert list(values) == [1, 2, 3, 4, 6, 7, 8]
+    with pytest.raises(ValueError):
+        values.remove(5)
+    with pytest.raises(ValueError):
+        values.remove(100)
+
+def test_bisect_and_islice_match_plain_list():
+    generator = random.Random(42)
+    values, expected = SmallChunksList(), []
+    for _ in range(2000):
+        value = generator.randrange(100)
+        if expected and generator.random() < 0.4:
+            value = generator.choice(expected)
+            values.remove(value)
+            expected.remove(value)
+        else:
+            values.add(value)
+            expected.append(value)
+            expected.sort()
+
+    assert list(values) == expected
+    assert len(values) == len(expected)
+    for value in range(-1, 102):
+        assert values.bisect_left(value) == bisect_left(expected, value)
+        assert values.bisect_right(value) == bisect_right(expected, value)
+    for start, stop in [(0, 5), (3, 17), (10, 10), (len(expected) - 3, len(expected) + 5)]:
+        assert list(values.islice(start, stop)) == expected[start:stop]
+    # positions are kept in sizes of chunks, every start falls into the right chunk
+    for start in range(len(expected) + 1):
+        assert list(values.islice(start, start + 6)) == expected[start:start + 6]
+
+def test_tuple_entries_of_sorted_views():
+    # entries are ((is missing, value), key), a bound of the same shape ends before or after all keys of a value
+    values = SortedList([((False, "b"), "B"), ((True,), "x"), ((False, "a"), "A1"), ((False, "a"), "A2")])
+    assert values.bisect_left(((False, "a"),)) == 0
+    assert values.bisect_right(((False, "a"), "\U0010ffff")) == 2
+    assert values.bisect_left(((True,),)) == 3
@@ -0,0 +1,137 @@
+import pytest
+
+from nestor.models.contacts_book import Contact, ContactsBook
+from nestor.models.notes_book import Note, NotesBook
+from nestor.models.operation import Operation, changed_keys
+from nestor.services.operation_log import OperationLog
+from nestor.services.serializer import Storage
+from nestor.services.sorted_views import SortedView
+
+class Recorder:
+    """ Listener keeping lists of changes it got """
+    def __init__(self, book: ContactsBook):
+        self.calls: list[list[tuple[Operation, Operation]]] = []
+        book.listeners.append(self.calls.append)
+
+    def actions(self) -> list[list[tuple[str, str]]]:
+        return [[(operation.action, operation.key) for operation, _ in changes] for changes in self.calls]
+
+def make_book(*names: str) -> ContactsBook:
+    book = ContactsBook()
+    for name in names:
+        book.add(Contact(name))
+    return book
+
+def test_listeners_get_changes_as_they_are_applied():
+    book = make_book("Ann")
+    recorder = Recorder(book)
+    with book.transaction():
+        book.add(Contact("Bob"))
+        assert recorder.actions() == [[("add", "Bob")]]
+        book.rename("Ann", "Anna")
+    assert recorder.actions() == [[("add", "Bob")], [("rename", "Ann")]]
+    assert list(changed_keys(recorder.calls[1])) == ["Ann", "Anna"]
+    assert not book.in_transaction()
+
+def test_rollback_sends_inverses_of_reverted_changes():
+    book = make_book("Ann")
+    recorder = Recorder(book)
+    book.begin()
+    book.add(Contact("Bob"))
+    book.rename("Ann", "Anna")
+    sent = [change for changes in recorder.calls for change in changes]
+    book.rollback()
+
+    assert list(book.data) == ["Ann"]
+    assert recorder.actions()[-1] == [("rename", "Anna"), ("delete", "Bob")]
+    # the inverses are the same objects which were sent with the changes, starting from the last one
+    assert [operation for operation, _ in recorder.calls[-1]] == [inverse for _, inverse in reversed(sent)]
+    with pytest.raises(RuntimeError):
+        book.rollback()
+
+def test_inner_rollback_reverts_to_its_savepoint():
+    book = make_book("Ann")
+    with book.transaction():
+        book.add(Contact("Bob"))
+        with pytest.raises(ValueError):
+            with book.transaction():
+                book.add(Contact("Cid"))
+                book.delete("Ann")
+                raise ValueError("inner")
+        assert sorted(book.data) == ["Ann", "Bob"]
+        assert book.in_transaction()
+        book.add(Contact("Dan"))
+    assert sorted(book.data) == ["Ann", "Bob", "Dan"]
+    assert not book.in_transaction()
+
+def test_edit_many_sends_changes_in_one_list():
+    book = make_book("Ann", "Bob", "Cid")
+    recorder = Recorder(book)
+    changed = book.edit_many(["Ann", "Cid"], lambda contact: contact.set_email(f"{contact.name.value.lower()}@ukr.net"))
+    assert changed == 2
+    assert recorder.actions() == [[("edit", "Ann"), ("edit", "Cid")]]
+
+    def fail_on_bob(contact):
+        contact.set_email("x@ukr.net")
+        if contact.name.value == "Bob":
+            raise ValueError("Bob")
+
+    with pytest.raises(ValueError):
+        book.edit_many(["Ann", "Bob"], fail_on_bob)
+    assert book.data["Ann"].email.value == "ann@ukr.net"
+    assert book.data["Bob"].email is None
+
+def test_sorted_view_follows_transaction():
+    book = make_book("Cid", "Ann")
+    view = SortedView.get(book, "name")
+    with pytest.raises(RuntimeError):
+        with book.transaction():
+            book.add(Contact("Bob"))
+            book.rename("Cid", "Abe")
+            assert view.keys(*view.range()) == ["Abe", "Ann", "Bob"]
+            raise RuntimeError("rollback")
+    assert view.keys(*view.range()) == ["Ann", "Cid"]
+
+def test_transaction_is_one_undo_entry_and_rollback_leaves_none():
+    storage = Storage()
+    log = OperationLog(storage)
+    storage.begin()
+    with log.command("add-contact"):
+        storage.contacts_book.add(Contact("Ann"))
+    with log.command("add-contact"):
+        storage.contacts_book.add(Contact("Bob"))
+    with log.command("commit"):
+        storage.commit()
+    assert [entry.command for entry in log.undo_entries] == ["commit"]
+    assert len(log.undo_entries[0].operations) == 2
+
+    storage.begin()
+    with log.command("delete-contact"):
+        storage.contacts_book.delete("Ann")
+    with log.command("rollback"):
+        storage.rollback()
+    assert [entry.command for entry in log.undo_entries] == ["commit"]
+    assert sorted(storage.contacts_book.data) == ["Ann", "Bob"]
+
+    assert log.undo() == "commit"
+    assert storage.contacts_book.data == {}
+    assert log.redo() == "commit"
+    assert sorted(storage.contacts_book.data) == ["Ann", "Bob"]
+
+def test_rollback_takes_back_versions_of_the_transaction():
+    book = NotesBook()
+    book.add(Note("Pie", "flour"))
+    with book.edit("Pie") as note:
+        note.edit_content("flour, sugar")
+
+    with pytest.raises(RuntimeError):
+        with book.transaction():
+            with book.edit("Pie") as note:
+                note.edit_content("flour, sugar, apples")
+            book.rename("Pie", "Apple pie")
+            raise RuntimeError("rollback")
+
+    history = book.get_history("Pie")
+    assert book.get_history("Apple pie") is None
+    assert book.data["Pie"].content.value == "flour, sugar"
+    assert [history.content_at(index, book.data["Pie"].content).value for index in range(len(history.revisions))] == ["flour"]